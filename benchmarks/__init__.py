@@ -0,0 +1 @@
+# benchmarks for the grade calculator, see benchmarks/run.py
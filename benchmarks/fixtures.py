@@ -0,0 +1,142 @@
+"""
+Synthetic progress pages for the benchmarks.
+
+The pages follow the layout the parsers expect from circuits.mit.edu
+and py.mit.edu, with a configurable number of rows per category, so
+the benchmarks can run without tokens or network access. Recorded
+pages can be used instead (see load_corpus).
+
+Run as a script to write a corpus to a directory:
+    python -m benchmarks.fixtures --out corpus/ --rows 10 100 1000
+"""
+
+from typing import Optional
+import argparse
+import os
+import random
+
+CHECK, CROSS = '✓', '✘'
+
+def circuits_page(rows: int = 10, seed: int = 0, final: bool = False) -> bytes:
+    """
+    Returns the body of a 6.200 progress page with `rows` psets, labs,
+    nanoquizzes and participation entries.
+    """
+    r = random.Random(seed)
+    out = ['<!DOCTYPE html>',
+           '<html><head><title>6.200 Progress</title>',
+           '<style>h2 { color: #a31f34; }</style>',
+           '<script>var header = "<h1>not a header</h1>";</script>',
+           '</head><body>',
+           '<div class="nav">Home | Calendar | Progress</div>',
+           '<h1>Progress for student &amp; friends</h1>',
+           '<p>Scores below are updated as assignments are graded. <!-- cache --></p>',
+           f'<h2>Midterm: {r.randint(20, 50)}.0/50.0</h2>']
+    if final:
+        out.append(f'<h2>Final: {r.randint(40, 100)}.0/100.0</h2>')
+    out.append('<h2>Problem Sets</h2>')
+    out.append('<ul>')
+    for i in range(1, rows + 1):
+        out.append(f'<li>PSet {i}: {r.randint(0, 20) / 2}/10.0</li>')
+    out.append('</ul>')
+    out.append('<h2>Labs</h2>')
+    out.append('<table>')
+    for i in range(1, rows + 1):
+        out.append(f'<tr><td>Lab {i}: </td><td>Total: {r.randint(0, 10)}.0/10.0</td></tr>')
+    out.append('</table>')
+    out.append('<h2>Nanoquizzes</h2>')
+    out.append('<table>')
+    for i in range(1, rows + 1):
+        out.append(f'<tr><td>nanoquiz {i}: </td><td> {r.randint(0, 100)}.0%</td></tr>')
+    out.append('</table>')
+    out.append('<h2>Participation</h2>')
+    out.append('<ul>')
+    for i in range(1, rows + 1):
+        mark = CHECK if r.random() < 0.8 else CROSS
+        out.append(f'<li>Lecture {i} {mark}</li>')
+    out.append('</ul>')
+    out.append('<p>Last updated &lt;today&gt; &copy; MIT</p>')
+    out.append('</body></html>')
+    return '\n'.join(out).encode('utf-8')
+
+def py_page(rows: int = 10, seed: int = 0, exams: bool = True) -> bytes:
+    """
+    Returns the body of a 6.101 progress page with `rows` labs,
+    readings and recitations.
+    """
+    r = random.Random(seed)
+    out = ['<!DOCTYPE html>',
+           '<html><head><title>6.101 Progress</title>',
+           '<style>', 'li { margin: 0; }', '</style>',
+           '</head><body>',
+           '<h1>6.101 Progress</h1>',
+           '<p>participation will count for 20.0% of your grade</p>',
+           '<p>midterm will count for 25.0% of your grade</p>',
+           '<p>final will count for 25.0% of your grade</p>',
+           '<p>lab will count for 30.0% of your grade</p>']
+    if exams:
+        out.append(f'<h2>Midterm Exam: {r.randint(50, 100)}.0/100.0</h2>')
+    out.append('<h2>Labs</h2>')
+    out.append('<ul>')
+    for i in range(1, rows + 1):
+        out.append(f'<li>Lab {i} overall score: {r.randint(50, 100)}.0/100.0</li>')
+    out.append('</ul>')
+    out.append('<h2>Readings</h2>')
+    out.append('<ul>')
+    for i in range(1, rows + 1):
+        out.append(f'<li>Reading {i} ({r.randint(0, 100)}.0%)</li>')
+    out.append('</ul>')
+    out.append('<h2>Recitation Attendance</h2>')
+    out.append('<ul>')
+    for i in range(1, rows + 1):
+        mark = '*' if r.random() < 0.2 else '+'
+        out.append(f'<li>Monday, Week {i} {mark}</li>')
+    out.append('</ul>')
+    out.append('</body></html>')
+    return '\n'.join(out).encode('utf-8')
+
+generators = {'6.200': circuits_page,
+              '6.101': py_page}
+
+def synthetic_corpus(rows: int = 10, pages_per_class: int = 1) -> dict[str, list[bytes]]:
+    """
+    Returns a dictionary mapping class codes to page bodies.
+    """
+    return {class_code: [generate(rows, seed) for seed in range(pages_per_class)]
+            for class_code, generate in generators.items()}
+
+def load_corpus(directory: str) -> dict[str, list[bytes]]:
+    """
+    Loads recorded pages from a directory. Files are named
+    `<class code>_<anything>.html` and hold the raw response body.
+    """
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.html') or '_' not in name:
+            continue
+        class_code = name.split('_')[0]
+        with open(os.path.join(directory, name), 'rb') as f:
+            corpus.setdefault(class_code, []).append(f.read())
+    return corpus
+
+def write_corpus(directory: str, rows: list[int], pages_per_class: int = 1) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for count in rows:
+        for class_code, pages in synthetic_corpus(count, pages_per_class).items():
+            for seed, page in enumerate(pages):
+                path = os.path.join(directory, f"{class_code}_rows{count}_{seed}.html")
+                with open(path, 'wb') as f:
+                    f.write(page)
+
+def main(argv: Optional[list[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('--out', required=True, help="directory to write to")
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[10],
+                            help="rows per category, one corpus page per value")
+    arg_parser.add_argument('--pages', type=int, default=1,
+                            help="pages per class and row count")
+    args = arg_parser.parse_args(argv)
+    write_corpus(args.out, args.rows, args.pages)
+
+if __name__ == "__main__":
+    main()
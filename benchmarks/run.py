@@ -0,0 +1,228 @@
+"""
+Benchmarks for each stage of the grade calculator.
+
+Times and measures the peak memory of preprocess_data, parse_html,
+calculate_score and generate_full_report separately, plus a full
+report_all against a local stand-in for the CAT-SOOP servers. Pages
+come from a recorded corpus (see benchmarks/fixtures.py) or are
+generated with a given number of rows per category.
+
+    python -m benchmarks.run                          # 10, 100, 1000 rows
+    python -m benchmarks.run --rows 5000 --repeat 3
+    python -m benchmarks.run --corpus pages/
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+"""
+
+from catsoop_grade_calculator import ScoreCalculator
+from catsoop_grade_calculator.parsers import CatsoopRequests
+from catsoop_grade_calculator.parsers.scheduler import RequestScheduler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from contextlib import contextmanager
+from typing import Callable, Optional
+from urllib.parse import urlsplit, parse_qs
+from . import fixtures
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+def measure(func: Callable, repeat: int) -> dict:
+    """
+    Runs func repeat times and returns the median and minimum wall
+    time in seconds, plus the peak memory allocated during one more
+    run (measured separately, since tracing slows everything down).
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'median': statistics.median(times),
+            'min': min(times),
+            'peak_bytes': peak}
+
+def bench_stages(class_code: str, pages: list[bytes], repeat: int) -> dict[str, dict]:
+    """
+    Benchmarks each stage on every page of one class. Each stage gets
+    the output of the previous one, computed ahead of time.
+    """
+    calc = ScoreCalculator({})
+    parser = calc.get_parser(class_code)
+    # requests decodes text/html without a charset as latin-1
+    texts = [page.decode('latin-1') for page in pages]
+    preprocessed = [CatsoopRequests.preprocess_data(text) for text in texts]
+    score_data = [parser.parse_html(lines) for lines in preprocessed]
+    out_scores = [parser.calculate_score(data) for data in score_data]
+
+    stages = {
+        'preprocess_data': lambda: [CatsoopRequests.preprocess_data(text)
+                                    for text in texts],
+        'parse_html': lambda: [parser.parse_html(lines) for lines in preprocessed],
+        'calculate_score': lambda: [parser.calculate_score(data) for data in score_data],
+        'generate_full_report': lambda: [calc.generate_full_report(class_code, out_score)
+                                         for out_score in out_scores],
+    }
+    return {stage: measure(func, repeat) for stage, func in stages.items()}
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    """
+    Serves /<class code>/progress?api_token=<n> with page n of the
+    class, like a CAT-SOOP host would.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes; without this,
+    # delayed acks add ~40ms to every response on keep-alive sockets
+    disable_nagle_algorithm = True
+    corpus = {}
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        class_code = parts.path.strip('/').split('/')[0]
+        pages = self.corpus.get(class_code)
+        if not pages:
+            self.send_error(404)
+            return
+        token = parse_qs(parts.query).get('api_token', ['0'])[0]
+        body = pages[int(token) % len(pages)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@contextmanager
+def local_server(corpus: dict[str, list[bytes]]):
+    """
+    Starts a local server for the corpus and points
+    CatsoopRequests.base_urls at it for the duration, without rate
+    limits (they would be all the benchmark measures).
+    """
+    handler = type('Handler', (CorpusHandler,), {'corpus': corpus})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    old_urls = dict(CatsoopRequests.base_urls)
+    old_scheduler = CatsoopRequests.scheduler
+    CatsoopRequests.scheduler = RequestScheduler(
+            rate=1e9, burst=1e9, initial_concurrency=CatsoopRequests.pool_size,
+            max_concurrency=CatsoopRequests.pool_size)
+    host, port = server.server_address
+    for class_code in corpus:
+        CatsoopRequests.base_urls[class_code] = f"http://{host}:{port}/{class_code}/progress"
+    try:
+        yield
+    finally:
+        CatsoopRequests.base_urls.clear()
+        CatsoopRequests.base_urls.update(old_urls)
+        CatsoopRequests.scheduler = old_scheduler
+        server.shutdown()
+        server.server_close()
+
+def bench_report_all(corpus: dict[str, list[bytes]], repeat: int) -> dict[str, dict]:
+    """
+    Benchmarks report_all for one student per page index, fetching
+    every class from the local server, sequentially and concurrently.
+    """
+    students = max(len(pages) for pages in corpus.values())
+    calcs = [ScoreCalculator({class_code: str(i) for class_code in corpus})
+             for i in range(students)]
+    results = {}
+    with local_server(corpus):
+        results['report_all'] = measure(
+                lambda: [calc.report_all() for calc in calcs], repeat)
+        results['report_all_concurrent'] = measure(
+                lambda: [calc.report_all(concurrent=True) for calc in calcs], repeat)
+    return results
+
+def run(corpus: dict[str, list[bytes]], label: str, repeat: int) -> dict[str, dict]:
+    """
+    Runs every benchmark on a corpus, returning results keyed by
+    `<label>/<class code>/<stage>` (or `<label>/<stage>` for report_all).
+    """
+    results = {}
+    for class_code, pages in corpus.items():
+        if class_code not in ScoreCalculator.parser_index:
+            continue
+        for stage, result in bench_stages(class_code, pages, repeat).items():
+            results[f"{label}/{class_code}/{stage}"] = result
+    for stage, result in bench_report_all(corpus, repeat).items():
+        results[f"{label}/{stage}"] = result
+    return results
+
+def compare(results: dict[str, dict], baseline: dict[str, dict],
+            tolerance: float) -> list[str]:
+    """
+    Returns the benchmarks whose median time grew by more than
+    tolerance (a fraction) compared to the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {ratio:.2f}x slower")
+    return regressions
+
+def print_results(results: dict[str, dict], baseline: Optional[dict] = None) -> None:
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        line = (f"{name:<{width}}  {1000 * result['median']:10.3f} ms"
+                f"  {result['peak_bytes'] / 1024:10.1f} KiB")
+        if baseline and name in baseline:
+            line += f"  ({result['median'] / baseline[name]['median']:.2f}x baseline)"
+        print(line)
+
+def main(argv: Optional[list[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('--corpus', help="directory of recorded pages")
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000],
+                            help="rows per category for the synthetic pages")
+    arg_parser.add_argument('--pages', type=int, default=4,
+                            help="synthetic pages per class")
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--save', help="write the results to this json file")
+    arg_parser.add_argument('--compare', help="baseline json file to compare against")
+    arg_parser.add_argument('--tolerance', type=float, default=0.1,
+                            help="allowed slowdown before a benchmark counts as "
+                                 "a regression (default 0.1, i.e. 10%%)")
+    args = arg_parser.parse_args(argv)
+
+    results = {}
+    if args.corpus:
+        results.update(run(fixtures.load_corpus(args.corpus), 'corpus', args.repeat))
+    else:
+        for rows in args.rows:
+            corpus = fixtures.synthetic_corpus(rows, args.pages)
+            results.update(run(corpus, f"rows{rows}", args.repeat))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
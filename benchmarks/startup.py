@@ -0,0 +1,128 @@
+"""
+Startup-time benchmark: how long it takes to import the package and
+run the command line entry point, in fresh interpreters.
+
+Each target is run in a new `python -X importtime` process, and the
+import time of the package's modules (cumulative, so including
+whatever they pull in) is read from its report. The wall time of the
+whole process is measured as well.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --top 15      # slowest imports
+    python -m benchmarks.startup --save benchmarks/startup.json
+    python -m benchmarks.startup --compare benchmarks/startup.json
+"""
+
+from typing import Optional
+from .run import compare
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# name -> code run in the fresh interpreter
+targets = {'import': "import catsoop_grade_calculator",
+           'import_calculator': "from catsoop_grade_calculator import ScoreCalculator",
+           'load_parser': "from catsoop_grade_calculator import ScoreCalculator\n"
+                          "ScoreCalculator({}).get_parser('6.200')",
+           'cli_help': "from catsoop_grade_calculator.cli import main\n"
+                       "try: main(['--help'])\n"
+                       "except SystemExit: pass"}
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """
+    Given the report of `python -X importtime`, returns a list of
+    (module, nesting depth, cumulative microseconds), one per import.
+    Depth 0 means the module was imported directly by the code run.
+    """
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), depth, int(cumulative_us)))
+    return times
+
+def package_import_time(import_times: list[tuple[str, int, int]]) -> int:
+    """
+    Returns the total time spent importing the package's modules
+    (and what they import), in microseconds.
+    """
+    return sum(us for module, depth, us in import_times
+               if depth == 0 and module.startswith('catsoop_grade_calculator'))
+
+def run_target(code: str) -> tuple[float, list[tuple[str, int, int]]]:
+    """
+    Runs the code in a fresh interpreter, returning the wall time in
+    seconds and the import times (see parse_importtime).
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, parse_importtime(result.stderr)
+
+def bench_startup(repeat: int) -> tuple[dict[str, dict], list[tuple[str, int, int]]]:
+    """
+    Runs every target repeat times. Returns the results in the same
+    format as benchmarks/run.py (median and min in seconds), along
+    with the import times of the last run.
+    """
+    results = {}
+    last_imports = []
+    for name, code in targets.items():
+        walls, imports = [], []
+        for _ in range(repeat):
+            wall, import_times = run_target(code)
+            walls.append(wall)
+            imports.append(package_import_time(import_times))
+            last_imports = import_times
+        results[f"startup/{name}/wall"] = {'median': statistics.median(walls),
+                                           'min': min(walls)}
+        results[f"startup/{name}/imports"] = {'median': statistics.median(imports) / 1e6,
+                                              'min': min(imports) / 1e6}
+    return results, last_imports
+
+def main(argv: Optional[list[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--top', type=int, default=0,
+                            help="also list the slowest imports of the last target")
+    arg_parser.add_argument('--save', help="write the results to this json file")
+    arg_parser.add_argument('--compare', help="baseline json file to compare against")
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="allowed slowdown before a benchmark counts as "
+                                 "a regression (default 0.2, i.e. 20%%)")
+    args = arg_parser.parse_args(argv)
+
+    results, last_imports = bench_startup(args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        line = f"{name:<{width}}  {1000 * result['median']:10.3f} ms"
+        if baseline and name in baseline:
+            line += f"  ({result['median'] / baseline[name]['median']:.2f}x baseline)"
+        print(line)
+    if args.top:
+        print()
+        slowest = sorted(last_imports, key=lambda item: item[2], reverse=True)
+        for module, depth, us in slowest[:args.top]:
+            print(f"{module:<{width}}  {us / 1000:10.3f} ms")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,31 @@
 # init the directory
+#
+# Submodules are only imported when one of their names is first used,
+# so that `import catsoop_grade_calculator` stays fast.
 
-from .general import ScoreCalculator
+import importlib
+
+lazy_names = {'ScoreCalculator': '.general',
+              'BatchCalculator': '.batch',
+              'PipelineCalculator': '.pipeline',
+              'ResponseCache': '.cache',
+              'ReportWriter': '.report',
+              'HistogramSummary': '.instrument',
+              'JsonLinesExporter': '.instrument',
+              'GradeService': '.daemon',
+              'CohortStats': '.stats',
+              'GradeHistory': '.history',
+              'CheckpointLog': '.checkpoint',
+              'GradeWatcher': '.watch'}
+
+__all__ = list(lazy_names)
+
+def __getattr__(name: str):
+    if name not in lazy_names:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(lazy_names[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_names))
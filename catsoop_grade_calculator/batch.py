@@ -0,0 +1,123 @@
+"""
+Grades many students across many classes in one call.
+"""
+
+from .general import ScoreCalculator
+from .parsers.request import CatsoopRequests
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+import contextlib
+from typing import Iterable, Iterator, Optional
+import threading
+
+class BatchCalculator(ScoreCalculator):
+    """
+    Grades a stream of (student_id, class_code, token) records.
+    One parser is shared by every page of a class, and a failing
+    record is reported in its own result instead of stopping the
+    whole batch.
+    """
+
+    def __init__(self, max_workers: int = 8, max_per_host: int = 4,
+                 timeout: Optional[float] = None, cache=None,
+                 incremental: bool = False, history=None,
+                 checkpoint=None) -> None:
+        """
+        If a GradeHistory is given, every grade is recorded in it
+        under the record's student_id, with its assignments; records
+        without a student_id fail instead of being graded.
+
+        If a CheckpointLog is given, every successful result is
+        logged in it, and records whose (student_id, class_code) it
+        already holds (or, without a student_id, whose class_code and
+        token) aren't graded again: the logged result is
+        returned instead, so an interrupted run can be restarted
+        with the same log and records.
+        """
+        super().__init__({}, cache, incremental)
+        self.history = history
+        self.checkpoint = checkpoint
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.host_limits = {}
+        self.host_limits_lock = threading.Lock()
+
+    def get_host_limit(self, class_code: str) -> threading.BoundedSemaphore:
+        """
+        Returns the semaphore limiting concurrent requests to the
+        host of the class, creating it the first time.
+        """
+        host = CatsoopRequests.get_host(CatsoopRequests.get_url(class_code))
+        with self.host_limits_lock:
+            limit = self.host_limits.get(host)
+            if limit is None:
+                limit = threading.BoundedSemaphore(self.max_per_host)
+                self.host_limits[host] = limit
+        return limit
+
+    def recording(self, student_id: str):
+        """
+        Returns a context in which this thread's calculations are
+        recorded in self.history (if there is one).
+        """
+        if self.history is None:
+            return contextlib.nullcontext()
+        return self.hooked(self.history.recorder(student_id), this_thread=True)
+
+    def grade_one(self, student_id: str, class_code: str, token: str,
+                  debug=False) -> dict:
+        """
+        Grades one record. Returns a dictionary with keys `student_id`,
+        `class_code`, `out_score` (None on failure) and `error` (a
+        description of what went wrong, or None on success).
+        """
+        result = {'student_id': student_id,
+                  'class_code': class_code,
+                  'out_score': None,
+                  'error': None}
+        try:
+            if CatsoopRequests.get_url(class_code) is None:
+                raise NotImplementedError(
+                        "This class doesn't have an implemented grade calculator!")
+            if self.history is not None and not student_id:
+                raise ValueError("Records need a student id to be recorded in the history")
+            with self.get_host_limit(class_code), self.recording(student_id):
+                result['out_score'] = self.calculate_one(
+                        class_code, debug, self.timeout, token)
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        if self.checkpoint is not None:
+            self.checkpoint.record(result, token)
+        return result
+
+    def grade(self, records: Iterable[tuple[str, str, str]],
+              debug=False) -> Iterator[dict]:
+        """
+        Grades every (student_id, class_code, token) record and yields
+        one result per record (see grade_one), in the same order as
+        the records.
+
+        Records are read lazily and at most 2 * max_workers of them
+        are in flight at once, so memory use does not grow with the
+        size of the batch.
+        """
+        window = 2 * self.max_workers
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for student_id, class_code, token in records:
+                done = None
+                if self.checkpoint is not None:
+                    done = self.checkpoint.get(student_id, class_code, token)
+                if done is not None:
+                    # finished by an earlier run; keep it in order with the rest
+                    future = Future()
+                    future.set_result(done)
+                    pending.append(future)
+                else:
+                    pending.append(executor.submit(
+                        self.grade_one, student_id, class_code, token, debug))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
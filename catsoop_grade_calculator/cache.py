@@ -0,0 +1,226 @@
+"""
+On-disk cache of calculated grades, so unchanged progress pages
+don't have to be parsed again.
+"""
+
+from .report import out_score_from_json
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+import time
+
+class ResponseCache():
+    """
+    Remembers, for each (progress page url, token) pair, the validators
+    the server sent with the page (ETag / Last-Modified), a hash of the
+    page body and the out_score calculated from it.
+
+    Tokens are only stored as hashes. Entries older than max_age
+    seconds are dropped, and once there are more than max_entries
+    the ones stored longest ago are evicted (an entry is stored again
+    every time it is used, see refresh).
+
+    Entries are also keyed by a version string, so that results
+    calculated by an older parser (see ScoreCalculator.cache_version)
+    or in an older entry format are never returned.
+    """
+
+    # bump when the layout of an entry changes
+    format_version = 1
+
+    def __init__(self, directory: Optional[str] = None,
+                 max_entries: int = 10000,
+                 max_age: float = 7 * 24 * 3600) -> None:
+        if directory is None: directory = ResponseCache.default_directory()
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self.stores_since_evict = 0
+        # guards stores_since_evict, which every thread storing updates
+        self.lock = threading.Lock()
+        self.evict()
+
+    @staticmethod
+    def default_directory() -> str:
+        """
+        Returns the default cache location, under $XDG_CACHE_HOME
+        (or ~/.cache).
+        """
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(base, 'catsoop_grade_calculator', 'responses')
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def hash_body(body: bytes) -> str:
+        return hashlib.sha256(body).hexdigest()
+
+    def get_path(self, url: str, token: str, version: str = '') -> str:
+        """
+        Returns the file an entry is stored in.
+        """
+        key = hashlib.sha256(f"{ResponseCache.format_version}\n{version}\n"
+                             f"{url}\n{ResponseCache.hash_token(token)}".encode())
+        return os.path.join(self.directory, key.hexdigest() + '.json')
+
+    def load(self, url: str, token: str, version: str = '') -> Optional[dict]:
+        """
+        Returns the cached entry for the page, or None if there is
+        none (or it has expired, or the file isn't a valid entry).
+        """
+        path = self.get_path(url, token, version)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not ResponseCache.is_valid(entry):
+            self.remove(path)
+            return None
+        if time.time() - entry['stored_at'] > self.max_age:
+            self.remove(path)
+            return None
+        return entry
+
+    @staticmethod
+    def is_valid(entry) -> bool:
+        """
+        Checks that a loaded file has everything calculate_cached
+        uses from an entry (it may be cut short, or not ours).
+        """
+        try:
+            out_score_from_json(entry['out_score'])
+            return isinstance(entry['stored_at'], (int, float)) \
+                    and isinstance(entry['body_hash'], str)
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def conditional_headers(entry: Optional[dict]) -> dict[str, str]:
+        """
+        Given a cached entry, returns the headers that let the server
+        answer 304 Not Modified if the page hasn't changed.
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url: str, token: str, body_hash: str, out_score: dict,
+              etag: Optional[str] = None,
+              last_modified: Optional[str] = None,
+              version: str = '') -> None:
+        """
+        Saves the result of parsing a page, along with the validators
+        the server sent for it.
+        """
+        entry = {'url': url,
+                 'token_hash': ResponseCache.hash_token(token),
+                 'etag': etag,
+                 'last_modified': last_modified,
+                 'body_hash': body_hash,
+                 'out_score': out_score,
+                 'stored_at': time.time()}
+        path = self.get_path(url, token, version)
+        # write then rename, so readers never see half an entry
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.stores_since_evict += 1
+            due = self.stores_since_evict >= max(1, self.max_entries // 10)
+            if due:
+                # claimed here, so only this thread evicts for these stores
+                self.stores_since_evict = 0
+        if due:
+            self.evict()
+
+    def store_response(self, url: str, token: str, response, body_hash: str,
+                       out_score: dict, version: str = '') -> None:
+        """
+        Same as store, taking the validators from a Response.
+        """
+        self.store(url, token, body_hash, out_score,
+                   response.headers.get('ETag'),
+                   response.headers.get('Last-Modified'), version)
+
+    def refresh(self, url: str, token: str, entry: dict, response,
+                version: str = '') -> None:
+        """
+        Marks a cached entry as still valid (the page was unchanged),
+        keeping its validators unless the response has new ones.
+        """
+        self.store(url, token, entry['body_hash'], entry['out_score'],
+                   response.headers.get('ETag', entry.get('etag')),
+                   response.headers.get('Last-Modified', entry.get('last_modified')),
+                   version)
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def get_entry_paths(self) -> list[str]:
+        return [os.path.join(self.directory, name)
+                for name in os.listdir(self.directory) if name.endswith('.json')]
+
+    def evict(self) -> None:
+        """
+        Drops expired entries, then the ones stored longest ago
+        until at most max_entries remain.
+        """
+        with self.lock:
+            self.stores_since_evict = 0
+        now = time.time()
+        live = []
+        for path in self.get_entry_paths():
+            try:
+                stored_at = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if now - stored_at > self.max_age:
+                self.remove(path)
+            else:
+                live.append((stored_at, path))
+        if len(live) > self.max_entries:
+            live.sort()
+            for stored_at, path in live[:len(live) - self.max_entries]:
+                self.remove(path)
+
+    def invalidate(self, url: Optional[str] = None, token: Optional[str] = None) -> None:
+        """
+        Removes cached entries. With only one of url and token,
+        removes every entry for that url (or that token); with both,
+        the entries of that page; with neither, clears the cache.
+        """
+        token_hash = None if token is None else ResponseCache.hash_token(token)
+        for path in self.get_entry_paths():
+            if url is None and token is None:
+                self.remove(path)
+                continue
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(entry, dict):
+                continue
+            if url is not None and entry.get('url') != url:
+                continue
+            if token_hash is not None and entry.get('token_hash') != token_hash:
+                continue
+            self.remove(path)
+
+    def clear(self) -> None:
+        self.invalidate()
@@ -0,0 +1,145 @@
+"""
+Append-only log of the grades a batch run has finished, so that a run
+that crashed or was killed can pick up where it stopped.
+"""
+
+from .report import out_score_from_json
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+import time
+
+class CheckpointLog():
+    """
+    Records every successful BatchCalculator result as one line of
+    JSON: {"student_id": ..., "class_code": ..., "out_score": ...}.
+    Opening an existing log reads back the results it holds, and
+    BatchCalculator(checkpoint=...) returns those instead of grading
+    the same (student id, class code) again. Failed results aren't
+    recorded, so they are retried.
+
+    Records without a student id are told apart by a hash of their
+    token instead, saved as "token_hash" (the token itself never is).
+
+    Lines are written right away but only forced to disk (fsync) once
+    sync_every of them have piled up or sync_interval seconds have
+    passed, and on close(); a crash loses at most those. A line cut
+    short by a crash is ignored when the log is read.
+    """
+
+    def __init__(self, path: str, sync_every: int = 100,
+                 sync_interval: float = 1.0) -> None:
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.done = self.load()
+        self.file = open(path, 'a')
+        if self.file.tell() > 0 and not self.ends_with_newline():
+            # finish the line a crash cut short, so the next one is readable
+            self.file.write('\n')
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> 'CheckpointLog':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def key(student_id: Optional[str], class_code: str,
+            token_hash: Optional[str]) -> tuple:
+        """
+        Returns what a result is looked up by: (student id, class
+        code), or (None, class code, token hash) without a student id.
+        """
+        if student_id:
+            return (student_id, class_code)
+        return (None, class_code, token_hash)
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+    def load(self) -> dict[tuple, dict]:
+        """
+        Returns the out_scores in the log, keyed as in key. Lines that
+        can't be read (cut short, or not a logged result) are skipped.
+        """
+        done = {}
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        key = CheckpointLog.key(entry['student_id'], entry['class_code'],
+                                                entry.get('token_hash'))
+                        done[key] = out_score_from_json(entry['out_score'])
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return done
+
+    def ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def get(self, student_id: Optional[str], class_code: str,
+            token: str) -> Optional[dict]:
+        """
+        Returns the recorded result for a student's class, as in
+        BatchCalculator.grade_one, or None if it isn't done yet.
+        """
+        token_hash = None if student_id else CheckpointLog.hash_token(token)
+        with self.lock:
+            out_score = self.done.get(CheckpointLog.key(student_id, class_code, token_hash))
+        if out_score is None:
+            return None
+        return {'student_id': student_id,
+                'class_code': class_code,
+                'out_score': out_score,
+                'error': None}
+
+    def record(self, result: dict, token: str) -> None:
+        """
+        Logs a result of BatchCalculator.grade_one, graded with token.
+        """
+        if result['error'] is not None:
+            return
+        entry = {'student_id': result['student_id'],
+                 'class_code': result['class_code'],
+                 'out_score': result['out_score']}
+        if not entry['student_id']:
+            entry['token_hash'] = CheckpointLog.hash_token(token)
+        key = CheckpointLog.key(entry['student_id'], entry['class_code'],
+                                entry.get('token_hash'))
+        line = json.dumps(entry, separators=(',', ':'))
+        with self.lock:
+            self.done[key] = entry['out_score']
+            self.file.write(line + '\n')
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every \
+                    or time.monotonic() - self.last_sync >= self.sync_interval:
+                self.sync()
+
+    def sync(self) -> None:
+        """
+        Forces the recorded lines to disk. Must be called with the
+        lock held.
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file.closed:
+                return
+            self.sync()
+            self.file.close()
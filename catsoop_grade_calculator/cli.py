@@ -0,0 +1,272 @@
+"""
+Command line entry point: prints a grade report for every class in
+a token file.
+
+    catsoop-grade-calculator                     # reads ./token.txt
+    catsoop-grade-calculator --tokens ~/token.txt --class 6.200
+    python -m catsoop_grade_calculator --concurrent --cache
+    catsoop-grade-calculator --format csv --output grades.csv
+    catsoop-grade-calculator --roster roster.csv --shard 1/4 --format jsonl --output 1.jsonl
+    catsoop-grade-calculator --merge 1.jsonl 2.jsonl 3.jsonl 4.jsonl --output all.jsonl
+    catsoop-grade-calculator --watch --min-interval 120   # see watch.py
+    catsoop-grade-calculator --serve --port 8765   # see daemon.py
+"""
+
+from typing import Optional, TextIO
+import argparse
+import sys
+
+def read_tokens(path: str) -> dict[str, str]:
+    from .roster import read_tokens
+    return read_tokens(path)
+
+def shard(text: str) -> tuple[int, int]:
+    # argparse type for --shard; roster.py is only imported when needed
+    from .roster import parse_shard
+    return parse_shard(text)
+
+def open_output(path: Optional[str]) -> TextIO:
+    return sys.stdout if path is None else open(path, 'w', newline='')
+
+def grade_roster(args, cache) -> int:
+    """
+    Batch mode: grades every record of the roster (or of one shard
+    of it) and writes a report for each.
+    """
+    from collections import deque
+    from .batch import BatchCalculator
+    from .report import ReportWriter
+    from .roster import read_roster, take_shard
+    records = read_roster(args.roster, args.roster_format)
+    if args.shard is not None:
+        selected = take_shard(records, *args.shard)
+    else:
+        selected = enumerate(records)
+    # rows of the records being graded, in order; results come out in
+    # the same order, and are tagged with them so shards can be merged
+    rows = deque()
+    def shard_records():
+        for row, record in selected:
+            rows.append(row)
+            yield record
+
+    history = None
+    if args.history:
+        from .history import GradeHistory
+        history = GradeHistory(args.history)
+    checkpoint = None
+    if args.checkpoint:
+        from .checkpoint import CheckpointLog
+        checkpoint = CheckpointLog(args.checkpoint)
+    batch = BatchCalculator(args.workers or 8, timeout=args.timeout, cache=cache,
+                            history=history, checkpoint=checkpoint)
+    sink = open_output(args.output)
+    try:
+        writer = ReportWriter(sink, args.format)
+        for result in batch.grade(shard_records(), args.debug):
+            result['row'] = rows.popleft()
+            writer.write_result(result)
+    finally:
+        if sink is not sys.stdout: sink.close()
+        if history is not None: history.close()
+        if checkpoint is not None: checkpoint.close()
+    return 0
+
+def watch_tokens(args, tokens: dict[str, str], cache) -> int:
+    """
+    Watch mode: prints each change event as a line of JSON until
+    interrupted.
+    """
+    import json
+    from .watch import GradeWatcher
+    watcher = GradeWatcher(args.min_interval, args.max_interval,
+                           timeout=args.timeout, cache=cache)
+    sink = open_output(args.output)
+    def print_event(event: dict) -> None:
+        sink.write(json.dumps(event) + '\n')
+        sink.flush()
+    watcher.add_listener(print_event)
+    for class_code, token in tokens.items():
+        watcher.watch(args.student, class_code, token)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sink is not sys.stdout: sink.close()
+    return 0
+
+def merge_reports(args) -> int:
+    """
+    Merges the JSON Lines reports of the shards of a roster into one,
+    in roster order.
+    """
+    import contextlib
+    import json
+    from .roster import merge_shards
+    with contextlib.ExitStack() as stack:
+        files = [stack.enter_context(open(path, 'r')) for path in args.merge]
+        sink = open_output(args.output)
+        if sink is not sys.stdout: stack.enter_context(sink)
+        for record in merge_shards(files):
+            sink.write(json.dumps(record) + '\n')
+    return 0
+
+def main(argv: Optional[list[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+            prog='catsoop-grade-calculator',
+            description="Prints a grade report for each class in a token file.")
+    arg_parser.add_argument('--tokens', default='token.txt',
+                            help="file of `<class code> <token>` lines (default token.txt)")
+    arg_parser.add_argument('--class', dest='classes', action='append',
+                            help="only report this class (can be repeated)")
+    arg_parser.add_argument('--concurrent', action='store_true',
+                            help="fetch the progress pages in parallel")
+    arg_parser.add_argument('--timeout', type=float,
+                            help="seconds to wait for each page")
+    arg_parser.add_argument('--discover', action='store_true',
+                            help="find the progress pages of the current term")
+    arg_parser.add_argument('--cache', action='store_true',
+                            help="reuse grades of pages that haven't changed")
+    arg_parser.add_argument('--format', choices=('text', 'jsonl', 'csv'), default='text',
+                            help="report format (default text)")
+    arg_parser.add_argument('--output', metavar='PATH',
+                            help="write the report to this file instead of stdout")
+    arg_parser.add_argument('--debug', action='store_true',
+                            help="print the preprocessed pages")
+    arg_parser.add_argument('--history', metavar='PATH',
+                            help="also record the grades in this SQLite file")
+    arg_parser.add_argument('--student',
+                            help="name to record the grades under (default: your username)")
+    batch = arg_parser.add_argument_group("batch mode")
+    batch.add_argument('--roster', metavar='PATH',
+                       help="grade every (student, class, token) record of this file "
+                            "instead of the token file")
+    batch.add_argument('--roster-format', choices=('space', 'csv', 'jsonl'),
+                       help="format of the roster (default: from its extension)")
+    batch.add_argument('--shard', metavar='I/N', type=shard,
+                       help="only grade shard I of N of the roster (e.g. 2/4)")
+    batch.add_argument('--workers', type=int,
+                       help="pages fetched at once (default 8)")
+    batch.add_argument('--checkpoint', metavar='PATH',
+                       help="log finished records here, and skip the ones already "
+                            "logged (to resume an interrupted run)")
+    batch.add_argument('--merge', metavar='PATH', nargs='+',
+                       help="merge the --format jsonl reports of each shard into one")
+    watching = arg_parser.add_argument_group("watch mode")
+    watching.add_argument('--watch', action='store_true',
+                          help="keep polling the token file's pages and print a JSON line "
+                               "whenever an assignment changes")
+    watching.add_argument('--min-interval', type=float, default=60,
+                          help="seconds between polls of a page that just changed "
+                               "(default 60)")
+    watching.add_argument('--max-interval', type=float, default=3600,
+                          help="longest wait between polls of an unchanged page "
+                               "(default 3600)")
+    serving = arg_parser.add_argument_group("service mode")
+    serving.add_argument('--serve', action='store_true',
+                         help="keep running and answer grade queries over a local JSON API")
+    serving.add_argument('--host', default='127.0.0.1')
+    serving.add_argument('--port', type=int, default=8765)
+    serving.add_argument('--socket', help="listen on this Unix socket instead of a port")
+    serving.add_argument('--auth-token-file', metavar='PATH',
+                         help="where to write the token requests over the port must send "
+                              "(default ~/.cache/catsoop_grade_calculator/service_token)")
+    serving.add_argument('--refresh-interval', type=float, default=900,
+                         help="seconds between background refreshes of each page "
+                              "(0 turns them off; default 900)")
+    args = arg_parser.parse_args(argv)
+    # watch mode labels its events with --student, but records nothing
+    if args.history and (args.watch or args.serve):
+        arg_parser.error(f"--history can't be used with {'--watch' if args.watch else '--serve'}")
+    if args.student and args.serve:
+        arg_parser.error("--student can't be used with --serve")
+    if args.watch and args.serve:
+        arg_parser.error("--watch can't be used with --serve")
+    if args.merge and args.roster is not None:
+        arg_parser.error("--merge can't be used with --roster")
+    if args.roster is None:
+        for option, given in (('--shard', args.shard is not None),
+                              ('--workers', args.workers is not None),
+                              ('--checkpoint', args.checkpoint),
+                              ('--roster-format', args.roster_format)):
+            if given:
+                arg_parser.error(f"{option} needs --roster")
+    else:
+        # the roster says which students and classes to grade, and how
+        for option, given in (('--class', args.classes),
+                              ('--concurrent', args.concurrent),
+                              ('--student', args.student),
+                              ('--watch', args.watch),
+                              ('--serve', args.serve)):
+            if given:
+                arg_parser.error(f"{option} can't be used with --roster")
+    if args.merge:
+        return merge_reports(args)
+
+    if args.roster is None:
+        try:
+            tokens = read_tokens(args.tokens)
+        except OSError as e:
+            print(f"Could not read tokens: {e}", file=sys.stderr)
+            return 1
+        if args.classes:
+            from .general import ScoreCalculator
+            unsupported = [code for code in args.classes
+                           if code not in ScoreCalculator.parser_index]
+            if unsupported:
+                arg_parser.error(f"unsupported class {', '.join(unsupported)} "
+                                 f"(supported: {', '.join(ScoreCalculator.parser_index)})")
+            missing = [code for code in args.classes if code not in tokens]
+            if missing:
+                print(f"No token for {', '.join(missing)} in {args.tokens}", file=sys.stderr)
+                return 1
+            tokens = {code: tokens[code] for code in args.classes}
+
+    # imported here so that --help doesn't pay for it
+    if args.discover:
+        from .parsers.request import CatsoopRequests
+        from .parsers.discovery import TermResolver
+        CatsoopRequests.resolver = TermResolver()
+    cache = None
+    if args.cache:
+        from .cache import ResponseCache
+        cache = ResponseCache()
+    if args.roster is not None:
+        return grade_roster(args, cache)
+    if args.watch:
+        return watch_tokens(args, tokens, cache)
+    if args.serve:
+        from .daemon import GradeService, default_auth_token_path, serve, write_auth_token
+        service = GradeService(tokens, args.refresh_interval or None,
+                               timeout=args.timeout, cache=cache)
+        auth_token = None
+        if args.socket is not None:
+            where = args.socket
+        else:
+            token_path = args.auth_token_file or default_auth_token_path()
+            auth_token = write_auth_token(token_path)
+            where = f"http://{args.host}:{args.port} (auth token in {token_path})"
+        print(f"Serving grades on {where}", file=sys.stderr)
+        serve(service, args.host, args.port, args.socket, auth_token)
+        return 0
+    from .general import ScoreCalculator
+    calc = ScoreCalculator(tokens, cache=cache)
+    history = None
+    if args.history:
+        import getpass
+        from .history import GradeHistory
+        history = GradeHistory(args.history)
+        calc.add_hook(history.recorder(args.student or getpass.getuser()))
+    sink = open_output(args.output)
+    try:
+        # each class's report is written as soon as it is ready
+        calc.report_all(args.debug, args.concurrent, timeout=args.timeout,
+                        sink=sink, format=args.format)
+    finally:
+        if sink is not sys.stdout: sink.close()
+        if history is not None: history.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
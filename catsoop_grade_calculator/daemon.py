@@ -0,0 +1,413 @@
+"""
+Long-running service mode: keeps parsers, connection pools and the
+latest grade of every page in memory, and answers grade queries over
+a local JSON API (HTTP on a port, or on a Unix socket).
+
+    GET  /health                   {"ok": true, "pages": <pages tracked>,
+                                    "requests": <request counters>}
+    GET  /grades                   grades of every class in the token file
+    GET  /grades/<class code>      grade of one class in the token file
+    POST /grades                   grades of the pages in the JSON body,
+                                   [{"class_code": ..., "token": ...,
+                                     "student_id": ...}, ...]
+
+GET requests take `?max_age=<seconds>` (how old a remembered grade
+may be before the page is fetched again; by default anything already
+fetched is returned) and `?refresh=1` (always fetch). Each grade is
+a result dictionary as in BatchCalculator.grade_one, plus
+`updated_at` (unix time of the last successful fetch) and
+`checked_at` (unix time of the last attempt).
+
+Over HTTP, every request must carry `Authorization: Bearer <token>`
+with the server's auth token (see make_server), since any local user
+can connect to a port. A Unix socket is only accessible to its owner
+(mode 0600), so it doesn't need one unless given.
+"""
+
+from .batch import BatchCalculator
+from .general import ScoreCalculator
+from .parsers.request import CatsoopRequests
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+import hmac
+import json
+import os
+import secrets
+import socketserver
+import threading
+import time
+
+class GradeService():
+    """
+    Grades pages on demand and remembers the latest result for each
+    (class code, token) pair.
+
+    Requests for a page that is already being fetched wait for that
+    fetch instead of starting their own, so N simultaneous callers
+    cause a single request to CAT-SOOP. A background thread refetches
+    every remembered page once it is refresh_interval seconds old.
+
+    Only pages that have been graded successfully at least once are
+    remembered. Pages of the token file are kept for good; any other
+    page is forgotten (and no longer refreshed) once nobody has asked
+    for it in page_ttl seconds, or when more than max_pages pages are
+    remembered, least recently asked for first.
+    """
+
+    def __init__(self, tokens: Optional[dict[str, str]] = None,
+                 refresh_interval: Optional[float] = 900,
+                 max_workers: int = 8, max_per_host: int = 4,
+                 timeout: Optional[float] = 30, cache=None,
+                 page_ttl: float = 3600, max_pages: int = 1000) -> None:
+        """
+        Tokens maps class codes to the tokens served by GET /grades.
+        A refresh_interval of None turns off background refreshing.
+        """
+        self.tokens = dict(tokens or {})
+        self.refresh_interval = refresh_interval
+        self.page_ttl = page_ttl
+        self.max_pages = max_pages
+        # the calculator keeps the parsers and parsed pages warm
+        self.calculator = BatchCalculator(max_workers, max_per_host, timeout, cache,
+                                          incremental=True)
+        # (class code, token) -> latest result, least recently asked for first
+        self.latest = OrderedDict()
+        self.requested_at = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stopped = threading.Event()
+        self.refresher = None
+
+    def is_own(self, key: tuple[str, str]) -> bool:
+        class_code, token = key
+        return self.tokens.get(class_code) == token
+
+    def forget(self, key: tuple[str, str]) -> None:
+        """
+        Drops everything remembered about a page. Must be called with
+        the lock held.
+        """
+        self.latest.pop(key, None)
+        self.requested_at.pop(key, None)
+        if self.calculator.page_states is not None:
+            self.calculator.page_states.pop(key, None)
+
+    def evict(self, now: float) -> None:
+        """
+        Forgets the pages outside the token file that haven't been
+        asked for in page_ttl seconds, and the least recently asked
+        for ones beyond max_pages. Must be called with the lock held.
+        """
+        for key in list(self.latest):
+            if self.is_own(key):
+                continue
+            if len(self.latest) <= self.max_pages \
+                    and now - self.requested_at[key] <= self.page_ttl:
+                break
+            self.forget(key)
+
+    def fetch(self, class_code: str, token: str, student_id: Optional[str] = None,
+              refreshing: bool = False) -> dict:
+        """
+        Grades the page now, or joins the fetch of it that is already
+        running. Returns the new latest result for the page.
+        Background refreshes pass refreshing=True, which doesn't count
+        as the page being asked for.
+        """
+        key = (class_code, token)
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.in_flight[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = self.calculator.grade_one(student_id, class_code, token)
+            with self.lock:
+                previous = self.latest.get(key)
+                now = time.time()
+                result['checked_at'] = now
+                if result['error'] is None:
+                    result['updated_at'] = now
+                elif previous is not None:
+                    # keep serving the last good grade, along with the error
+                    result['out_score'] = previous['out_score']
+                    result['updated_at'] = previous['updated_at']
+                else:
+                    result['updated_at'] = None
+                # a page that never worked isn't remembered, and a
+                # refresh doesn't bring back a page that was forgotten
+                if previous is None and (result['updated_at'] is None or refreshing):
+                    self.forget(key)
+                else:
+                    self.latest[key] = result
+                    if not refreshing:
+                        self.requested_at[key] = now
+                        self.latest.move_to_end(key)
+                    self.evict(now)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def get(self, class_code: str, token: str, student_id: Optional[str] = None,
+            max_age: Optional[float] = None, refresh: bool = False) -> dict:
+        """
+        Returns the latest result for the page, fetching it first if
+        there is none, if it is older than max_age seconds, or if
+        refresh is True.
+        """
+        key = (class_code, token)
+        with self.lock:
+            result = self.latest.get(key)
+            if result is not None:
+                self.requested_at[key] = time.time()
+                self.latest.move_to_end(key)
+        if result is not None and result['out_score'] is not None and not refresh:
+            age = time.time() - (result['updated_at'] or 0)
+            if max_age is None or age <= max_age:
+                return self.with_student_id(result, student_id)
+        return self.with_student_id(self.fetch(class_code, token, student_id), student_id)
+
+    @staticmethod
+    def with_student_id(result: dict, student_id: Optional[str]) -> dict:
+        # the same page may be asked for under different student ids
+        if result['student_id'] == student_id:
+            return result
+        return dict(result, student_id=student_id)
+
+    def get_many(self, pages: list[dict], max_age: Optional[float] = None,
+                 refresh: bool = False) -> list[dict]:
+        """
+        Same as get for a list of {'class_code', 'token', 'student_id'}
+        dictionaries, fetching the pages in parallel.
+        """
+        futures = [self.executor.submit(self.get, page['class_code'], page['token'],
+                                        page.get('student_id'), max_age, refresh)
+                   for page in pages]
+        return [future.result() for future in futures]
+
+    def get_own(self, class_code: Optional[str] = None, max_age: Optional[float] = None,
+                refresh: bool = False) -> dict[str, dict]:
+        """
+        Returns the results for the classes in self.tokens (or just
+        class_code), keyed by class code.
+        """
+        class_codes = list(self.tokens) if class_code is None else [class_code]
+        pages = [{'class_code': code, 'token': self.tokens[code], 'student_id': None}
+                 for code in class_codes]
+        results = self.get_many(pages, max_age, refresh)
+        return dict(zip(class_codes, results))
+
+    def refresh_stale(self) -> int:
+        """
+        Refetches every remembered page older than refresh_interval,
+        in parallel, after forgetting the pages nobody asks for any
+        more. Returns the number of pages refetched.
+        """
+        now = time.time()
+        with self.lock:
+            self.evict(now)
+            stale = [(key, result['student_id']) for key, result in self.latest.items()
+                     if now - result['checked_at'] >= self.refresh_interval]
+        futures = [self.executor.submit(self.fetch, class_code, token, student_id, True)
+                   for (class_code, token), student_id in stale]
+        for future in futures:
+            future.result()
+        return len(stale)
+
+    def refresh_loop(self) -> None:
+        # wake up often enough that no page is refreshed much later than due
+        period = max(1.0, self.refresh_interval / 10)
+        while not self.stopped.wait(period):
+            self.refresh_stale()
+
+    def start(self) -> None:
+        """
+        Starts refreshing in the background, if enabled.
+        """
+        if self.refresh_interval is None or self.refresher is not None:
+            return
+        self.refresher = threading.Thread(target=self.refresh_loop, daemon=True)
+        self.refresher.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.refresher is not None:
+            self.refresher.join()
+        self.executor.shutdown(wait=False)
+
+class GradeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the JSON API of the GradeService in self.server.service.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # small responses on kept-alive sockets, see benchmarks/run.py
+    disable_nagle_algorithm = True
+
+    def send_json(self, status: int, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorized(self) -> bool:
+        """
+        Checks the request's bearer token against the server's, if
+        it has one.
+        """
+        auth_token = getattr(self.server, 'auth_token', None)
+        if auth_token is None:
+            return True
+        given = self.headers.get('Authorization', '')
+        return hmac.compare_digest(given.encode(), f"Bearer {auth_token}".encode())
+
+    def get_options(self, query: dict) -> tuple[Optional[float], bool]:
+        max_age = query.get('max_age', [None])[0]
+        refresh = query.get('refresh', ['0'])[0] not in ('0', 'false', '')
+        return (None if max_age is None else float(max_age)), refresh
+
+    def do_GET(self):
+        if not self.authorized():
+            self.send_json(401, {'error': "missing or wrong auth token"})
+            return
+        service = self.server.service
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip('/')
+        try:
+            max_age, refresh = self.get_options(parse_qs(parts.query))
+        except ValueError:
+            self.send_json(400, {'error': "max_age must be a number"})
+            return
+        if path == '/health':
+            self.send_json(200, {'ok': True, 'pages': len(service.latest),
+                                 'requests': CatsoopRequests.get_scheduler().stats()})
+        elif path == '/grades':
+            self.send_json(200, service.get_own(max_age=max_age, refresh=refresh))
+        elif path.startswith('/grades/'):
+            class_code = path[len('/grades/'):]
+            if class_code not in service.tokens:
+                self.send_json(404, {'error': f"no token for class {class_code}"})
+                return
+            self.send_json(200, service.get_own(class_code, max_age, refresh)[class_code])
+        else:
+            self.send_json(404, {'error': "unknown path"})
+
+    def do_POST(self):
+        if not self.authorized():
+            self.send_json(401, {'error': "missing or wrong auth token"})
+            return
+        service = self.server.service
+        parts = urlsplit(self.path)
+        if parts.path.rstrip('/') != '/grades':
+            self.send_json(404, {'error': "unknown path"})
+            return
+        try:
+            max_age, refresh = self.get_options(parse_qs(parts.query))
+            length = int(self.headers.get('Content-Length', 0))
+            pages = json.loads(self.rfile.read(length))
+            if isinstance(pages, dict): pages = [pages]
+            for page in pages:
+                if page['class_code'] not in ScoreCalculator.parser_index:
+                    raise ValueError(f"unsupported class {page['class_code']}")
+                if not isinstance(page['token'], str):
+                    raise ValueError("token must be a string")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, service.get_many(pages, max_age, refresh))
+
+    def address_string(self) -> str:
+        # Unix sockets have no client address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixGradeRequestHandler(GradeRequestHandler):
+    # TCP_NODELAY doesn't exist for Unix sockets
+    disable_nagle_algorithm = False
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def default_auth_token_path() -> str:
+    """
+    Returns where the command line writes the auth token of the
+    service, under $XDG_CACHE_HOME (or ~/.cache).
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'catsoop_grade_calculator', 'service_token')
+
+def write_auth_token(path: str) -> str:
+    """
+    Generates a new auth token and writes it to path, readable only
+    by its owner. Returns the token.
+    """
+    auth_token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        # the file may have existed with looser permissions
+        os.fchmod(f.fileno(), 0o600)
+        f.write(auth_token + '\n')
+    return auth_token
+
+def make_server(service: GradeService, host: str = '127.0.0.1', port: int = 8765,
+                socket_path: Optional[str] = None,
+                auth_token: Optional[str] = None) -> socketserver.BaseServer:
+    """
+    Returns a server for the service's API, listening on a Unix
+    socket if socket_path is given and on host:port otherwise.
+    Call serve_forever() on it to start answering requests.
+
+    Requests must carry auth_token (see the module docstring). A
+    server on a port always needs one: if none is given, a random
+    one is made, and can be read from the server's auth_token. The
+    Unix socket is created with mode 0600.
+    """
+    if socket_path is not None:
+        # no window in which others could connect to the socket
+        old_umask = os.umask(0o177)
+        try:
+            server = UnixHTTPServer(socket_path, UnixGradeRequestHandler)
+        finally:
+            os.umask(old_umask)
+    else:
+        if auth_token is None:
+            auth_token = secrets.token_urlsafe(32)
+        server = ThreadingHTTPServer((host, port), GradeRequestHandler)
+    server.service = service
+    server.auth_token = auth_token
+    return server
+
+def serve(service: GradeService, host: str = '127.0.0.1', port: int = 8765,
+          socket_path: Optional[str] = None, auth_token: Optional[str] = None) -> None:
+    """
+    Runs the service until interrupted.
+    """
+    server = make_server(service, host, port, socket_path, auth_token)
+    service.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if socket_path is not None:
+            os.remove(socket_path)
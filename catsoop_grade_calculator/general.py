@@ -3,18 +3,148 @@ Provides a class to manage the different parsers.
 """
 
 from .parsers.request import CatsoopRequests
-from .parsers.circuits import CircuitsParser
-from .parsers.py import PyParser
-from typing import Optional
-import pprint
+from .instrument import emit, print_preprocessed
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, TextIO
+import importlib
+import threading
+import time
+
+# where the parser of each class lives, as 'module:Class' (relative to
+# this package); see ParserIndex
+_parser_paths = {'6.200': '.parsers.circuits:CircuitsParser',
+                 '6.101': '.parsers.py:PyParser'}
+
+class ParserIndex(MutableMapping):
+    """
+    Maps class codes to parser classes, like a plain dictionary, but
+    only imports a parser's module the first time its class is looked
+    up, so that loading the package doesn't load every parser.
+    """
+
+    def __init__(self, paths: dict[str, str]) -> None:
+        self.paths = dict(paths)
+        self.classes = {}
+
+    def __getitem__(self, class_code: str) -> type:
+        parser_class = self.classes.get(class_code)
+        if parser_class is None:
+            module_name, class_name = self.paths[class_code].split(':')
+            module = importlib.import_module(module_name, __package__)
+            parser_class = getattr(module, class_name)
+            self.classes[class_code] = parser_class
+        return parser_class
+
+    def __setitem__(self, class_code: str, parser_class: type) -> None:
+        self.paths.pop(class_code, None)
+        self.classes[class_code] = parser_class
+
+    def __delitem__(self, class_code: str) -> None:
+        if class_code not in self:
+            raise KeyError(class_code)
+        self.paths.pop(class_code, None)
+        self.classes.pop(class_code, None)
+
+    def __contains__(self, class_code) -> bool:
+        return class_code in self.classes or class_code in self.paths
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.paths
+        yield from (class_code for class_code in self.classes
+                    if class_code not in self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths.keys() | self.classes.keys())
 
 class ScoreCalculator():
 
-    parser_index = {'6.200': CircuitsParser,
-                    '6.101': PyParser}
+    # parser class of each supported class code
+    parser_index = ParserIndex(_parser_paths)
 
-    def __init__(self, tokens: dict[str, str]) -> None:
+    def __init__(self, tokens: dict[str, str], cache=None,
+                 incremental: bool = False) -> None:
+        """
+        Tokens maps class codes to CAT-SOOP api tokens. If a
+        ResponseCache is given, pages that haven't changed since they
+        were last graded reuse the cached result.
+
+        If incremental is True, the parsed version of each page is
+        kept in memory (per class and token), and the next time that
+        page is graded only the lines that changed are parsed again
+        (see Parser.parse_incremental).
+        """
         self.tokens = tokens
+        self.cache = cache
+        self.parsers = {}
+        self.hooks = []
+        # hooks installed for the current thread only, see hooked
+        self.local = threading.local()
+        self.page_states = {} if incremental else None
+
+    def add_hook(self, hook: Callable[[dict], None]) -> None:
+        """
+        Installs a hook that is called with an event dictionary after
+        each stage of a calculation (see instrument.py for the fields).
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[dict], None]) -> None:
+        self.hooks.remove(hook)
+
+    @contextmanager
+    def hooked(self, hook: Callable[[dict], None], this_thread: bool = False):
+        """
+        Installs a hook for the duration of a with block. If
+        this_thread is True, it only sees the calculations made by
+        the current thread (useful when many threads share one
+        calculator, as in BatchCalculator).
+        """
+        if not this_thread:
+            self.add_hook(hook)
+            try:
+                yield hook
+            finally:
+                self.remove_hook(hook)
+            return
+        if not hasattr(self.local, 'hooks'): self.local.hooks = []
+        self.local.hooks.append(hook)
+        try:
+            yield hook
+        finally:
+            self.local.hooks.remove(hook)
+
+    def get_hooks(self, debug=False) -> list[Callable[[dict], None]]:
+        """
+        Returns the hooks for one calculation; debug=True adds one
+        that prints the preprocessed page.
+        """
+        hooks = self.hooks + getattr(self.local, 'hooks', [])
+        if debug:
+            hooks.append(print_preprocessed)
+        return hooks
+
+    def get_parser(self, class_code: str):
+        """
+        Returns the parser for the class, creating it the first
+        time it is needed. One instance is shared by every page of a
+        class: the only state parsers keep between pages is the
+        layouts they have seen (see LayoutTemplate), which make
+        parsing faster without changing its results.
+        """
+        parser = self.parsers.get(class_code)
+        if parser is None:
+            parser = ScoreCalculator.get_parser_class(class_code)()
+            self.parsers[class_code] = parser
+        return parser
+
+    @staticmethod
+    def get_parser_class(class_code: str) -> type:
+        """
+        Returns the parser class for a class code, importing its
+        module the first time.
+        """
+        return ScoreCalculator.parser_index[class_code]
     
     def frac_to_percent(self, numer: float, denom: float) -> float:
         """
@@ -29,78 +159,257 @@ class ScoreCalculator():
         attributes `best_score`, `alt_scores`, and `by_category`,
         generate a verbose report.
         """
-        best = out_score['best_score']
-        best_percent = self.frac_to_percent(*best)
-        preface = '\n'.join(line.lstrip() for line in 
-                        f"""==================================
-                            GRADE REPORT FOR {class_code}: 
-                            ==================================
-                            OVERALL GRADE: ..........{best_percent}%
-                            ....Points collected: ...{round(best[0], 2)}
-                            ....Points possible: ....{round(best[1], 2)}"""
-                            .split('\n')) # join-split needed to remove whitespace
-
-        # ADD ALTERNATIVE SCORES, IF APPLICABLE
-        alt_score_text = ""
-        alt = out_score['alt_scores']
-        if alt:
-            alt_score_text = "\nALTERNATIVE SCORE(S):"
-            percents = [self.frac_to_percent(*alt_score) for alt_score in alt]
-            percents.sort(reverse=True)
-            for score in percents:
-                alt_score_text += f"\n....{score}%"
-
-        # ADD THE CATEGORY BREAKDOWN
-        by_category = out_score['by_category']
-        category_text = '\nCATEGORY BREAKDOWN:'
-        ordered_categories = list(by_category.keys())
-        ordered_categories.sort()
-        # align the scores to each other
-        max_len = max(len(word) for word in ordered_categories)
-        for category in ordered_categories:
-            remaining_dots = 2 + max_len - len(category)
-            score = round(100*by_category[category], 2)
-            category_text += f"\n....{category}{'.'*remaining_dots}{score}%"
-
-        # LINK THE URL
-        url = CatsoopRequests.get_url(class_code)
-        appendum = f"\n{url}"
+        from .report import render_text, summarize
+        return render_text(summarize(class_code, out_score))
 
-        return preface + alt_score_text + category_text + appendum
-
-    def calculate_one(self, class_code: str, debug=False) -> dict:
+    def fetch_page(self, class_code: str, timeout: Optional[float] = None,
+                   token: Optional[str] = None, stream: bool = False,
+                   headers: Optional[dict[str, str]] = None):
         """
-        Calculates the grade for one class. 
+        Requests the progress page for one class and returns the
+        Response object. If token is not provided, the one in
+        self.tokens is used.
         """
         if class_code not in ScoreCalculator.parser_index:
             raise NotImplementedError(
                     "This class doesn't have an implemented grade calculator!")
-        token = self.tokens[class_code]
-        raw_data = CatsoopRequests.request_data(token, class_code=class_code)
-        preprocessed = CatsoopRequests.preprocess_data(raw_data.text)
-        if debug: pprint.pp(preprocessed)
-        parser = ScoreCalculator.parser_index[class_code]()
-        score_data = parser.parse_html(preprocessed)
-        out_score = parser.calculate_score(score_data)
+        if token is None: token = self.tokens[class_code]
+        return CatsoopRequests.request_data(token, class_code=class_code,
+                                            timeout=timeout, stream=stream,
+                                            headers=headers)
+
+    def parse_stage(self, parser, preprocessed: list[str],
+                    state_key: Optional[tuple]) -> tuple[dict, Optional['PageState']]:
+        """
+        Parses the preprocessed lines, incrementally if state_key is
+        given. Returns the score_data and the new PageState (or None).
+        """
+        if state_key is None:
+            return parser.parse_html(preprocessed), None
+        state = parser.parse_incremental(preprocessed, self.page_states.get(state_key))
+        self.page_states[state_key] = state
+        return state.score_data, state
+
+    def score_stage(self, parser, score_data: dict,
+                    state: Optional['PageState']) -> dict:
+        if state is None:
+            return parser.calculate_score(score_data)
+        return parser.score_incremental(state)
+
+    def run_stages(self, class_code: str, preprocess: Callable[[], list[str]],
+                   hooks: list[Callable[[dict], None]],
+                   sizes: Optional[dict] = None,
+                   token: Optional[str] = None) -> dict:
+        """
+        Runs preprocess() and then parses and scores its output,
+        sending an event to each hook after every stage. If
+        preprocess() also downloads the page (see score_response), it
+        fills in sizes with the 'bytes' of the body and the 'seconds'
+        spent waiting for it; those are sent as a separate 'download'
+        event and left out of the time of the preprocess event. If the
+        calculator is incremental, token picks the previous version
+        of the page to diff against.
+        """
+        parser = self.get_parser(class_code)
+        state_key = None
+        if self.page_states is not None and token is not None:
+            state_key = (class_code, token)
+        if not hooks:
+            score_data, state = self.parse_stage(parser, preprocess(), state_key)
+            return self.score_stage(parser, score_data, state)
+
+        start = time.perf_counter()
+        preprocessed = preprocess()
+        seconds = time.perf_counter() - start
+        if sizes:
+            emit(hooks, class_code, 'download', start, seconds=sizes['seconds'],
+                 bytes=sizes['bytes'])
+            seconds -= sizes['seconds']
+        emit(hooks, class_code, 'preprocess', start, seconds=seconds,
+             lines=len(preprocessed), output=preprocessed)
+        start = time.perf_counter()
+        score_data, state = self.parse_stage(parser, preprocessed, state_key)
+        emit(hooks, class_code, 'parse', start,
+             assignments=sum(len(category) for category in score_data.values()),
+             output=score_data)
+        start = time.perf_counter()
+        out_score = self.score_stage(parser, score_data, state)
+        emit(hooks, class_code, 'score', start, output=out_score)
         return out_score
 
-    def report_all(self, debug=False) -> str:
+    def score_lines(self, class_code: str, preprocessed: list[str], debug=False,
+                    token: Optional[str] = None) -> dict:
+        """
+        Given the preprocessed lines of a progress page, parses them
+        and calculates the grade for the class. The token only
+        matters for incremental calculators (see __init__).
+        """
+        return self.run_stages(class_code, lambda: preprocessed, self.get_hooks(debug),
+                               token=token)
+
+    def score_page(self, class_code: str, page_text: str, debug=False,
+                   token: Optional[str] = None) -> dict:
+        """
+        Given the raw html of a progress page, preprocesses and
+        parses it, then calculates the grade for the class.
+        """
+        return self.run_stages(class_code,
+                               lambda: CatsoopRequests.preprocess_data(page_text),
+                               self.get_hooks(debug), token=token)
+
+    def score_response(self, class_code: str, response, debug=False,
+                       token: Optional[str] = None) -> dict:
         """
-        Returns a report of all grades for classes in self.tokens.
+        Same as score_page, but preprocesses the body of a Response
+        while it is being downloaded.
         """
-        out = [] 
+        hooks = self.get_hooks(debug)
+        sizes = {} if hooks else None
+
+        def preprocess() -> list[str]:
+            # sizes is filled in while the body is read
+            return list(CatsoopRequests.preprocess_response(response, sizes=sizes))
+
+        return self.run_stages(class_code, preprocess, hooks, sizes, token)
+
+    def calculate_one(self, class_code: str, debug=False,
+                      timeout: Optional[float] = None,
+                      token: Optional[str] = None) -> dict:
+        """
+        Calculates the grade for one class. If token is not provided,
+        the one in self.tokens is used.
+        """
+        if self.cache is not None:
+            return self.calculate_cached(class_code, debug, timeout, token)
+        if token is None: token = self.tokens.get(class_code)
+        hooks = self.get_hooks(debug)
+        start = time.perf_counter()
+        response = self.fetch_page(class_code, timeout, token, stream=True)
+        if hooks:
+            emit(hooks, class_code, 'request', start, status=response.status_code)
+        return self.score_response(class_code, response, debug, token)
+
+    @staticmethod
+    def cache_version(class_code: str) -> str:
+        """
+        Returns the version cached results of a class are stored
+        under: its parser class and that parser's version, so results
+        from another parser, or an older version of this one, are
+        calculated again.
+        """
+        if class_code not in ScoreCalculator.parser_index:
+            return ''
+        parser_class = ScoreCalculator.get_parser_class(class_code)
+        return f"{parser_class.__module__}.{parser_class.__qualname__}:{parser_class.version}"
+
+    def calculate_cached(self, class_code: str, debug=False,
+                         timeout: Optional[float] = None,
+                         token: Optional[str] = None) -> dict:
+        """
+        Same as calculate_one, going through self.cache. The page is
+        requested conditionally (If-None-Match / If-Modified-Since);
+        if the server says it is unchanged, or its body hashes the
+        same as last time, the cached out_score is returned without
+        parsing anything.
+        """
+        if token is None: token = self.tokens.get(class_code)
+        url = CatsoopRequests.get_url(class_code)
+        version = self.cache_version(class_code)
+        entry = None if url is None else self.cache.load(url, token, version)
+        headers = self.cache.conditional_headers(entry)
+        hooks = self.get_hooks(debug)
+        start = time.perf_counter()
+        response = self.fetch_page(class_code, timeout, token, headers=headers)
+        if hooks:
+            emit(hooks, class_code, 'request', start, status=response.status_code,
+                 bytes=len(response.content))
+        start = time.perf_counter()
+        body_hash = None
+        if entry is None or response.status_code != 304:
+            body_hash = self.cache.hash_body(response.content)
+        if entry is not None and body_hash in (None, entry['body_hash']):
+            from .report import out_score_from_json
+            self.cache.refresh(url, token, entry, response, version)
+            out_score = out_score_from_json(entry['out_score'])
+            if hooks:
+                emit(hooks, class_code, 'cache_hit', start, output=out_score)
+            return out_score
+        out_score = self.run_stages(
+                class_code, lambda: CatsoopRequests.preprocess_data(response.text), hooks,
+                token=token)
+        self.cache.store_response(url, token, response, body_hash, out_score, version)
+        return out_score
+
+    def calculate_each(self, debug=False, max_per_host: int = 4,
+                       timeout: Optional[float] = None) -> Iterator[tuple[str, dict]]:
+        """
+        Calculates the grades for all classes in self.tokens
+        concurrently. At most max_per_host pages are requested from
+        the same CAT-SOOP host at once, and each request gives up
+        after timeout seconds.
+
+        Yields (class code, out_score) pairs in the same order as
+        self.tokens, each as soon as it and those before it are done.
+        """
+        limits = {}
         for course in self.tokens:
-            out_score = self.calculate_one(course, debug)
-            out.append(self.generate_full_report(course, out_score))
-        return "\n".join(out)
-        
-if __name__ == "__main__":
-    tokens = {}
-    with open('token.txt', 'r') as f:
-        for line in f:
-            code, token = line.strip().split(' ')
-            tokens[code] = token
-    calc = ScoreCalculator(tokens)
-    full_report = calc.report_all()
-    print(full_report)
+            url = CatsoopRequests.get_url(course)
+            if url is None: continue # calculate_one raises for these
+            host = CatsoopRequests.get_host(url)
+            limits.setdefault(host, threading.BoundedSemaphore(max_per_host))
 
+        def run_one(course: str) -> dict:
+            url = CatsoopRequests.get_url(course)
+            if url is None:
+                return self.calculate_one(course, debug, timeout)
+            # the body is streamed, so the whole page counts against the limit
+            with limits[CatsoopRequests.get_host(url)]:
+                return self.calculate_one(course, debug, timeout)
+
+        from concurrent.futures import ThreadPoolExecutor
+        # no point in having more threads than the hosts will allow
+        max_workers = max(1, min(len(self.tokens), max_per_host * len(limits)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {course: executor.submit(run_one, course)
+                       for course in self.tokens}
+            for course, future in futures.items():
+                yield course, future.result()
+
+    def calculate_all(self, debug=False, max_per_host: int = 4,
+                      timeout: Optional[float] = None) -> dict[str, dict]:
+        """
+        Same as calculate_each, but returns a dictionary mapping class
+        codes to out_score dictionaries, in the same order as
+        self.tokens.
+        """
+        return dict(self.calculate_each(debug, max_per_host, timeout))
+
+    def report_all(self, debug=False, concurrent=False, max_per_host: int = 4,
+                   timeout: Optional[float] = None, sink: Optional[TextIO] = None,
+                   format: str = 'text') -> Optional[str]:
+        """
+        Reports all grades for classes in self.tokens, in the given
+        format (see report.py). If concurrent is True, the progress
+        pages are fetched in parallel (see calculate_each); the report
+        order is the same.
+
+        If a sink (a file-like object) is given, each class's report
+        is written to it as soon as it is ready and None is returned.
+        Otherwise the whole report is returned as a string.
+        """
+        from .report import ReportWriter
+        if sink is None:
+            import io
+            buffer = io.StringIO()
+            self.report_all(debug, concurrent, max_per_host, timeout, buffer, format)
+            # without the newline ending the last report, as print adds one
+            return buffer.getvalue()[:-1]
+        writer = ReportWriter(sink, format)
+        if concurrent:
+            out_scores = self.calculate_each(debug, max_per_host, timeout)
+        else:
+            out_scores = ((course, self.calculate_one(course, debug, timeout))
+                          for course in self.tokens)
+        for course, out_score in out_scores:
+            writer.write(course, out_score)
+        return None
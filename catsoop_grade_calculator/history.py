@@ -0,0 +1,282 @@
+"""
+Append-only history of calculated grades, stored in SQLite.
+
+Every recorded grade keeps the out_score (best and alternative
+scores, and the average of each category) and, when available, the
+assignment records it was calculated from, all with the time it was
+recorded. Indexes on (student, course, time) and (course, category)
+let the range and trend queries below avoid full table scans.
+"""
+
+from typing import Optional
+import json
+import sqlite3
+import threading
+import time
+
+schema = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    student TEXT NOT NULL,
+    course TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    best_earned REAL NOT NULL,
+    best_possible REAL NOT NULL,
+    alt_scores TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS category_scores (
+    score_id INTEGER NOT NULL REFERENCES scores(id),
+    student TEXT NOT NULL,
+    course TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    category TEXT NOT NULL,
+    average REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    score_id INTEGER NOT NULL REFERENCES scores(id),
+    student TEXT NOT NULL,
+    course TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    sub_assignment TEXT,
+    earned REAL NOT NULL,
+    possible REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_student
+    ON scores (student, course, recorded_at);
+CREATE INDEX IF NOT EXISTS category_scores_by_student
+    ON category_scores (student, course, category, recorded_at);
+CREATE INDEX IF NOT EXISTS category_scores_by_course
+    ON category_scores (course, category, recorded_at);
+CREATE INDEX IF NOT EXISTS assignments_by_student
+    ON assignments (student, course, recorded_at);
+CREATE INDEX IF NOT EXISTS assignments_by_course
+    ON assignments (course, category, recorded_at);
+"""
+
+class GradeHistory():
+    """
+    Records grades into an SQLite file and answers queries about
+    them. Nothing is ever updated or deleted.
+
+    record() only buffers; buffered grades are written together in a
+    single transaction once batch_size of them have piled up, on
+    flush(), or on close() (also when used as a context manager).
+    """
+
+    def __init__(self, path: str, batch_size: int = 500) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(schema)
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> 'GradeHistory':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def record(self, student: str, course: str, out_score: dict,
+               score_data: Optional[dict[str, list]] = None,
+               recorded_at: Optional[float] = None) -> None:
+        """
+        Buffers one grade: the out_score from calculate_score and,
+        optionally, the score_data it was calculated from.
+        recorded_at is a unix time, now by default. Raises a
+        ValueError if there is no student to record it under.
+        """
+        if not student:
+            raise ValueError("Grades need a student to be recorded under")
+        if recorded_at is None: recorded_at = time.time()
+        with self.lock:
+            self.pending.append((student, course, recorded_at, out_score, score_data))
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes every buffered grade in one transaction. If it fails,
+        nothing is written and the grades stay buffered.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if not pending:
+                return
+            try:
+                self.write(pending)
+            except BaseException:
+                self.pending = pending + self.pending
+                raise
+
+    def write(self, pending: list[tuple]) -> None:
+        """
+        Inserts buffered grades in one transaction. Must be called
+        with the lock held.
+        """
+        with self.connection:
+            cursor = self.connection.cursor()
+            # take the write lock now, so the ids below stay free
+            cursor.execute("BEGIN IMMEDIATE")
+            next_id = cursor.execute(
+                    "SELECT COALESCE(MAX(id), 0) + 1 FROM scores").fetchone()[0]
+            score_rows = []
+            category_rows = []
+            assignment_rows = []
+            for score_id, (student, course, recorded_at, out_score, score_data) \
+                    in enumerate(pending, next_id):
+                earned, possible = out_score['best_score']
+                score_rows.append((score_id, student, course, recorded_at, earned,
+                                   possible, json.dumps(out_score['alt_scores'])))
+                for category, average in out_score['by_category'].items():
+                    category_rows.append((score_id, student, course, recorded_at,
+                                          category, average))
+                for category, category_data in (score_data or {}).items():
+                    for record in category_data:
+                        earned, possible = record['score']
+                        assignment_rows.append(
+                                (score_id, student, course, recorded_at, category,
+                                 record['assignment_name'], record.get('sub_assignment'),
+                                 earned, possible))
+            cursor.executemany(
+                    "INSERT INTO scores (id, student, course, recorded_at, best_earned, "
+                    "best_possible, alt_scores) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    score_rows)
+            cursor.executemany(
+                    "INSERT INTO category_scores (score_id, student, course, "
+                    "recorded_at, category, average) VALUES (?, ?, ?, ?, ?, ?)",
+                    category_rows)
+            cursor.executemany(
+                    "INSERT INTO assignments (score_id, student, course, recorded_at, "
+                    "category, name, sub_assignment, earned, possible) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    assignment_rows)
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+    def query(self, sql: str, params: tuple = ()) -> list[dict]:
+        """
+        Runs a read-only query, returning the rows as dictionaries.
+        Buffered grades are written first.
+        """
+        self.flush()
+        with self.lock:
+            cursor = self.connection.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    @staticmethod
+    def time_range(start: Optional[float], end: Optional[float]) -> tuple[str, tuple]:
+        """
+        Returns the extra where clause (and its parameters) for
+        start <= recorded_at < end, either bound being optional.
+        """
+        clause, params = "", ()
+        if start is not None:
+            clause += " AND recorded_at >= ?"
+            params += (start,)
+        if end is not None:
+            clause += " AND recorded_at < ?"
+            params += (end,)
+        return clause, params
+
+    def scores(self, student: str, course: str, start: Optional[float] = None,
+               end: Optional[float] = None) -> list[dict]:
+        """
+        Returns the grades recorded for a student in a course between
+        start and end (unix times), oldest first. Each is a dictionary
+        with keys id, recorded_at, best_score and alt_scores.
+        """
+        where, times = GradeHistory.time_range(start, end)
+        rows = self.query(
+                "SELECT id, recorded_at, best_earned, best_possible, alt_scores FROM scores "
+                f"WHERE student = ? AND course = ?{where} ORDER BY recorded_at",
+                (student, course) + times)
+        return [{'id': row['id'],
+                 'recorded_at': row['recorded_at'],
+                 'best_score': (row['best_earned'], row['best_possible']),
+                 'alt_scores': tuple(tuple(alt) for alt in json.loads(row['alt_scores']))}
+                for row in rows]
+
+    def category_trend(self, student: str, course: str, category: str,
+                       start: Optional[float] = None,
+                       end: Optional[float] = None) -> list[tuple[float, float]]:
+        """
+        Returns (recorded_at, average) for every recorded grade of a
+        student's category in a course, oldest first; for example,
+        how their lab average changed over the term.
+        """
+        where, times = GradeHistory.time_range(start, end)
+        rows = self.query(
+                "SELECT recorded_at, average FROM category_scores "
+                f"WHERE student = ? AND course = ? AND category = ?{where} "
+                "ORDER BY recorded_at",
+                (student, course, category) + times)
+        return [(row['recorded_at'], row['average']) for row in rows]
+
+    def course_category(self, course: str, category: str,
+                        start: Optional[float] = None,
+                        end: Optional[float] = None) -> list[dict]:
+        """
+        Returns the category average of every student in a course
+        recorded between start and end, as dictionaries with keys
+        student, recorded_at and average, oldest first.
+        """
+        where, times = GradeHistory.time_range(start, end)
+        return self.query(
+                "SELECT student, recorded_at, average FROM category_scores "
+                f"WHERE course = ? AND category = ?{where} ORDER BY recorded_at",
+                (course, category) + times)
+
+    def assignments(self, student: str, course: str,
+                    at: Optional[float] = None) -> list[dict]:
+        """
+        Returns the assignment records of the latest grade recorded
+        for a student in a course (at or before time `at`), as
+        dictionaries with keys category, name, sub_assignment,
+        earned and possible.
+        """
+        where, times = ("", ()) if at is None else (" AND recorded_at <= ?", (at,))
+        latest = self.query(
+                "SELECT id, recorded_at FROM scores "
+                f"WHERE student = ? AND course = ?{where} "
+                "ORDER BY recorded_at DESC, id DESC LIMIT 1",
+                (student, course) + times)
+        if not latest:
+            return []
+        return self.query(
+                "SELECT category, name, sub_assignment, earned, possible FROM assignments "
+                "WHERE student = ? AND course = ? AND recorded_at = ? AND score_id = ? "
+                "ORDER BY rowid",
+                (student, course, latest[0]['recorded_at'], latest[0]['id']))
+
+    def recorder(self, student: str) -> 'HistoryRecorder':
+        return HistoryRecorder(self, student)
+
+class HistoryRecorder():
+    """
+    ScoreCalculator hook that records every grade it calculates for
+    one student, along with the parsed assignments.
+    """
+
+    def __init__(self, history: GradeHistory, student: str) -> None:
+        self.history = history
+        self.student = student
+        # score_data of each class whose score hasn't come out yet
+        self.parsed = {}
+
+    def __call__(self, event: dict) -> None:
+        stage = event['stage']
+        if stage == 'parse':
+            self.parsed[event['class_code']] = event['output']
+        elif stage in ('score', 'cache_hit'):
+            score_data = self.parsed.pop(event['class_code'], None)
+            self.history.record(self.student, event['class_code'], event['output'],
+                                score_data)
@@ -0,0 +1,133 @@
+"""
+Timing and size events for each stage of a grade calculation.
+
+ScoreCalculator emits an event dictionary after each stage of
+calculate_one to every installed hook (any callable taking the
+event). Every event has the keys:
+    stage: one of 'request', 'cache_hit', 'download', 'preprocess',
+        'parse', 'score'
+    class_code: the class being graded
+    seconds: how long the stage took
+and, depending on the stage:
+    status: the HTTP status of the response ('request')
+    bytes: size of the response body ('request' when not streamed,
+        'download' when it is)
+    lines: number of preprocessed lines ('preprocess')
+    assignments: number of parsed assignments ('parse')
+    output: the stage's result (preprocessed lines, score_data, out_score)
+
+When the body is streamed, 'request' only covers the response
+headers; the body is read while it is preprocessed, and the time
+spent waiting on it is reported by a 'download' event (sent just
+before the 'preprocess' one, whose time leaves it out).
+"""
+
+from typing import Callable, TextIO
+import json
+import math
+import threading
+import time
+
+def emit(hooks: list[Callable], class_code: str, stage: str, start: float,
+         **fields) -> None:
+    """
+    Sends an event for a stage that began at time.perf_counter() == start.
+    """
+    event = {'stage': stage,
+             'class_code': class_code,
+             'seconds': time.perf_counter() - start}
+    event.update(fields)
+    for hook in hooks:
+        hook(event)
+
+def print_preprocessed(event: dict) -> None:
+    """
+    Hook behind debug=True: pretty-prints the preprocessed lines.
+    """
+    if event['stage'] == 'preprocess':
+        import pprint
+        pprint.pp(event['output'])
+
+class HistogramSummary():
+    """
+    Hook that aggregates the events of many calculations into a
+    histogram of durations per stage (buckets doubling from 0.1 ms),
+    along with counts and totals of the size fields.
+    """
+
+    size_fields = ('bytes', 'lines', 'assignments')
+    smallest_bucket = 1e-4
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def bucket_of(self, seconds: float) -> int:
+        if seconds <= self.smallest_bucket:
+            return 0
+        return math.ceil(math.log2(seconds / self.smallest_bucket))
+
+    def __call__(self, event: dict) -> None:
+        seconds = event['seconds']
+        with self.lock:
+            stats = self.stages.get(event['stage'])
+            if stats is None:
+                stats = {'count': 0, 'total': 0.0, 'min': seconds, 'max': seconds,
+                         'buckets': {}, 'sizes': {}}
+                self.stages[event['stage']] = stats
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['min'] = min(stats['min'], seconds)
+            stats['max'] = max(stats['max'], seconds)
+            bucket = self.bucket_of(seconds)
+            stats['buckets'][bucket] = stats['buckets'].get(bucket, 0) + 1
+            for field in self.size_fields:
+                if field in event:
+                    stats['sizes'][field] = stats['sizes'].get(field, 0) + event[field]
+
+    def quantile(self, stage: str, q: float) -> float:
+        """
+        Returns the upper edge of the bucket holding the q-quantile
+        of the stage's durations.
+        """
+        stats = self.stages[stage]
+        rank = q * stats['count']
+        seen = 0
+        for bucket in sorted(stats['buckets']):
+            seen += stats['buckets'][bucket]
+            if seen >= rank:
+                return min(self.smallest_bucket * 2 ** bucket, stats['max'])
+        return stats['max']
+
+    def summary(self) -> str:
+        """
+        Returns a table with one row per stage.
+        """
+        lines = [f"{'stage':<12}{'count':>8}{'total s':>10}{'mean ms':>10}"
+                 f"{'p50 ms':>10}{'p90 ms':>10}{'max ms':>10}  sizes"]
+        with self.lock:
+            for stage, stats in self.stages.items():
+                sizes = ' '.join(f"{field}={total}" for field, total in stats['sizes'].items())
+                lines.append(f"{stage:<12}{stats['count']:>8}{stats['total']:>10.3f}"
+                             f"{1000 * stats['total'] / stats['count']:>10.2f}"
+                             f"{1000 * self.quantile(stage, 0.5):>10.2f}"
+                             f"{1000 * self.quantile(stage, 0.9):>10.2f}"
+                             f"{1000 * stats['max']:>10.2f}  {sizes}")
+        return '\n'.join(lines)
+
+class JsonLinesExporter():
+    """
+    Hook that writes each event as one line of JSON to a file-like
+    object, leaving out the stage output.
+    """
+
+    def __init__(self, file: TextIO):
+        self.file = file
+        self.lock = threading.Lock()
+
+    def __call__(self, event: dict) -> None:
+        record = {key: value for key, value in event.items() if key != 'output'}
+        record['time'] = time.time()
+        line = json.dumps(record)
+        with self.lock:
+            self.file.write(line + '\n')
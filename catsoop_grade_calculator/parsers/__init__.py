@@ -1,6 +1,27 @@
-# empty file for now
+# Like the package itself, submodules are imported on first use, so
+# loading one parser doesn't load the others (or requests).
 
-from .base_parser import Parser
-from .circuits import CircuitsParser
-from .py import PyParser
-from .request import CatsoopRequests
+import importlib
+
+lazy_names = {'Parser': '.base_parser',
+              'Assignment': '.records',
+              'CategoryColumns': '.records',
+              'PageState': '.records',
+              'to_columns': '.records',
+              'CircuitsParser': '.circuits',
+              'PyParser': '.py',
+              'CatsoopRequests': '.request',
+              'RequestScheduler': '.scheduler',
+              'TermResolver': '.discovery'}
+
+__all__ = list(lazy_names)
+
+def __getattr__(name: str):
+    if name not in lazy_names:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(lazy_names[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_names))
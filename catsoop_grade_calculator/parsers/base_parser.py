@@ -4,17 +4,237 @@ Abstract class for the different parsers.
 
 from typing import Optional, Callable
 from .request import CatsoopRequests
+from .records import Assignment, CategoryColumns, PageState, average_of_scores, scores_of
+from .policy import category_average
+from collections import OrderedDict
+import difflib
+import re
+import threading
+
+class HeaderMatcher():
+    """
+    A parser's `headers` table compiled into one regex, so that the
+    active header of a line is found in a single pass over it.
+    The result is the same as checking every header in turn: when
+    a line contains several headers, the last one in the table wins.
+    """
+
+    def __init__(self, headers: dict[str, dict]):
+        self.headers = headers
+        names = list(headers)
+        rank = {name: i for i, name in enumerate(names)}
+        # longest first, so each position captures the longest header there
+        ordered = sorted(names, key=len, reverse=True)
+        self.pattern = re.compile(
+                '(?=(' + '|'.join(re.escape(name) for name in ordered) + '))')
+        # a header that matches also means every header inside it matches
+        self.best_rank = {name: max(rank[other] for other in names if other in name)
+                          for name in names}
+        self.names = names
+        # resolve the header dicts once; func is None for add_score_to_dict
+        self.entries = [(headers[name].get('func'),
+                         headers[name].get('args', []),
+                         headers[name].get('kwargs', {}))
+                        for name in names]
+        # a page can only be matched against a layout template (see
+        # LayoutTemplate) if every header goes through add_score_to_dict
+        # and no header or keyword has a digit or a dot in it, since
+        # numbers are what the template leaves out
+        self.fixed_layout = all(
+                add_func is None and len(args) >= 2
+                and not LayoutTemplate.has_number(name)
+                and not LayoutTemplate.has_number(kwargs.get('keyword', args[0]))
+                for name, (add_func, args, kwargs) in zip(names, self.entries))
+        # every argument add_score_to_dict gets for each header, by name
+        self.settings = None
+        if self.fixed_layout:
+            self.settings = [HeaderMatcher.score_settings(args, kwargs)
+                             for add_func, args, kwargs in self.entries]
+
+    @staticmethod
+    def score_settings(args: list, kwargs: dict) -> dict:
+        """
+        Returns the arguments Parser.add_score_to_dict is called with
+        for a header (after score_dict and line), defaults included.
+        """
+        add_score = Parser.add_score_to_dict
+        names = add_score.__code__.co_varnames[3:add_score.__code__.co_argcount]
+        defaults = add_score.__defaults__
+        settings = dict(zip(names[len(names) - len(defaults):], defaults))
+        settings.update(zip(names, args))
+        settings.update(kwargs)
+        if settings['keyword'] is None: settings['keyword'] = settings['assignment_type']
+        return settings
+
+    def find(self, lowered_line: str) -> Optional[int]:
+        """
+        Given a lowercased line, returns the index of the header that
+        applies to it, or None if the line contains no header.
+        """
+        best = -1
+        for match in self.pattern.finditer(lowered_line):
+            rank = self.best_rank[match.group(1)]
+            if rank > best: best = rank
+        return best if best >= 0 else None
+
+class LayoutTemplate():
+    """
+    The layout of a progress page, learned from a page parsed in full:
+    which lines hold a record under which header. Pages of students
+    in the same situation have the same layout with different numbers,
+    so a page matching the template is parsed by reading just those
+    lines (see Parser.read_records), without looking for headers on
+    the others.
+
+    A page matches if it is the same as the template's apart from its
+    numbers (what CatsoopRequests.get_numbers would pick out), and
+    apart from the last character (the check or cross) of binary
+    lines, as long as that doesn't change which header the line has.
+    Since no header or keyword contains a digit or a dot (see
+    HeaderMatcher), a matching page finds the same headers on the same
+    lines, and the same lines have keywords and as many numbers, as
+    the page the template came from.
+
+    The comparison is split in two (see fingerprint): the lines with
+    their numbers masked and their last character left out, which is
+    what parsers look templates up by, and those last characters,
+    which are compared here.
+    """
+
+    __slots__ = ('matcher', 'lasts', 'binary', 'records')
+
+    number = re.compile(r'[0-9\.]+')
+    number_chars = frozenset('0123456789.')
+
+    def __init__(self, matcher: HeaderMatcher, lasts: list[str],
+                 binary: dict[int, tuple[str, Optional[int]]],
+                 records: list[tuple[int, int]]):
+        """
+        lasts is the second part of the page's fingerprint. binary maps
+        the index of each binary line to its last character and the
+        header found on it, and records lists the index and header
+        (its index in the matcher) of every line that held a record,
+        in order.
+        """
+        self.matcher = matcher
+        self.lasts = lasts
+        self.binary = binary
+        self.records = records
+
+    @staticmethod
+    def has_number(text: str) -> bool:
+        return LayoutTemplate.number.search(text) is not None
+
+    @staticmethod
+    def fingerprint(lines: list[str]) -> tuple[str, list[str]]:
+        """
+        Returns the lines without their last character, joined into
+        one string with the numbers masked, and the last character of
+        each line (or '' for an empty one). Two pages with the same
+        fingerprint apart from digits and dots at the end of lines
+        are the same apart from their numbers.
+        """
+        # lines never contain a newline, see CatsoopRequests.preprocess_data
+        return (LayoutTemplate.number.sub('0', '\n'.join([line[:-1] for line in lines])),
+                [line[-1:] for line in lines])
+
+    def matches(self, inp_lines: list[str], lasts: list[str]) -> bool:
+        """
+        Given a page with the same first part of the fingerprint as
+        the template's, and the second part, returns whether it
+        matches the template.
+        """
+        if lasts == self.lasts:
+            return True
+        number_chars = LayoutTemplate.number_chars
+        for i, (last, template_last) in enumerate(zip(lasts, self.lasts)):
+            if last == template_last:
+                continue
+            # the end of a number, which is masked like the rest of it
+            if last in number_chars and template_last in number_chars:
+                continue
+            entry = self.binary.get(i)
+            if entry is None or self.matcher.find(inp_lines[i].lower()) != entry[1]:
+                return False
+        return True
 
 class Parser():
 
+    # bump when a change to the parser changes the grades it gives,
+    # so results cached by the old version aren't used (see
+    # ScoreCalculator.cache_version)
+    version = 1
+
+    # compiled headers for each parser class, see get_header_matcher
+    header_matchers = {}
+
+    # how many page layouts each parser remembers, see LayoutTemplate
+    max_layout_templates = 16
+
     def __init__(self):
-        pass
+        # how many of the lowest assignments of each category are
+        # dropped (none by default), and the normalize_each setting of
+        # each category's average (True by default); see policy.py.
+        # Each parser gets its own copy of what its class set, if any
+        self.drop_lowest = dict(getattr(self, 'drop_lowest', {}))
+        self.normalize_each = dict(getattr(self, 'normalize_each', {}))
+        # layouts of the pages parsed in full, by the first part of
+        # their fingerprint, least recently used first
+        self.layout_templates = OrderedDict()
+        self.layout_lock = threading.Lock()
+
+    def get_layout_template(self, matcher: HeaderMatcher,
+                            fingerprint: tuple[str, list[str]],
+                            inp_lines: list[str]) -> Optional[LayoutTemplate]:
+        """
+        Returns the remembered template the page matches, if any.
+        """
+        with self.layout_lock:
+            template = self.layout_templates.get(fingerprint[0])
+            if template is None or template.matcher is not matcher:
+                return None
+            self.layout_templates.move_to_end(fingerprint[0])
+        if not template.matches(inp_lines, fingerprint[1]):
+            return None
+        return template
+
+    def add_layout_template(self, fingerprint: tuple[str, list[str]],
+                            template: LayoutTemplate) -> None:
+        with self.layout_lock:
+            self.layout_templates[fingerprint[0]] = template
+            self.layout_templates.move_to_end(fingerprint[0])
+            while len(self.layout_templates) > self.max_layout_templates:
+                self.layout_templates.popitem(last=False)
+
+    def get_header_matcher(self) -> HeaderMatcher:
+        """
+        Returns the compiled version of self.headers. It is built once
+        per parser class, and only rebuilt if the headers change.
+        """
+        matcher = Parser.header_matchers.get(type(self))
+        if matcher is None or matcher.headers != self.headers:
+            matcher = HeaderMatcher(self.headers)
+            Parser.header_matchers[type(self)] = matcher
+        return matcher
+
+    def gen_assignment(self,
+                       score: tuple[float],
+                       assignment_type: str,
+                       assignment_name: str,
+                       sub_assignment: Optional[str] = None) -> Assignment:
+        """
+        Returns the record stored for one assignment.
+        """
+        return Assignment(score, assignment_type, assignment_name, sub_assignment)
 
     def gen_assignment_dict(self, 
                             score: tuple[float], 
                             assignment_type: str,
                             assignment_name: str,
                             sub_assignment: Optional[str] = None) -> dict:
+        """
+        Old dictionary form of gen_assignment, kept for outside code.
+        """
         out =  {'score': score,
                 'assignment_type': assignment_type,
                 'assignment_name': assignment_name}
@@ -31,7 +251,8 @@ class Parser():
                           keyword: Optional[str] = None,
                           exact_case: Optional[bool] = False,
                           delimiter: Optional[str] = ":",
-                          binary_x_string: Optional[str] = "\x98") -> Optional[str]:
+                          binary_x_string: Optional[str] = "\x98",
+                          lowered_line: Optional[str] = None) -> Optional[str]:
         """
         Mutates the input score_dict to add an entry.
         Score_type is a string and takes one of 'fraction',
@@ -46,6 +267,8 @@ class Parser():
         it will use the assignment_type.
         If the return_name flag is set to True, it will return
         the string before the `:` delimiter.
+        If lowered_line is provided, it is used as the lowercase
+        version of line instead of lowercasing it again.
         """
 
         def find_assignment_name():
@@ -55,7 +278,10 @@ class Parser():
 
         # check if line contains a score
         if keyword is None: keyword = assignment_type
-        check_line = line if exact_case else line.lower()
+        if exact_case:
+            check_line = line
+        else:
+            check_line = line.lower() if lowered_line is None else lowered_line
         if keyword not in check_line:
             return find_assignment_name() if return_name else None
 
@@ -71,79 +297,294 @@ class Parser():
         score = (raw_score, default_max)
 
         # add to dictionary
-        score_dict.setdefault(assignment_type, []).append(self.gen_assignment_dict(
+        score_dict.setdefault(assignment_type, []).append(self.gen_assignment(
             score, assignment_type, find_assignment_name()))
         return find_assignment_name()
 
-    def parse_html(self, inp_lines: list[str]) -> list[dict]:
+    def parse_html(self, inp_lines: list[str]) -> dict[str, list[Assignment]]:
         """
         Parses the preprocessed html into the following format to
         feed into the grade calculator: 
-            list of:
-                dictionaries with key, values:
+            dictionary mapping each assignment type to a list of:
+                Assignment records with attributes:
                     score: a tuple with first element raw score, and second
                         element total score (both floats)
                     assignment_type: a string with a descriptor of 
                         the type of assignment
                     assignment_name: a string with the assignment name, 
                     sub_assignment: a subassignment descriptor, if applicable
+        The records can also be read like dictionaries with those keys.
+
+        Pages with the same layout as one of the last few parsed in
+        full only have their record lines read (see LayoutTemplate);
+        any other page is parsed in full, and its layout is remembered.
         """
         out = {}
 
-        headers = self.headers
+        matcher = self.get_header_matcher()
+        find_header = matcher.find
+        entries = matcher.entries
+        add_score = self.add_score_to_dict
 
-        cur_type = None
-        for line in inp_lines:
-            for key_header in headers:
-                if key_header in line.lower():
-                    cur_type = key_header
-            if cur_type is None:
+        learn = matcher.fixed_layout
+        if learn:
+            fingerprint = LayoutTemplate.fingerprint(inp_lines)
+            template = self.get_layout_template(matcher, fingerprint, inp_lines)
+            if template is not None:
+                self.read_records(out, inp_lines, template)
+                return out
+            binary = {}
+            records = []
+
+        cur_header = None
+        for i, line in enumerate(inp_lines):
+            lowered = line.lower()
+            header = find_header(lowered)
+            if header is not None:
+                cur_header = header
+            if cur_header is None:
                 continue
-            add_func = headers[cur_type].get('func', self.add_score_to_dict)
-            args = headers[cur_type].get('args', [])
-            kwargs = headers[cur_type].get('kwargs', {})
-            add_func(out, line, *args, **kwargs)
+            add_func, args, kwargs = entries[cur_header]
+            if add_func is None:
+                if not learn:
+                    add_score(out, line, *args, lowered_line=lowered, **kwargs)
+                    continue
+                before = len(out.get(args[0], ()))
+                add_score(out, line, *args, lowered_line=lowered, **kwargs)
+                if len(out.get(args[0], ())) > before:
+                    records.append((i, cur_header))
+                    if args[1] == 'binary':
+                        binary[i] = (line[-1], header)
+            else:
+                add_func(out, line, *args, **kwargs)
+        if learn:
+            self.add_layout_template(fingerprint, LayoutTemplate(matcher, fingerprint[1],
+                                                                 binary, records))
         return out
 
-    def calculate_score(self, score_data: dict[str, list[dict]]) -> float:
+    def read_records(self, out: dict, inp_lines: list[str], template: LayoutTemplate) -> None:
+        """
+        Adds the records of a page matching the template to out, the
+        same ones add_score_to_dict would add for the template's
+        record lines. Only the numbers, the names and (on binary
+        lines) the last character are read: the template already
+        says which lines have their keyword, apart from binary lines
+        whose last character changed.
+        """
+        matcher = template.matcher
+        if type(self).add_score_to_dict is not Parser.add_score_to_dict:
+            for i, header in template.records:
+                add_func, args, kwargs = matcher.entries[header]
+                self.add_score_to_dict(out, inp_lines[i], *args, **kwargs)
+            return
+        settings = matcher.settings
+        find_numbers = LayoutTemplate.number.findall
+        gen_assignment = self.gen_assignment
+        for i, header in template.records:
+            line = inp_lines[i]
+            setting = settings[header]
+            assignment_type = setting['assignment_type']
+            default_max = setting['default_max']
+            if setting['score_type'] == 'binary':
+                check_line = line if setting['exact_case'] else line.lower()
+                if setting['keyword'] not in check_line:
+                    continue
+                raw_score = 0.0 if line[-1] == setting['binary_x_string'] else 1.0
+                default_max = 1.0
+            else:
+                all_nums = [float(num) for num in find_numbers(line)]
+                raw_score = all_nums[-1] if default_max else all_nums[-2]
+                if not default_max: default_max = all_nums[-1]
+            delimiter = setting['delimiter']
+            name = line.split(delimiter)[0] if delimiter in line else assignment_type
+            out.setdefault(assignment_type, []).append(gen_assignment(
+                (raw_score, default_max), assignment_type, name))
+
+    def parse_incremental(self, inp_lines: list[str],
+                          previous: Optional[PageState] = None) -> PageState:
+        """
+        Same as parse_html, but keeps what is needed to re-grade the
+        page cheaply next time. Given the PageState of an earlier
+        version of the page, the lines are diffed against it and only
+        the changed ones are parsed again; the rest reuse their old
+        records. The score_data of the returned state is exactly what
+        parse_html would return.
+
+        A line is reused only if it is unchanged and the header active
+        before it is the same as last time, since that is all its
+        records depend on. Headers with a custom func may depend on
+        anything, so parsers using them are always parsed in full.
+
+        The category averages of the earlier state are kept for the
+        categories that gained and lost no records (see PageState).
+        """
+        matcher = self.get_header_matcher()
+        find_header = matcher.find
+        entries = matcher.entries
+        add_score = self.add_score_to_dict
+
+        # kept, so the caller changing its list can't break the next diff
+        inp_lines = tuple(inp_lines)
+        if any(add_func is not None for add_func, args, kwargs in entries):
+            return PageState(inp_lines, None, None, self.parse_html(inp_lines))
+
+        # which old line (if any) each new line is a copy of
+        old_index = [None] * len(inp_lines)
+        if previous is not None and previous.line_records is not None:
+            old_lines = previous.lines
+            # most edits touch a few rows, so only diff the middle part
+            start = 0
+            end_old, end_new = len(old_lines), len(inp_lines)
+            while (start < end_old and start < end_new
+                   and old_lines[start] == inp_lines[start]):
+                old_index[start] = start
+                start += 1
+            while (end_old > start and end_new > start
+                   and old_lines[end_old - 1] == inp_lines[end_new - 1]):
+                end_old -= 1
+                end_new -= 1
+                old_index[end_new] = end_old
+            diff = difflib.SequenceMatcher(None, old_lines[start:end_old],
+                                               inp_lines[start:end_new], autojunk=False)
+            for tag, i1, i2, j1, j2 in diff.get_opcodes():
+                if tag == 'equal':
+                    for k in range(i2 - i1):
+                        old_index[start + j1 + k] = start + i1 + k
+            reused = [False] * len(old_lines)
+        else:
+            previous = None
+        # categories whose records changed, so their averages are stale
+        changed = set()
+
+        line_headers = []
+        line_records = []
+        cur_header = None
+        for j, line in enumerate(inp_lines):
+            i = old_index[j]
+            if i is not None:
+                old_header = previous.line_headers[i - 1] if i else None
+                if old_header == cur_header:
+                    reused[i] = True
+                    cur_header = previous.line_headers[i]
+                    line_headers.append(cur_header)
+                    line_records.append(previous.line_records[i])
+                    continue
+            lowered = line.lower()
+            header = find_header(lowered)
+            if header is not None:
+                cur_header = header
+            line_headers.append(cur_header)
+            if cur_header is None:
+                line_records.append(())
+                continue
+            line_out = {}
+            add_func, args, kwargs = entries[cur_header]
+            add_score(line_out, line, *args, lowered_line=lowered, **kwargs)
+            records = tuple(record for category_data in line_out.values()
+                            for record in category_data)
+            line_records.append(records)
+            for record in records:
+                changed.add(record.assignment_type)
+
+        averages = {}
+        if previous is not None:
+            for i, records in enumerate(previous.line_records):
+                if reused[i]: continue
+                for record in records:
+                    changed.add(record.assignment_type)
+            # reused lines keep their order, so the other categories
+            # have the same records in the same order as before
+            averages = {key: average for key, average in previous.averages.items()
+                        if key[0] not in changed}
+
+        score_data = {}
+        for records in line_records:
+            for record in records:
+                score_data.setdefault(record.assignment_type, []).append(record)
+        return PageState(inp_lines, line_headers, line_records, score_data, averages)
+
+    def score_incremental(self, state: PageState) -> dict:
         """
-        To be implemented by each parser. Computes a cumulative score
-        and returns a float (out of 10.0).
+        Same as calculate_score(state.score_data), but reuses the
+        category averages the state already has, and saves the ones
+        it calculates in it.
+        """
+        by_category = {}
+        for category in self.assignment_types:
+            if category not in state.score_data: continue
+            key = (category, self.drop_lowest.get(category, 0),
+                   self.normalize_each.get(category, True))
+            average = state.averages.get(key)
+            if average is None:
+                average = self.calculate_category_average(category, state.score_data[category])
+                state.averages[key] = average
+            by_category[category] = average
+        return self.combine_categories(state.score_data, by_category)
+
+    def calculate_category_averages(self, score_data: dict[str, list[Assignment]]) -> dict[str, float]:
+        """
+        Returns the average of each category in self.assignment_types
+        that appears in score_data, as floats out of 1.
+        """
+        by_category = {}
+        for category in self.assignment_types:
+            if category not in score_data: continue
+            by_category[category] = self.calculate_category_average(
+                    category, score_data[category])
+        return by_category
+
+    def calculate_category_average(self, category: str, category_data) -> float:
+        """
+        Returns the average of one category, with its lowest
+        assignments dropped if drop_lowest says so.
+        """
+        normalize_each = self.normalize_each.get(category, True)
+        drop = self.drop_lowest.get(category, 0)
+        if drop > 0:
+            return category_average(category_data, drop, normalize_each)
+        return self.calculate_average_in_category(category_data, normalize_each)
+
+    def get_schemes(self, score_data: dict[str, list[Assignment]]) -> tuple[dict[str, float]]:
+        """
+        To be implemented by each parser. Returns the grading schemes
+        of the class, each a dictionary mapping assignment categories
+        to weights; only categories present in score_data count.
         """
         pass
 
-    def calculate_average_in_category(self, category_data: list[dict],
+    def combine_categories(self, score_data: dict[str, list[Assignment]],
+                           by_category: dict[str, float]) -> dict:
+        """
+        To be implemented by each parser. Given the parsed data and
+        the average of each category, weighs the categories into the
+        out_score dictionary returned by calculate_score.
+        """
+        pass
+
+    def calculate_score(self, score_data: dict[str, list[Assignment]]) -> dict:
+        """
+        Computes the cumulative score given a score dictionary; see
+        combine_categories in each parser for the format.
+        """
+        by_category = self.calculate_category_averages(score_data)
+        return self.combine_categories(score_data, by_category)
+
+    def calculate_average_in_category(self, category_data,
                                       normalize_each: Optional[bool] = True) -> float:
         """
         Given a grading category (labs, psets, etc.), returns the average
         score out of each assignment in the category as a float out of 1.
 
         Args:
-            `category_data`: a list of dictionaries where each dictionary describes
-                an assignment and its score
+            `category_data`: a list of Assignment records (or dictionaries) 
+                describing each assignment and its score, or the category
+                already in columnar form as a CategoryColumns
         Kwargs:
             `normalize_each`: boolean, if True will set the max score to 1 (i.e. equal)
                 before adding up all the points.
 
         Returns: a float representing the average score out of 1. 
         """
-        total_earned, total_possible = 0, 0
-
-        def add_to_scores(score_pair: tuple[float]) -> None:
-            """
-            Adds the score to the total. Score_pair is a tuple with
-            first element earned and second point possible.
-            """
-            earned, possible = score_pair
-            if normalize_each:
-                earned = earned / possible
-                possible = 1
-            nonlocal total_earned, total_possible
-            total_earned += earned
-            total_possible += possible
-            return
-
-        for assignment in category_data:
-            add_to_scores(assignment['score'])
-
-        return total_earned / total_possible
+        if isinstance(category_data, CategoryColumns):
+            return category_data.average(normalize_each)
+        return average_of_scores(scores_of(category_data), normalize_each)
@@ -4,7 +4,7 @@ Parser for 6.200: Circuits and Electronics.
 
 from .request import CatsoopRequests
 from .base_parser import Parser
-import pprint
+from .policy import best_of, scheme_scores
 
 class CircuitsParser(Parser):
     """
@@ -36,18 +36,11 @@ class CircuitsParser(Parser):
 
         super().__init__()
 
-    def calculate_score(self, score_data):
+    def get_schemes(self, score_data):
         """
-        Computes the cumulative score given a score dictionary.
-        Returns a dictionary of:
-            best_score: tuple of two floats, the true score and the possible score
-                At the end of the semester, possible score should be 100
-            alt_scores: tuple of tuples of floats, other scores that you may
-                have (some classes use multiple schemes and pick
-                the best one)
-            by_category: dictionary mapping assignment categories to grade floats
+        Returns the two grading schemes, as dictionaries mapping
+        categories to weights. The better of the two counts.
         """
-        output = {'by_category': {}}
         scheme_1 = {'midterm': 25,
                     'final': 40,
                     'pset': 15,
@@ -59,43 +52,31 @@ class CircuitsParser(Parser):
                     'lab': 15,
                     'nanoquiz': 5,
                     'participation': 5}
+        return (scheme_1, scheme_2)
 
-        schemes = (scheme_1, scheme_2)
-        scores = []
-
-        by_category = {}
-        for category in self.assignment_types:
-            if category not in score_data: continue
-            frac = self.calculate_average_in_category(score_data[category])
-            by_category[category] = frac
-
-        # we need to test both schemes
-        for scheme_num, scheme in enumerate(schemes):
-            earned, possible = 0, 0
-            for category, weight in scheme.items():
-                if category not in score_data: continue
-                frac = by_category[category]
-                delta_earned = weight*frac
-                delta_possible = weight
-                earned += delta_earned
-                possible += delta_possible
-            scores.append((earned, possible))
-
-        # figure out which is better
-        frac_1 = scores[0][0] / scores[0][1]
-        frac_2 = scores[1][0] / scores[1][1]
-
-        if frac_1 >= frac_2:
-            output['best_score'] = scores[0]
-            output['alt_scores'] = (scores[1],)
-        else:
-            output['best_score'] = scores[1]
-            output['alt_scores'] = (scores[0],)
+    def combine_categories(self, score_data, by_category):
+        """
+        Computes the cumulative score given a score dictionary and
+        the average of each category in it.
+        Returns a dictionary of:
+            best_score: tuple of two floats, the true score and the possible score
+                At the end of the semester, possible score should be 100
+            alt_scores: tuple of tuples of floats, other scores that you may
+                have (some classes use multiple schemes and pick
+                the best one)
+            by_category: dictionary mapping assignment categories to grade floats
+        """
+        output = {'by_category': {}}
+        schemes = self.get_schemes(score_data)
+        # each scheme in turn, then whichever is better
+        scores = scheme_scores(schemes, by_category)
+        output['best_score'], output['alt_scores'] = best_of(scores)
         output['by_category'] = by_category
         return output
 
 
 if __name__ == "__main__":
+    import pprint
     with open('../token.txt', 'r') as f:
         code_1, token_1 = f.readline().split(' ')
         code_2, token_2 = f.readline().split(' ')
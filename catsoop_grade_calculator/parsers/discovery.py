@@ -0,0 +1,234 @@
+"""
+Finds the progress page of each class for the current term, so that
+a new semester doesn't need a new release with new base_urls.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+import datetime
+import json
+import math
+import os
+import threading
+import time
+
+class TermResolver():
+    """
+    Guesses the progress page urls of the recent terms of a class from
+    its template in url_templates, asks the host which of them exist
+    (all at once, with HEAD requests), and picks the newest one.
+
+    Results are saved in a JSON file and reused until they are ttl
+    seconds old or a new term starts, so the probing happens about
+    once per term rather than once per request. Classes it can't
+    resolve fall back to CatsoopRequests.base_urls.
+
+    Install one with `CatsoopRequests.resolver = TermResolver()`.
+    """
+
+    # fields: season ('fall' / 'spring'), S ('F' / 'S'), yy ('24'), yyyy ('2024')
+    url_templates = {'6.101': 'https://py.mit.edu/{season}{yy}/progress',
+                     '6.200': 'https://circuits.mit.edu/{S}{yy}/progress'}
+
+    # seconds to wait before probing again after nothing answered
+    retry_interval = 300
+
+    # retries of each probe, fewer than for pages: a dead candidate is common
+    probe_retries = 1
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 7 * 24 * 3600,
+                 terms_back: int = 3, timeout: float = 5.0,
+                 url_templates: Optional[dict[str, str]] = None) -> None:
+        """
+        Path is the JSON file the results are saved in (see
+        default_path). terms_back is how many terms before the current
+        one are tried, and timeout is in seconds per probe.
+        """
+        if path is None: path = TermResolver.default_path()
+        self.path = path
+        self.ttl = ttl
+        self.terms_back = terms_back
+        self.timeout = timeout
+        if url_templates is not None: self.url_templates = url_templates
+        self.resolved = self.load()
+        # when discovery last failed for each class, see retry_interval
+        self.failed_at = {}
+        # class code -> Future of the discovery running for it
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def default_path() -> str:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(base, 'catsoop_grade_calculator', 'urls.json')
+
+    @staticmethod
+    def current_term(today: Optional[datetime.date] = None) -> tuple[int, str]:
+        """
+        Returns (year, season) of the term going on at a date (today
+        by default). January still counts as the fall before, since
+        that is when its final grades come out, and the summer counts
+        as the spring.
+        """
+        if today is None: today = datetime.date.today()
+        if today.month >= 8:
+            return today.year, 'fall'
+        if today.month == 1:
+            return today.year - 1, 'fall'
+        return today.year, 'spring'
+
+    @staticmethod
+    def candidate_terms(today: Optional[datetime.date] = None,
+                        terms_back: int = 3) -> list[tuple[int, str]]:
+        """
+        Returns the current term and the terms_back terms before it,
+        newest first. Upcoming terms are left out on purpose: their
+        pages often exist before they start.
+        """
+        year, season = TermResolver.current_term(today)
+        terms = [(year, season)]
+        for _ in range(terms_back):
+            if season == 'fall':
+                season = 'spring'
+            else:
+                year, season = year - 1, 'fall'
+            terms.append((year, season))
+        return terms
+
+    @staticmethod
+    def term_name(term: tuple[int, str]) -> str:
+        year, season = term
+        return f"{season}{year}"
+
+    def candidate_urls(self, class_code: str,
+                       today: Optional[datetime.date] = None) -> list[str]:
+        """
+        Returns the possible progress page urls of a class, newest
+        first, or an empty list if it has no url template.
+        """
+        template = self.url_templates.get(class_code)
+        if template is None:
+            return []
+        return [template.format(season=season, S=season[0].upper(),
+                                yy=f"{year % 100:02d}", yyyy=str(year))
+                for year, season in TermResolver.candidate_terms(today, self.terms_back)]
+
+    def probe(self, url: str) -> bool:
+        """
+        Returns whether the page at url exists (answers 2xx, not a
+        redirect), without downloading it. Hosts that don't allow HEAD
+        are asked for the first byte of the page instead. Probes go
+        through CatsoopRequests.scheduler like every other request to
+        the host, with at most probe_retries retries.
+        """
+        import requests
+        from .request import CatsoopRequests
+        session = CatsoopRequests.get_session(url)
+        host = CatsoopRequests.get_host(url)
+        scheduler = CatsoopRequests.scheduler
+        try:
+            response = scheduler.request(session, 'HEAD', host, url,
+                                         max_retries=self.probe_retries,
+                                         timeout=self.timeout, allow_redirects=False)
+            if response.status_code in (405, 501):
+                response = scheduler.request(session, 'GET', host, url,
+                                             max_retries=self.probe_retries,
+                                             timeout=self.timeout, allow_redirects=False,
+                                             headers={'Range': 'bytes=0-0'}, stream=True)
+                response.close()
+        except requests.RequestException:
+            return False
+        return 200 <= response.status_code < 300
+
+    def discover(self, class_code: str,
+                 today: Optional[datetime.date] = None) -> Optional[str]:
+        """
+        Probes every candidate url of a class at once. Returns the
+        newest one that exists, or None if none do.
+        """
+        urls = self.candidate_urls(class_code, today)
+        if not urls:
+            return None
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            found = list(executor.map(self.probe, urls))
+        return next((url for url, exists in zip(urls, found) if exists), None)
+
+    def resolve(self, class_code: str) -> Optional[str]:
+        """
+        Returns the progress page url of a class for the current
+        term, from the saved results if they are still fresh, or else
+        by discovering it. Returns None if it can't be found.
+
+        The probing happens outside the lock, so other classes resolve
+        meanwhile; callers wanting a class that is already being
+        discovered wait for that discovery instead of starting theirs.
+        """
+        if class_code not in self.url_templates:
+            return None
+        with self.lock:
+            now = time.time()
+            term = TermResolver.term_name(TermResolver.current_term())
+            entry = self.resolved.get(class_code)
+            old_url = None if entry is None else entry['url']
+            if entry is not None and entry['term'] == term \
+                    and now - entry['resolved_at'] < self.ttl:
+                return old_url
+            if now - self.failed_at.get(class_code, -math.inf) < self.retry_interval:
+                return old_url
+            future = self.in_flight.get(class_code)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.in_flight[class_code] = future
+        if not leader:
+            return future.result()
+
+        try:
+            url = self.discover(class_code)
+            with self.lock:
+                if url is None:
+                    # nothing answered (e.g. offline): keep what we had for now
+                    self.failed_at[class_code] = time.time()
+                    url = old_url
+                else:
+                    self.resolved[class_code] = {'url': url, 'term': term,
+                                                 'resolved_at': time.time()}
+                    self.save()
+            future.set_result(url)
+            return url
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[class_code]
+
+    def load(self) -> dict[str, dict]:
+        """
+        Reads the saved results, leaving out entries that don't have
+        the shape save writes (a hand-edited or older file).
+        """
+        try:
+            with open(self.path, 'r') as f:
+                loaded = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(loaded, dict):
+            return {}
+        return {class_code: entry for class_code, entry in loaded.items()
+                if TermResolver.valid_entry(entry)}
+
+    @staticmethod
+    def valid_entry(entry) -> bool:
+        return isinstance(entry, dict) and isinstance(entry.get('url'), str) \
+                and isinstance(entry.get('term'), str) \
+                and isinstance(entry.get('resolved_at'), (int, float)) \
+                and not isinstance(entry['resolved_at'], bool)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # write then rename, so readers never see half a file
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.resolved, f)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,106 @@
+"""
+Grading policies: picking the best of any number of weighting
+schemes, and dropping the lowest k assignments of a category.
+"""
+
+from .records import CategoryColumns, average_of_scores, scores_of
+from typing import Optional
+import math
+
+def scheme_scores(schemes: tuple[dict[str, float]],
+                  by_category: dict[str, float]) -> list[tuple[float, float]]:
+    """
+    Returns (earned, possible) under each scheme: the sum of its
+    weights times the category averages, and the sum of its weights.
+    Categories missing from by_category count for nothing under any
+    scheme.
+    """
+    scores = []
+    for scheme in schemes:
+        earned, possible = 0, 0
+        # summed in the scheme's own order, as the parsers always have
+        for category, weight in scheme.items():
+            if category not in by_category: continue
+            earned += weight * by_category[category]
+            possible += weight
+        scores.append((earned, possible))
+    return scores
+
+def best_of(scores: list[tuple[float, float]]) -> tuple[tuple[float, float],
+                                                       tuple[tuple[float, float], ...]]:
+    """
+    Given (earned, possible) under each scheme, returns the best score
+    and the others (in scheme order). Ties go to the earlier scheme.
+    Schemes with nothing possible (none of their categories graded
+    yet) can't be best; raises ValueError if no scheme has anything.
+    """
+    best = None
+    best_frac = -math.inf
+    for i, (earned, possible) in enumerate(scores):
+        if not possible: continue
+        frac = earned / possible
+        if best is None or frac > best_frac:
+            best, best_frac = i, frac
+    if best is None:
+        raise ValueError("None of the grading schemes has a graded category")
+    return scores[best], tuple(scores[:best] + scores[best + 1:])
+
+def ratio(earned: float, possible: float) -> float:
+    if possible:
+        return earned / possible
+    return math.inf if earned > 0 else 0.0
+
+def drop_lowest(columns: CategoryColumns, k: int,
+                normalize_each: Optional[bool] = True) -> list[int]:
+    """
+    Returns the indices (in order) of the assignments to keep so that
+    the category average is as high as possible with k of them
+    dropped. At least one assignment is always kept.
+
+    With normalize_each, the average is of each assignment's fraction,
+    so the k lowest fractions go. Otherwise it is total earned over
+    total possible, and which assignments hurt most depends on the
+    rest; that is solved exactly with Dinkelbach's method for
+    fractional programming: given the best ratio q found so far, keep
+    the assignments with the largest earned - q * possible, which can
+    only raise the ratio, until it stops rising. This takes a handful
+    of sorts rather than trying every subset.
+    """
+    earned, possible = columns.earned, columns.possible
+    n = len(earned)
+    k = min(k, n - 1)
+    if k <= 0:
+        return list(range(n))
+    keep = n - k
+    if normalize_each:
+        order = sorted(range(n), key=lambda i: earned[i] / possible[i], reverse=True)
+        return sorted(order[:keep])
+
+    best, q = None, -math.inf
+    while True:
+        slope = q if best is not None else 0.0
+        order = sorted(range(n), key=lambda i: earned[i] - slope * possible[i],
+                       reverse=True)
+        kept = sorted(order[:keep])
+        kept_ratio = ratio(math.fsum(earned[i] for i in kept),
+                           math.fsum(possible[i] for i in kept))
+        if kept_ratio <= q:
+            return best
+        best, q = kept, kept_ratio
+
+def category_average(category_data, drop: int = 0,
+                     normalize_each: Optional[bool] = True) -> float:
+    """
+    Same as Parser.calculate_average_in_category, after dropping the
+    `drop` assignments that raise the average the most.
+    """
+    columns = category_data
+    if not isinstance(columns, CategoryColumns):
+        if drop <= 0:
+            return average_of_scores(scores_of(category_data), normalize_each)
+        columns = CategoryColumns.from_assignments(category_data)
+    if drop > 0:
+        kept = drop_lowest(columns, drop, normalize_each)
+        columns = CategoryColumns([columns.earned[i] for i in kept],
+                                  [columns.possible[i] for i in kept])
+    return columns.average(normalize_each)
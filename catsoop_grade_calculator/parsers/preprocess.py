@@ -0,0 +1,291 @@
+"""
+Streaming preprocessor for the progress pages.
+
+Turns the raw html of a page into lines of text without building
+a DOM. The output matches what BeautifulSoup's html.parser backend
+gives for get_text() once script and style elements are removed,
+including its whitespace handling, so it can be swapped in for the
+old preprocessing path.
+"""
+
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Optional
+import codecs
+import re
+
+def _build_entity_table() -> dict[str, str]:
+    """
+    Named entities as BeautifulSoup resolves them: the trailing
+    semicolon is dropped, and the first name in sorted order wins.
+    """
+    table = {}
+    for name, character in sorted(html5.items()):
+        if name.endswith(';'):
+            name = name[:-1]
+        table.setdefault(name, character)
+    return table
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the text of an html document, skipping script and style
+    contents. Call take_lines() after each feed() to get the lines of
+    text completed so far; close() returns the rest.
+    """
+
+    entities = _build_entity_table()
+
+    # these mirror the settings of BeautifulSoup's html tree builder
+    empty_element_tags = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img',
+                          'input', 'keygen', 'link', 'menuitem', 'meta',
+                          'param', 'source', 'track', 'wbr', 'basefont',
+                          'bgsound', 'command', 'frame', 'image', 'isindex',
+                          'nextid', 'spacer'}
+    preserve_whitespace_tags = {'pre', 'textarea'}
+    # strings inside these tags are not part of the page text
+    string_container_tags = {'rt', 'rp', 'style', 'script', 'template'}
+    ascii_spaces = '\x20\x0a\x09\x0c\x0d'
+
+    decimal_ref = re.compile('^([0-9]+)(.*)')
+    hex_ref = re.compile('^([0-9a-f]+)(.*)')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.open_tags = []
+        self.open_counts = {}
+        self.preserve_depth = 0
+        self.container_depth = 0
+        self.closed_empty = []
+        self.pieces = []
+        self.partial_line = []
+        self.lines = []
+        self.stalled = False
+
+    def feed(self, data: str) -> None:
+        """
+        BeautifulSoup feeds the whole page at once, and html.parser
+        gives up on the rest of a feed at a malformed character
+        reference (see handle_data), leaving it for close(). Once that
+        has happened here, the rest is only buffered, so a page fed in
+        pieces still parses like one fed whole.
+        """
+        if self.stalled:
+            self.rawdata += data
+            return
+        super().feed(data)
+
+    def take_lines(self) -> list[str]:
+        """
+        Returns the lines of text completed since the last call.
+        """
+        lines = self.lines
+        self.lines = []
+        return lines
+
+    def close(self) -> list[str]:
+        """
+        Finishes parsing and returns the remaining lines, always
+        including the (possibly empty) last one.
+        """
+        super().close()
+        self.flush()
+        self.lines.append(''.join(self.partial_line))
+        self.partial_line = []
+        return self.take_lines()
+
+    def emit(self, text: str) -> None:
+        """
+        Adds text to the output, splitting it into lines.
+        """
+        if '\n' not in text:
+            self.partial_line.append(text)
+            return
+        parts = text.split('\n')
+        self.partial_line.append(parts[0])
+        self.lines.append(''.join(self.partial_line))
+        self.lines.extend(parts[1:-1])
+        self.partial_line = [parts[-1]]
+
+    def flush(self, cdata: bool = False) -> None:
+        """
+        Ends the current run of text. Runs made only of whitespace
+        collapse to a single space or newline (outside of pre and
+        textarea), and runs inside script, style, etc. are dropped.
+        """
+        if not self.pieces:
+            return
+        text = ''.join(self.pieces)
+        self.pieces = []
+        if not self.preserve_depth and not text.strip(self.ascii_spaces):
+            text = '\n' if '\n' in text else ' '
+        if cdata or not self.container_depth:
+            self.emit(text)
+
+    def push(self, tag: str) -> None:
+        self.open_tags.append(tag)
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in self.preserve_whitespace_tags: self.preserve_depth += 1
+        if tag in self.string_container_tags: self.container_depth += 1
+
+    def pop_to(self, tag: str) -> None:
+        """
+        Closes the most recent open tag with this name, along with
+        everything opened after it. Does nothing if it isn't open.
+        """
+        if not self.open_counts.get(tag):
+            return
+        while True:
+            popped = self.open_tags.pop()
+            self.open_counts[popped] -= 1
+            if popped in self.preserve_whitespace_tags: self.preserve_depth -= 1
+            if popped in self.string_container_tags: self.container_depth -= 1
+            if popped == tag:
+                return
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag in self.empty_element_tags:
+            # closed right away; a matching end tag later is ignored
+            self.closed_empty.append(tag)
+            return
+        self.push(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_empty:
+            self.closed_empty.remove(tag)
+            return
+        self.flush()
+        self.pop_to(tag)
+
+    def handle_data(self, data):
+        if data == '&#' and self.cdata_elem is None:
+            # html.parser skips the '&#' of a reference it can't read
+            # (when a ';' follows somewhere) and stops the feed there
+            self.stalled = True
+        self.pieces.append(data)
+
+    def handle_charref(self, name):
+        base, reg = 10, self.decimal_ref
+        if name.startswith('x') or name.startswith('X'):
+            name = name[1:]
+            base, reg = 16, self.hex_ref
+        number, extra = None, ''
+        try:
+            number = int(name, base)
+        except ValueError:
+            match = reg.search(name)
+            if match is not None:
+                number = int(match.group(1), base)
+                extra = match.group(2)
+        if number is None:
+            self.pieces.append('')
+            self.pieces.append(name)
+            return
+        self.pieces.append(self.dereference(number))
+        self.pieces.append(extra)
+
+    @staticmethod
+    def dereference(number: int) -> str:
+        """
+        Converts the number of a character reference to a character,
+        following the html spec (windows-1252 for C1 controls).
+        """
+        if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+            return '\ufffd'
+        if 0x80 <= number <= 0x9f:
+            try:
+                return bytes([number]).decode('cp1252')
+            except UnicodeDecodeError:
+                pass
+        return chr(number)
+
+    def handle_entityref(self, name):
+        character = self.entities.get(name)
+        self.pieces.append(character if character is not None else '&' + name)
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        self.flush()
+        if data.upper().startswith('CDATA['):
+            self.pieces.append(data[len('CDATA['):])
+            self.flush(cdata=True)
+
+class StreamingPreprocessor():
+    """
+    Incremental version of CatsoopRequests.preprocess_data. Feed it
+    the page in chunks (str, or bytes along with an encoding) and it
+    returns the cleaned lines as soon as they are complete.
+    """
+
+    # characters str.splitlines() treats as line boundaries
+    line_breaks = '\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029'
+
+    def __init__(self, kept_strs: list[str], encoding: Optional[str] = None):
+        self.kept_strs = kept_strs
+        self.decoder = None
+        if encoding is not None:
+            try:
+                decoder_class = codecs.getincrementaldecoder(encoding)
+            except LookupError:
+                decoder_class = codecs.getincrementaldecoder('utf-8')
+            self.decoder = decoder_class(errors='replace')
+        self.buffer = ''
+        self.started = False
+        self.fed_any = False
+        self.extractor = TextExtractor()
+
+    def feed_line(self, line: str) -> None:
+        """
+        Filters one line of html, passing it on if it is kept.
+        """
+        if not self.started:
+            if "<h" not in line: # wait for first header
+                return
+            self.started = True
+        for kept in self.kept_strs:
+            if kept in line:
+                # kept lines are joined by newlines, like in the old path
+                self.extractor.feed('\n' + line if self.fed_any else line)
+                self.fed_any = True
+                return
+
+    def feed(self, chunk) -> list[str]:
+        """
+        Adds a chunk of the page, returning any completed lines of text.
+        """
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk)
+        if not chunk:
+            return []
+        parts = (self.buffer + chunk).splitlines(keepends=True)
+        # the last part may continue in the next chunk (a trailing \r
+        # may be the first half of a \r\n)
+        last = parts[-1]
+        if last[-1] not in self.line_breaks or last[-1] == '\r':
+            self.buffer = parts.pop()
+        else:
+            self.buffer = ''
+        for part in parts:
+            self.feed_line(part.splitlines()[0])
+        return self.extractor.take_lines()
+
+    def close(self) -> list[str]:
+        """
+        Finishes the page and returns the remaining lines of text.
+        """
+        rest = self.decoder.decode(b'', final=True) if self.decoder else ''
+        for line in (self.buffer + rest).splitlines():
+            self.feed_line(line)
+        self.buffer = ''
+        return self.extractor.close()
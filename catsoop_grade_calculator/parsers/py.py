@@ -4,7 +4,6 @@ Parser for 6.101: Fundamentals of Programming (Python).
 
 from .base_parser import Parser
 from .request import CatsoopRequests
-import pprint
 
 class PyParser(Parser):
     """
@@ -38,9 +37,26 @@ class PyParser(Parser):
         super().__init__()
         return
 
-    def calculate_score(self, score_data):
+    def get_schemes(self, score_data):
         """
-        Computes the cumulative score given a score dictionary.
+        Returns the one grading scheme, as a dictionary mapping
+        categories to weights, using the weights scraped from the
+        "will count for" lines of the page.
+        """
+        weights_raw = score_data['weights']
+        weights = {'participation': 0, 'midterm': 0, 'final': 0, 'lab': 50}
+        for weight_record in weights_raw:
+            for weight_key in weights:
+                if weight_key in weight_record.assignment_name:
+                    weights[weight_key] = weight_record.score[0]
+        weights['reading'] = weights['participation'] / 2
+        weights['recitation'] = weights['participation'] / 2
+        return (weights,)
+
+    def combine_categories(self, score_data, by_category):
+        """
+        Computes the cumulative score given a score dictionary and
+        the average of each category in it.
         Returns a dictionary of:
             best_score: tuple of two floats, the true score and the possible score
                 At the end of the semester, possible score should be 100
@@ -51,23 +67,10 @@ class PyParser(Parser):
         """
 
         # get the auto-calculated weights
-        weights_raw = score_data['weights']
-        weights = {'participation': 0, 'midterm': 0, 'final': 0, 'lab': 50}
-        for weight_dict in weights_raw:
-            for weight_key in weights:
-                if weight_key in weight_dict['assignment_name']:
-                    weights[weight_key] = weight_dict['score'][0]
-        weights['reading'] = weights['participation'] / 2
-        weights['recitation'] = weights['participation'] / 2
-
-        # get scores by assignment category 
-        # note that 'weights' isn't in self.assignment_types
-        by_category = {}
-        for category in self.assignment_types:
-            if category not in score_data: continue
-            frac = self.calculate_average_in_category(score_data[category])
-            by_category[category] = frac
+        weights, = self.get_schemes(score_data)
 
+        # note that 'weights' isn't in self.assignment_types,
+        # so it has no entry in by_category
         earned, possible = 0, 0
         for category, weight in weights.items():
             if category not in score_data: continue
@@ -85,6 +88,7 @@ class PyParser(Parser):
 
 
 if __name__ == "__main__":
+    import pprint
     with open('../token.txt', 'r') as f:
         code_1, token_1 = f.readline().strip().split(' ')
         code_2, token_2 = f.readline().strip().split(' ')
@@ -0,0 +1,151 @@
+"""
+Compact records for the assignments scraped from a progress page.
+"""
+
+from array import array
+from collections.abc import Mapping
+from operator import itemgetter
+from typing import Iterable, Optional
+import sys
+
+class Assignment(Mapping):
+    """
+    One graded assignment. Uses __slots__ and interned strings, since
+    a cohort run keeps many thousands of these around.
+
+    It still reads like the dictionaries parsers used to return
+    (record['score'], record.get('sub_assignment'), dict(record)), so
+    code written against the old format keeps working.
+    """
+
+    __slots__ = ('score', 'assignment_type', 'assignment_name', 'sub_assignment')
+
+    def __init__(self, score: tuple[float, float], assignment_type: str,
+                 assignment_name: str, sub_assignment: Optional[str] = None):
+        self.score = score
+        self.assignment_type = sys.intern(assignment_type)
+        self.assignment_name = sys.intern(assignment_name)
+        self.sub_assignment = sub_assignment
+
+    def __getitem__(self, key: str):
+        if key in Assignment.__slots__:
+            value = getattr(self, key)
+            if value is not None or key != 'sub_assignment':
+                return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'score'
+        yield 'assignment_type'
+        yield 'assignment_name'
+        if self.sub_assignment is not None:
+            yield 'sub_assignment'
+
+    def __len__(self) -> int:
+        return 3 if self.sub_assignment is None else 4
+
+    def __repr__(self) -> str:
+        return f"Assignment({dict(self)!r})"
+
+class CategoryColumns():
+    """
+    The scores of one assignment category stored column-wise, as an
+    array of points earned and an array of points possible. Dropping
+    assignments picks from these by index; plain averages are taken
+    straight from the records (see average_of_scores), since building
+    the arrays costs more than the sums themselves.
+    """
+
+    __slots__ = ('earned', 'possible')
+
+    def __init__(self, earned: Iterable[float] = (), possible: Iterable[float] = ()):
+        self.earned = array('d', earned)
+        self.possible = array('d', possible)
+
+    @staticmethod
+    def from_assignments(category_data: list) -> 'CategoryColumns':
+        """
+        Builds the columns from a list of Assignment records (or of
+        old-style assignment dictionaries).
+        """
+        scores = scores_of(category_data)
+        return CategoryColumns(map(itemgetter(0), scores), map(itemgetter(1), scores))
+
+    def __len__(self) -> int:
+        return len(self.earned)
+
+    def append(self, score: tuple[float, float]) -> None:
+        earned, possible = score
+        self.earned.append(earned)
+        self.possible.append(possible)
+
+    def average(self, normalize_each: Optional[bool] = True) -> float:
+        """
+        Returns the average score out of 1, as in
+        Parser.calculate_average_in_category.
+        """
+        return average_of_scores(zip(self.earned, self.possible), normalize_each)
+
+def scores_of(category_data: list) -> list[tuple[float, float]]:
+    """
+    Returns the (earned, possible) pairs of a list of Assignment
+    records (or of old-style assignment dictionaries).
+    """
+    try:
+        return [record.score for record in category_data]
+    except AttributeError:
+        return [record['score'] for record in category_data]
+
+def average_of_scores(scores: Iterable[tuple[float, float]],
+                      normalize_each: Optional[bool] = True) -> float:
+    """
+    Returns the average of (earned, possible) pairs out of 1. The sums
+    are taken left to right, one assignment at a time, so the result
+    is the same float the old dictionary-based code gave.
+    """
+    total_earned, total_possible = 0, 0
+    if normalize_each:
+        for earned, possible in scores:
+            total_earned += earned / possible
+            total_possible += 1
+        return total_earned / total_possible
+    for earned, possible in scores:
+        total_earned += earned
+        total_possible += possible
+    return total_earned / total_possible
+
+class PageState():
+    """
+    What is kept of a parsed page for re-grading it incrementally
+    (see Parser.parse_incremental): its preprocessed lines, the
+    header that was active at each line, the records each line
+    produced, the resulting score_data, and the averages already
+    calculated for its categories.
+
+    averages maps (category, drop, normalize_each) to the category's
+    average with those settings (see Parser.calculate_category_average).
+    The next version of the page keeps the averages of the categories
+    whose records all come from unchanged lines, in the same order, so
+    those don't have to be summed again.
+    """
+
+    __slots__ = ('lines', 'line_headers', 'line_records', 'score_data', 'averages')
+
+    def __init__(self, lines: tuple[str, ...],
+                 line_headers: Optional[list[Optional[int]]],
+                 line_records: Optional[list[tuple]],
+                 score_data: dict[str, list],
+                 averages: Optional[dict[tuple, float]] = None):
+        self.lines = lines
+        self.line_headers = line_headers
+        self.line_records = line_records
+        self.score_data = score_data
+        self.averages = {} if averages is None else averages
+
+def to_columns(score_data: dict[str, list]) -> dict[str, CategoryColumns]:
+    """
+    Converts the output of Parser.parse_html into the columnar form,
+    one CategoryColumns per assignment category.
+    """
+    return {category: CategoryColumns.from_assignments(category_data)
+            for category, category_data in score_data.items()}
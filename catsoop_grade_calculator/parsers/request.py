@@ -2,11 +2,11 @@
 Requests and parses the html from CAT-SOOP.
 """
 
-import requests
-import pprint
-from bs4 import BeautifulSoup
-from typing import Optional
+import threading
+from typing import Iterable, Iterator, Optional, Union
+from urllib.parse import urlsplit
 import re
+import time
 
 # with open(token.txt, 'r') as f:
 #     token = f.readline()
@@ -18,40 +18,171 @@ class CatsoopRequests():
 
     default_kept_strs = ['<h', '<li>', '<tr><td', '<p>']
 
+    # bytes read at a time when streaming a response
+    chunk_size = 16384
+
+    # maximum number of kept-alive connections per CAT-SOOP host
+    pool_size = 16
+
+    # one pooled session per host, shared between threads
+    sessions = {}
+    sessions_lock = threading.Lock()
+
+    # (connect, read) timeout in seconds when none is given
+    default_timeout = (10, 60)
+
+    # rate limits and retries for every request, see get_scheduler
+    scheduler = None
+
+    # finds the urls of the current term when set, see discovery.py
+    resolver = None
+
+    @staticmethod
+    def get_host(url: str) -> str:
+        """
+        Given a url, returns the host it points to (e.g. `py.mit.edu`).
+        """
+        return urlsplit(url).netloc
+
+    @staticmethod
+    def get_session(url: str) -> 'requests.Session':
+        """
+        Returns the shared Session for the host of the given url,
+        creating it the first time the host is seen. Reusing the
+        session keeps the TCP/TLS connections to that host alive
+        between requests.
+        """
+        # requests is slow to import, so wait until a page is needed
+        import requests
+        import requests.adapters
+        host = CatsoopRequests.get_host(url)
+        with CatsoopRequests.sessions_lock:
+            session = CatsoopRequests.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=1, pool_maxsize=CatsoopRequests.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                CatsoopRequests.sessions[host] = session
+        return session
+
     @staticmethod
-    def request_data(token: str, class_code: Optional[str] = None, url: Optional[str] = None):
+    def get_scheduler() -> 'RequestScheduler':
+        """
+        Returns the RequestScheduler all requests go through, creating
+        one with the default settings if none was set. Assign
+        CatsoopRequests.scheduler to change the settings.
+        """
+        with CatsoopRequests.sessions_lock:
+            if CatsoopRequests.scheduler is None:
+                from .scheduler import RequestScheduler
+                CatsoopRequests.scheduler = RequestScheduler(
+                        max_concurrency=CatsoopRequests.pool_size)
+            return CatsoopRequests.scheduler
+
+    @staticmethod
+    def request_data(token: str, class_code: Optional[str] = None,
+                     url: Optional[str] = None,
+                     timeout: Optional[float] = None,
+                     stream: bool = False,
+                     headers: Optional[dict[str, str]] = None):
         """
         Requests the progress page from CAT-SOOP and returns
-        the Response object.
+        the Response object. The request goes through the pooled
+        session for the url's host, and is rate limited and retried
+        by the scheduler (see get_scheduler); timeout is in seconds
+        and None means default_timeout. If stream is True, the body
+        is not downloaded until it is read (see preprocess_response).
+        Extra request headers can be passed in headers.
+
+        Raises requests.HTTPError if the final response is an error
+        (4xx or 5xx), rather than returning a page that can't be
+        graded.
         """
         if url is None:
-            url = CatsoopRequests.base_urls[class_code]
+            url = CatsoopRequests.get_url(class_code)
+        if timeout is None: timeout = CatsoopRequests.default_timeout
         params = {'api_token': token}
-        return requests.get(url, params=params)
+        session = CatsoopRequests.get_session(url)
+        response = CatsoopRequests.get_scheduler().get(
+                session, CatsoopRequests.get_host(url), url, params=params,
+                timeout=timeout, stream=stream, headers=headers)
+        if response.status_code >= 400:
+            response.close()
+            response.raise_for_status()
+        return response
 
     @staticmethod
     def preprocess_data(inp_text: str, kept_strs: Optional[list[str]] = None) -> list[str]:
         """
         Gets rid of fluff from the start and splits into lines.
+        Only lines containing one of kept_strs are kept, and the
+        text is extracted from them with scripts and styles removed.
+        """
+        return list(CatsoopRequests.preprocess_stream([inp_text], kept_strs))
+
+    @staticmethod
+    def preprocess_stream(chunks: Iterable[Union[str, bytes]],
+                          kept_strs: Optional[list[str]] = None,
+                          encoding: Optional[str] = None) -> Iterator[str]:
+        """
+        Streaming version of preprocess_data. Chunks are consecutive
+        pieces of the page, either strings or bytes in the given
+        encoding. Yields the same lines preprocess_data would return,
+        each one as soon as it is complete.
         """
         if kept_strs is None: kept_strs = CatsoopRequests.default_kept_strs
-        lines = inp_text.splitlines()
-        out = []
-        started = False
-        for line in lines:
-            if not started:
-                if "<h" not in line: # wait for first header
-                    continue
-                started = True
-            for kept in kept_strs:
-                if kept in line:
-                    out.append(line)
-                    break
-        out_text = "\n".join(out)
-        soup = BeautifulSoup(out_text, features="html.parser")
-        for script in soup(['script', 'style']):
-            script.extract() # remove html formatting things, leave text
-        return soup.get_text().split('\n')
+        from .preprocess import StreamingPreprocessor
+        preprocessor = StreamingPreprocessor(kept_strs, encoding)
+        for chunk in chunks:
+            yield from preprocessor.feed(chunk)
+        yield from preprocessor.close()
+
+    @staticmethod
+    def preprocess_response(response, kept_strs: Optional[list[str]] = None,
+                            sizes: Optional[dict] = None) -> Iterator[str]:
+        """
+        Preprocesses a Response as its body is downloaded, decoding it
+        the same way Response.text would. The response is closed once
+        the body has been read. If a sizes dictionary is given, the
+        size of the body is stored in it under 'bytes', and the time
+        spent waiting for it to download under 'seconds'.
+        """
+        try:
+            if response.encoding is None:
+                # requests would have to sniff the whole body anyway
+                if sizes is not None:
+                    start = time.perf_counter()
+                    sizes['bytes'] = len(response.content)
+                    sizes['seconds'] = time.perf_counter() - start
+                yield from CatsoopRequests.preprocess_stream([response.text], kept_strs)
+                return
+            chunks = response.iter_content(CatsoopRequests.chunk_size)
+            if sizes is not None:
+                sizes['bytes'] = 0
+                sizes['seconds'] = 0.0
+                chunks = CatsoopRequests.count_bytes(chunks, sizes)
+            yield from CatsoopRequests.preprocess_stream(
+                    chunks, kept_strs, response.encoding)
+        finally:
+            response.close()
+
+    @staticmethod
+    def count_bytes(chunks: Iterable[bytes], sizes: dict) -> Iterator[bytes]:
+        """
+        Passes the chunks on, adding up their size in sizes['bytes']
+        and the time spent waiting for each in sizes['seconds'].
+        """
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            sizes['seconds'] += time.perf_counter() - start
+            if chunk is None:
+                return
+            sizes['bytes'] += len(chunk)
+            yield chunk
 
     @staticmethod
     def get_numbers(line):
@@ -65,11 +196,17 @@ class CatsoopRequests():
     def get_url(class_code):
         """
         Given a class code, returns the url. Returns None if
-        the class code isn't supported.
+        the class code isn't supported. If a resolver is installed,
+        its url for the current term is used when it finds one.
         """
+        if CatsoopRequests.resolver is not None:
+            url = CatsoopRequests.resolver.resolve(class_code)
+            if url is not None:
+                return url
         return CatsoopRequests.base_urls.get(class_code, None)
             
 if __name__ == "__main__":
+    import pprint
     with open('token.txt', 'r') as f:
         token = f.readline()
     raw_data = CatsoopRequests.request_data(token, class_code='6.200')
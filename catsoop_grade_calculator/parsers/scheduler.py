@@ -0,0 +1,240 @@
+"""
+Schedules requests to the CAT-SOOP hosts: per-host rate limiting,
+retries with backoff, and a concurrency limit that adapts to how the
+host is doing.
+"""
+
+from typing import Optional
+import random
+import threading
+import time
+
+class HostLimiter():
+    """
+    Limits the requests to one host in two ways:
+        - a token bucket allowing `rate` requests per second on
+          average, with bursts of up to `burst` requests;
+        - a cap on the requests in flight at once. The cap grows by
+          about one for every cap's worth of requests that go well,
+          and is halved when a request fails or is slower than
+          `slow_latency` seconds (AIMD, as in TCP congestion control).
+    A 429 / 503 with Retry-After pauses every request to the host.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: float = 10.0,
+                 initial_concurrency: float = 4.0, min_concurrency: float = 1.0,
+                 max_concurrency: float = 16.0, slow_latency: float = 10.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_fill = time.monotonic()
+        self.concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.slow_latency = slow_latency
+        self.active = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        # smoothed latency of successful requests, in seconds
+        self.latency = None
+        self.condition = threading.Condition()
+        self.counters = {'requests': 0,
+                         'retries': 0,
+                         'errors': 0,
+                         'throttled_seconds': 0.0,
+                         'backoff_seconds': 0.0,
+                         'request_seconds': 0.0}
+
+    def take_token(self) -> float:
+        """
+        Takes a token from the bucket (going into debt if it is
+        empty). Returns how long to wait before the token is valid.
+        Must be called with the condition held.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_fill) * self.rate)
+        self.last_fill = now
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+    def acquire(self) -> None:
+        """
+        Waits for a token and a free concurrency slot.
+        """
+        start = time.monotonic()
+        with self.condition:
+            wait = self.take_token()
+        if wait > 0:
+            time.sleep(wait)
+        with self.condition:
+            while self.active >= max(1, int(self.concurrency)):
+                self.condition.wait()
+            self.active += 1
+            self.counters['requests'] += 1
+            self.counters['throttled_seconds'] += time.monotonic() - start
+
+    def release(self, latency: float, ok: bool) -> None:
+        """
+        Frees the slot taken by acquire, adjusting the concurrency
+        cap for how the request went.
+        """
+        with self.condition:
+            self.active -= 1
+            self.counters['request_seconds'] += latency
+            if not ok:
+                self.counters['errors'] += 1
+            if ok:
+                self.latency = latency if self.latency is None \
+                        else 0.8 * self.latency + 0.2 * latency
+            if ok and latency < self.slow_latency:
+                self.concurrency = min(self.max_concurrency,
+                                       self.concurrency + 1 / self.concurrency)
+            else:
+                # one decrease per round trip, not one per failed request
+                now = time.monotonic()
+                if now - self.last_decrease > (self.latency or latency):
+                    self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                    self.last_decrease = now
+            self.condition.notify()
+
+    def pause(self, seconds: float) -> None:
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def add_backoff(self, seconds: float) -> None:
+        with self.condition:
+            self.counters['retries'] += 1
+            self.counters['backoff_seconds'] += seconds
+
+    def stats(self) -> dict:
+        with self.condition:
+            stats = dict(self.counters)
+            stats['concurrency'] = self.concurrency
+            stats['active'] = self.active
+            stats['latency'] = self.latency
+        return stats
+
+class RequestScheduler():
+    """
+    Sends requests through a HostLimiter per host, retrying on
+    connection errors, timeouts, 429 and 5xx responses with jittered
+    exponential backoff (or as long as Retry-After says, up to
+    max_retry_after seconds).
+
+    Counters (see stats) split the time spent into waiting for the
+    rate and concurrency limits ('throttled_seconds'), sleeping
+    between retries ('backoff_seconds') and the requests themselves
+    ('request_seconds', up to the response headers).
+    """
+
+    retry_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_retries: int = 4, base_delay: float = 0.5,
+                 max_delay: float = 30.0, max_retry_after: float = 300.0,
+                 **limiter_kwargs) -> None:
+        """
+        limiter_kwargs are passed on to each HostLimiter.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.limiter_kwargs = limiter_kwargs
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get_limiter(self, host: str) -> HostLimiter:
+        with self.lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                limiter = HostLimiter(**self.limiter_kwargs)
+                self.limiters[host] = limiter
+        return limiter
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        Returns a random delay before retry number attempt (0-based),
+        up to twice as long as the one before ("full jitter").
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Given a Retry-After header (seconds or an HTTP date), returns
+        the number of seconds to wait, or None if there is none.
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, session, host: str, url: str, **kwargs):
+        """
+        Sends session.get(url, **kwargs) with rate limiting and
+        retries. Returns the last response; raises the last error if
+        every attempt failed to connect.
+        """
+        return self.request(session, 'GET', host, url, **kwargs)
+
+    def request(self, session, method: str, host: str, url: str,
+                max_retries: Optional[int] = None, **kwargs):
+        """
+        Same as get, for any method (session.request(method, url,
+        **kwargs)). max_retries overrides the scheduler's for this
+        request.
+        """
+        import requests
+        if max_retries is None: max_retries = self.max_retries
+        limiter = self.get_limiter(host)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            start = time.monotonic()
+            response = None
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                limiter.release(time.monotonic() - start, False)
+                if attempt >= max_retries:
+                    raise
+            else:
+                ok = response.status_code not in self.retry_statuses
+                limiter.release(time.monotonic() - start, ok)
+                if ok or attempt >= max_retries:
+                    return response
+
+            delay = self.get_delay(attempt)
+            if response is not None:
+                retry_after = self.parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None:
+                    delay = min(max(delay, retry_after), self.max_retry_after)
+                    limiter.pause(delay)
+                # the connection goes back to the pool
+                response.close()
+            limiter.add_backoff(delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Returns the counters of each host, plus their sum as 'total'.
+        """
+        with self.lock:
+            limiters = dict(self.limiters)
+        out = {host: limiter.stats() for host, limiter in limiters.items()}
+        total = {}
+        for stats in out.values():
+            for key in ('requests', 'retries', 'errors', 'throttled_seconds',
+                        'backoff_seconds', 'request_seconds'):
+                total[key] = total.get(key, 0) + stats[key]
+        out['total'] = total
+        return out
@@ -0,0 +1,123 @@
+"""
+Grades large batches on every CPU core: pages are fetched by threads,
+then preprocessed, parsed and scored in a pool of worker processes.
+"""
+
+from .batch import BatchCalculator
+from .general import ScoreCalculator
+from .parsers.request import CatsoopRequests
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+import multiprocessing
+import os
+import threading
+
+# the calculator of each worker process, holding its parsers
+worker_calculator = None
+
+def init_worker() -> None:
+    global worker_calculator
+    worker_calculator = ScoreCalculator({})
+
+def score_body(class_code: str, body: bytes, encoding: str) -> dict:
+    """
+    Runs in a worker process: decodes a fetched page the way
+    Response.text would, then preprocesses, parses and scores it.
+    The worker's parsers are reused for every page.
+    """
+    return worker_calculator.score_page(class_code, body.decode(encoding, errors='replace'))
+
+class PipelineCalculator(BatchCalculator):
+    """
+    Same interface as BatchCalculator, with the work split in two
+    stages so that the pure-Python parsing isn't held back by the GIL:
+        - fetching, in io_workers threads (limited per host as in
+          BatchCalculator);
+        - preprocessing, parsing and scoring, in cpu_workers
+          processes (all cores by default).
+    At most queue_size fetched pages wait for a worker at once; when
+    the workers fall behind, fetching pauses until they catch up.
+
+    The cache, hooks, history, checkpoints and incremental parsing
+    can't be used, since the work happens in other processes; asking
+    for any of them raises a ValueError.
+    """
+
+    def __init__(self, cpu_workers: Optional[int] = None, io_workers: int = 16,
+                 max_per_host: int = 4, timeout: Optional[float] = None,
+                 queue_size: Optional[int] = None,
+                 mp_context: Optional[str] = 'spawn', cache=None,
+                 incremental: bool = False, history=None, checkpoint=None) -> None:
+        """
+        mp_context is the multiprocessing start method of the worker
+        processes; spawn is the safe choice when threads are running.
+        cache, incremental, history and checkpoint are only taken to
+        match BatchCalculator, and must be left unset.
+        """
+        unsupported = [name for name, value in (('cache', cache), ('incremental', incremental),
+                                                ('history', history), ('checkpoint', checkpoint))
+                       if value]
+        if unsupported:
+            raise ValueError(f"PipelineCalculator doesn't support {', '.join(unsupported)}")
+        super().__init__(io_workers, max_per_host, timeout)
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        self.queue_size = queue_size or 2 * self.cpu_workers
+        self.mp_context = mp_context
+
+    def fetch_body(self, class_code: str, token: str) -> tuple[bytes, str]:
+        """
+        Fetches a page, returning its body and the encoding to decode
+        it with.
+        """
+        if CatsoopRequests.get_url(class_code) is None:
+            raise NotImplementedError(
+                    "This class doesn't have an implemented grade calculator!")
+        with self.get_host_limit(class_code):
+            response = self.fetch_page(class_code, self.timeout, token)
+            body = response.content
+        return body, response.encoding or response.apparent_encoding
+
+    def grade_piped(self, student_id: str, class_code: str, token: str,
+                    workers: ProcessPoolExecutor, slots: threading.BoundedSemaphore) -> dict:
+        """
+        Runs in an io thread: fetches the page, then waits for a slot
+        in the queue to the workers and for its result. Returns a
+        result as in BatchCalculator.grade_one.
+        """
+        result = {'student_id': student_id,
+                  'class_code': class_code,
+                  'out_score': None,
+                  'error': None}
+        try:
+            body, encoding = self.fetch_body(class_code, token)
+            with slots:
+                result['out_score'] = workers.submit(
+                        score_body, class_code, body, encoding).result()
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        return result
+
+    def grade(self, records: Iterable[tuple[str, str, str]],
+              debug=False) -> Iterator[dict]:
+        """
+        Grades every (student_id, class_code, token) record and yields
+        one result per record, in the same order as the records (see
+        BatchCalculator.grade). debug is ignored.
+        """
+        if self.hooks:
+            raise ValueError("PipelineCalculator doesn't support hooks")
+        context = multiprocessing.get_context(self.mp_context)
+        slots = threading.BoundedSemaphore(self.queue_size)
+        # enough records in flight to keep both stages busy
+        window = self.max_workers + self.queue_size
+        pending = deque()
+        with ProcessPoolExecutor(self.cpu_workers, context, init_worker) as workers, \
+                ThreadPoolExecutor(self.max_workers) as fetchers:
+            for student_id, class_code, token in records:
+                pending.append(fetchers.submit(self.grade_piped, student_id, class_code,
+                                               token, workers, slots))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,175 @@
+"""
+What-if grade projections: the final grade over a grid of
+hypothetical scores for assignments that haven't been graded yet.
+
+Needs numpy (pip install catsoop_grade_calculator[projection]).
+"""
+
+from .parsers.base_parser import Parser
+from .parsers.records import scores_of
+from itertools import starmap
+from operator import itemgetter, truediv
+from typing import Optional
+import math
+
+try:
+    import numpy as np
+except ImportError: # numpy is an optional dependency
+    np = None
+
+class GradeProjector():
+    """
+    Projects the grades of a cohort of students in one class.
+
+    Each hypothetical adds `count` assignments to a category, each
+    scoring a value out of `possible` points. Given a grid of values
+    for one or more categories (say, the final from 0 to 100 and the
+    two missing labs from 0 to 10), the grade of every student is
+    computed for every combination at once, using the same category
+    averages and grading schemes as the parser's calculate_score
+    (including picking the best scheme and the parser's normalize_each
+    settings). Dropping the lowest assignments isn't supported, since
+    which ones are dropped depends on the hypothetical scores.
+
+    The per-student data is kept as arrays:
+        sums: (students, categories) sum of each assignment's fraction,
+            or of its points earned if the category isn't normalize_each
+        totals: (students, categories) what sums is divided by: the
+            number of assignments, or the sum of their points possible
+        counts: (students, categories) number of assignments
+        weights: (students, schemes, categories) weight of each category
+    """
+
+    def __init__(self, parser: Parser, cohort: list[dict[str, list]]):
+        """
+        Cohort is a list of score_data dictionaries (the output of
+        parser.parse_html), one per student. Raises ValueError if the
+        parser drops the lowest assignments of any category.
+        """
+        if np is None:
+            raise ImportError("GradeProjector needs numpy; install "
+                              "catsoop_grade_calculator[projection]")
+        dropped = sorted(category for category, drop in parser.drop_lowest.items()
+                         if drop > 0 and category in parser.assignment_types)
+        if dropped:
+            raise ValueError("GradeProjector can't project categories whose lowest "
+                             f"assignments are dropped ({', '.join(dropped)})")
+        self.parser = parser
+        self.categories = sorted(parser.assignment_types)
+        self.normalize = [parser.normalize_each.get(category, True)
+                          for category in self.categories]
+        index = {category: i for i, category in enumerate(self.categories)}
+        all_schemes = [parser.get_schemes(score_data) for score_data in cohort]
+        num_schemes = max(len(schemes) for schemes in all_schemes) if cohort else 0
+
+        self.sums = np.zeros((len(cohort), len(self.categories)))
+        self.totals = np.zeros((len(cohort), len(self.categories)))
+        self.counts = np.zeros((len(cohort), len(self.categories)))
+        self.weights = np.zeros((len(cohort), num_schemes, len(self.categories)))
+        for student, score_data in enumerate(cohort):
+            for category, i in index.items():
+                if category not in score_data: continue
+                scores = scores_of(score_data[category])
+                if self.normalize[i]:
+                    self.sums[student, i] = math.fsum(starmap(truediv, scores))
+                    self.totals[student, i] = len(scores)
+                else:
+                    self.sums[student, i] = math.fsum(map(itemgetter(0), scores))
+                    self.totals[student, i] = math.fsum(map(itemgetter(1), scores))
+                self.counts[student, i] = len(scores)
+            for scheme_num, scheme in enumerate(all_schemes[student]):
+                for category, weight in scheme.items():
+                    if category in index:
+                        self.weights[student, scheme_num, index[category]] = weight
+
+    def project(self, grid: dict[str, 'np.ndarray'],
+                possible: Optional[dict[str, float]] = None,
+                count: Optional[dict[str, int]] = None) -> dict[str, 'np.ndarray']:
+        """
+        Given a grid mapping categories to 1-d arrays of hypothetical
+        scores, returns a dictionary of:
+            percent: array of shape (students, *grid sizes), the best
+                grade of each student in each scenario, in percent
+            scheme_percents: array of shape (students, schemes,
+                *grid sizes), the grade under each scheme
+            best_scheme: index of the scheme giving `percent`
+        Grid axes are in the order of the grid dictionary. Scores are
+        out of possible[category] points (100 by default), and each
+        scenario adds count[category] such assignments (1 by default).
+        """
+        if possible is None: possible = {}
+        if count is None: count = {}
+        for category in grid:
+            if category not in self.categories:
+                raise ValueError(f"Unknown assignment category {category!r}")
+        num_axes = len(grid)
+
+        # shape every grid so it varies along its own axis
+        added_sums = {}
+        added_totals = {}
+        added_counts = {}
+        for axis, (category, values) in enumerate(grid.items()):
+            shape = [1] * (1 + num_axes)
+            shape[1 + axis] = -1
+            k = count.get(category, 1)
+            values = np.asarray(values, dtype=float).reshape(shape)
+            out_of = possible.get(category, 100.0)
+            if self.normalize[self.categories.index(category)]:
+                added_sums[category] = k * values / out_of
+                added_totals[category] = k
+            else:
+                added_sums[category] = k * values
+                added_totals[category] = k * out_of
+            added_counts[category] = k
+
+        # (students, categories, *grid) averages, 0 for absent categories
+        expand = (slice(None),) + (None,) * num_axes
+        averages = []
+        present = []
+        for i, category in enumerate(self.categories):
+            total = self.sums[:, i][expand] + added_sums.get(category, 0.0)
+            out_of = self.totals[:, i][expand] + added_totals.get(category, 0)
+            n = self.counts[:, i][expand] + added_counts.get(category, 0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                averages.append(np.where(n > 0, total / np.where(n > 0, out_of, 1), 0.0))
+            present.append(np.broadcast_to(n > 0, averages[-1].shape))
+        averages = np.stack(np.broadcast_arrays(*averages), axis=1)
+        present = np.stack(np.broadcast_arrays(*present), axis=1)
+
+        earned = np.einsum('nsc,nc...->ns...', self.weights, averages)
+        total_weight = np.einsum('nsc,nc...->ns...', self.weights, present.astype(float))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scheme_percents = 100 * earned / total_weight
+        # ties go to the first scheme, as in calculate_score
+        best_scheme = np.argmax(np.where(np.isnan(scheme_percents), -np.inf, scheme_percents),
+                                axis=1)
+        percent = np.take_along_axis(scheme_percents, best_scheme[:, None], axis=1)[:, 0]
+        return {'percent': percent,
+                'scheme_percents': scheme_percents,
+                'best_scheme': best_scheme}
+
+    def minimum_needed(self, category: str, targets,
+                       possible: float = 100.0, count: int = 1) -> 'np.ndarray':
+        """
+        Returns the lowest score (out of possible) that each student
+        needs on `count` more assignments of the category to reach
+        each target grade (in percent), as an array of shape
+        (students, targets). It is 0 if the target is already met,
+        and nan if even a perfect score doesn't reach it.
+
+        A student's grade under each scheme is linear in the new
+        score, so it is solved for directly rather than searched.
+        """
+        targets = np.atleast_1d(np.asarray(targets, dtype=float))
+        ends = self.project({category: [0.0, possible]},
+                            {category: possible}, {category: count})['scheme_percents']
+        low, high = ends[..., 0], ends[..., 1]
+        slope = (high - low) / possible
+        low, slope = low[..., None], slope[..., None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            needed = np.where(slope > 0, (targets - low) / slope, np.inf)
+        needed = np.where(low >= targets, 0.0, np.maximum(needed, 0.0))
+        needed = np.where(needed <= possible * (1 + 1e-12), np.minimum(needed, possible), np.inf)
+        # the best scheme is the one needing the lowest score
+        needed = np.min(np.where(np.isnan(needed), np.inf, needed), axis=1)
+        return np.where(np.isinf(needed), np.nan, needed)
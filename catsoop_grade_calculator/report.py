@@ -0,0 +1,153 @@
+"""
+Writes grade reports to a file-like sink, one at a time, in one of
+three formats:
+    text: the verbose report of ScoreCalculator.generate_full_report
+    jsonl: one JSON object per report
+    csv: one row per overall, alternative or category score, with
+        the columns in ReportWriter.csv_columns
+Each report is written as soon as it is given, and nothing is kept
+afterwards, so a batch of any size is written in constant memory.
+"""
+
+from .parsers.request import CatsoopRequests
+from typing import Iterable, Optional, TextIO
+import csv
+import json
+
+def out_score_from_json(out_score: dict) -> dict:
+    """
+    Returns an out_score that was saved as JSON (by the cache or a
+    checkpoint log), with the tuples that JSON turned into lists
+    restored.
+    """
+    return {'best_score': tuple(out_score['best_score']),
+            'alt_scores': tuple(tuple(alt) for alt in out_score['alt_scores']),
+            'by_category': out_score['by_category']}
+
+def summarize(class_code: str, out_score: dict) -> dict:
+    """
+    Goes over an out_score once, returning what every format shows:
+    the rounded percentages and points, the alternative scores from
+    best to worst, and the categories in alphabetical order.
+    """
+    earned, possible = out_score['best_score']
+    alt_percents = [round(100 * alt_earned / alt_possible, 2)
+                    for alt_earned, alt_possible in out_score['alt_scores']]
+    alt_percents.sort(reverse=True)
+    by_category = out_score['by_category']
+    return {'class_code': class_code,
+            'percent': round(100 * earned / possible, 2),
+            'earned': round(earned, 2),
+            'possible': round(possible, 2),
+            'alt_percents': alt_percents,
+            'categories': [(category, round(100 * by_category[category], 2))
+                           for category in sorted(by_category)],
+            'url': CatsoopRequests.get_url(class_code)}
+
+def render_text(summary: dict) -> str:
+    """
+    Returns the verbose report of a summary, without a final newline.
+    """
+    lines = ["==================================",
+             f"GRADE REPORT FOR {summary['class_code']}: ",
+             "==================================",
+             f"OVERALL GRADE: ..........{summary['percent']}%",
+             f"....Points collected: ...{summary['earned']}",
+             f"....Points possible: ....{summary['possible']}"]
+    if summary['alt_percents']:
+        lines.append("ALTERNATIVE SCORE(S):")
+        lines.extend(f"....{percent}%" for percent in summary['alt_percents'])
+    lines.append("CATEGORY BREAKDOWN:")
+    # align the scores to each other
+    max_len = max((len(category) for category, _ in summary['categories']), default=0)
+    for category, percent in summary['categories']:
+        lines.append(f"....{category}{'.' * (2 + max_len - len(category))}{percent}%")
+    lines.append(f"{summary['url']}")
+    return '\n'.join(lines)
+
+class ReportWriter():
+    """
+    Writes reports to a sink (anything with a write method, e.g. an
+    open file or sys.stdout), each followed by a newline. Reports can
+    be given as out_scores (write) or as BatchCalculator results
+    (write_result), whose errors are reported instead of a grade.
+    """
+
+    formats = ('text', 'jsonl', 'csv')
+    csv_columns = ('student_id', 'class_code', 'kind', 'name', 'percent', 'error')
+
+    def __init__(self, sink: TextIO, format: str = 'text') -> None:
+        if format not in self.formats:
+            raise ValueError(f"Unknown report format {format!r}, "
+                             f"expected one of {', '.join(self.formats)}")
+        self.sink = sink
+        self.format = format
+        self.csv_writer = None
+        self.count = 0
+
+    def write(self, class_code: str, out_score: Optional[dict],
+              student_id: Optional[str] = None, error: Optional[str] = None,
+              row: Optional[int] = None) -> None:
+        """
+        Writes one report. out_score is None when the grade couldn't
+        be calculated, and error then says why. row is the position of
+        the record in a roster, kept in JSON Lines reports so that the
+        reports of roster shards can be merged (see roster.py).
+        """
+        summary = None if out_score is None else summarize(class_code, out_score)
+        getattr(self, f"write_{self.format}")(class_code, summary, student_id, error, row)
+        self.count += 1
+
+    def write_result(self, result: dict) -> None:
+        self.write(result['class_code'], result['out_score'], result['student_id'],
+                   result['error'], result.get('row'))
+
+    def write_results(self, results: Iterable[dict]) -> int:
+        """
+        Writes every result as it comes. Returns the number written.
+        """
+        start = self.count
+        for result in results:
+            self.write_result(result)
+        return self.count - start
+
+    def write_text(self, class_code: str, summary: Optional[dict],
+                   student_id: Optional[str], error: Optional[str],
+                   row: Optional[int]) -> None:
+        if summary is not None:
+            text = render_text(summary)
+        else:
+            text = '\n'.join(["==================================",
+                              f"GRADE REPORT FOR {class_code}: ",
+                              "==================================",
+                              f"ERROR: {error}"])
+        if student_id is not None:
+            text = f"STUDENT: {student_id}\n{text}"
+        self.sink.write(text + '\n')
+
+    def write_jsonl(self, class_code: str, summary: Optional[dict],
+                    student_id: Optional[str], error: Optional[str],
+                    row: Optional[int]) -> None:
+        record = {'student_id': student_id, 'class_code': class_code, 'error': error}
+        if row is not None:
+            record['row'] = row
+        if summary is not None:
+            record.update(summary)
+            record['categories'] = dict(summary['categories'])
+        self.sink.write(json.dumps(record) + '\n')
+
+    def write_csv(self, class_code: str, summary: Optional[dict],
+                  student_id: Optional[str], error: Optional[str],
+                  row: Optional[int]) -> None:
+        if self.csv_writer is None:
+            self.csv_writer = csv.writer(self.sink, lineterminator='\n')
+            self.csv_writer.writerow(self.csv_columns)
+        if summary is None:
+            self.csv_writer.writerow((student_id, class_code, 'error', '', '', error))
+            return
+        rows = [(student_id, class_code, 'overall', '', summary['percent'], '')]
+        rows.extend((student_id, class_code, 'alternative', str(rank), percent, '')
+                    for rank, percent in enumerate(summary['alt_percents'], 1))
+        rows.extend((student_id, class_code, 'category', category, percent, '')
+                    for category, percent in summary['categories'])
+        self.csv_writer.writerows(rows)
@@ -0,0 +1,120 @@
+"""
+Reads rosters of (student_id, class_code, token) records, splits them
+into shards for several machines, and merges the shards' results.
+
+A roster file is read one line at a time, so it can be of any size.
+It can be:
+    space: `<student id> <class code> <token>` lines; token.txt's
+        `<class code> <token>` lines are records without a student id
+    csv: a header row naming the columns student_id, class_code and token
+    jsonl: one {"student_id": ..., "class_code": ..., "token": ...}
+        object per line
+The format is guessed from the file extension unless given.
+
+Every machine reads the whole roster and keeps the records of its own
+shard, picked by a stable hash of (student id, class code), or of
+(class code, token) for records without a student id, so shards never
+overlap and nothing needs to be coordinated.
+"""
+
+from typing import Iterable, Iterator, Optional, TextIO
+import csv
+import hashlib
+import heapq
+import json
+
+formats = ('space', 'csv', 'jsonl')
+
+def guess_format(path: str) -> str:
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'space'
+
+def read_roster(path: str, format: Optional[str] = None) -> Iterator[tuple[str, str, str]]:
+    """
+    Yields the (student_id, class_code, token) records of a roster
+    file, in order. Blank lines are skipped; student_id is None when
+    the file doesn't give one.
+    """
+    if format is None: format = guess_format(path)
+    if format not in formats:
+        raise ValueError(f"Unknown roster format {format!r}, "
+                         f"expected one of {', '.join(formats)}")
+    with open(path, 'r', newline='' if format == 'csv' else None) as f:
+        if format == 'csv':
+            for row in csv.DictReader(f):
+                yield row.get('student_id') or None, row['class_code'], row['token']
+            return
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line: continue
+            if format == 'jsonl':
+                record = json.loads(line)
+                yield record.get('student_id'), record['class_code'], record['token']
+                continue
+            fields = line.split()
+            if len(fields) == 2:
+                yield None, fields[0], fields[1]
+            elif len(fields) == 3:
+                yield fields[0], fields[1], fields[2]
+            else:
+                raise ValueError(f"{path}, line {number}: expected "
+                                 "`[student id] <class code> <token>`")
+
+def read_tokens(path: str) -> dict[str, str]:
+    """
+    Reads a token file with one `<class code> <token>` pair per line
+    into a dictionary mapping class codes to tokens.
+    """
+    return {class_code: token for _, class_code, token in read_roster(path, 'space')}
+
+def shard_of(student_id: Optional[str], class_code: str, count: int,
+             token: Optional[str] = None) -> int:
+    """
+    Returns the shard (0 to count - 1) a record belongs to. Unlike
+    hash(), this is the same on every machine and every run. Records
+    without a student id are told apart by their token.
+    """
+    if student_id:
+        key = f"{student_id}\n{class_code}".encode()
+    else:
+        key = f"\n{class_code}\n{token}".encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big') % count
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """
+    Parses a shard given as `i/N` (shard i of N, counting from 1)
+    into (i - 1, N).
+    """
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Expected a shard like 1/4, got {text!r}") from None
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard {text} doesn't exist")
+    return index - 1, count
+
+def take_shard(records: Iterable[tuple[str, str, str]], index: int,
+               count: int) -> Iterator[tuple[int, tuple[str, str, str]]]:
+    """
+    Yields (row, record) for the records in shard index of count,
+    row being the record's position in the whole roster (from 0).
+    """
+    for row, record in enumerate(records):
+        if shard_of(record[0], record[1], count, record[2]) == index:
+            yield row, record
+
+def merge_shards(files: list[TextIO]) -> Iterator[dict]:
+    """
+    Merges the JSON Lines reports of every shard (as written by
+    ReportWriter with rows, see cli.py) back into roster order,
+    reading each file one line at a time.
+    """
+    def read(f: TextIO) -> Iterator[dict]:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+    return heapq.merge(*(read(f) for f in files), key=lambda record: record['row'])
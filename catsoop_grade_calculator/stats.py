@@ -0,0 +1,255 @@
+"""
+Streaming statistics over the grades of a cohort.
+
+Results are added one at a time and never stored: each statistic
+keeps running moments (count, mean, variance, min, max) and a
+histogram sketch for percentiles. Partial aggregates built by
+different workers or machines can be merged, and serialized with
+to_dict / from_dict to ship them around.
+"""
+
+from typing import Optional
+import math
+import threading
+
+class RunningMoments():
+    """
+    Count, mean, variance, minimum and maximum of a stream of numbers,
+    updated in one pass (Welford's algorithm) and mergeable (Chan et
+    al.'s parallel update).
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        # sum of squared differences from the mean
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other: 'RunningMoments') -> None:
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self, ddof: int = 0) -> float:
+        """
+        Returns the population variance (or the sample variance, with
+        ddof=1); nan if there are too few numbers.
+        """
+        if self.count <= ddof:
+            return math.nan
+        return self.m2 / (self.count - ddof)
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.count else None,
+                'max': self.max if self.count else None}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'RunningMoments':
+        moments = RunningMoments()
+        moments.count = data['count']
+        moments.mean = data['mean']
+        moments.m2 = data['m2']
+        if moments.count:
+            moments.min = data['min']
+            moments.max = data['max']
+        return moments
+
+class HistogramSketch():
+    """
+    Quantile sketch: counts of values in fixed-width bins, stored
+    sparsely. Since the bins are the same everywhere, merging two
+    sketches just adds their counts, so a merged sketch is exactly
+    the one that would have been built from all the values. Quantiles
+    are accurate to within one bin width.
+    """
+
+    __slots__ = ('width', 'bins', 'count')
+
+    def __init__(self, width: float = 0.01) -> None:
+        self.width = width
+        self.bins = {}
+        self.count = 0
+
+    def add(self, x: float) -> None:
+        index = math.floor(x / self.width)
+        self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+
+    def merge(self, other: 'HistogramSketch') -> None:
+        if other.width != self.width:
+            raise ValueError("Can't merge sketches with different bin widths")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += other.count
+
+    def quantiles(self, qs: list[float]) -> list[float]:
+        """
+        Returns the q-quantile for each q in qs (between 0 and 1), as
+        the middle of the bin it falls in; nan if the sketch is empty.
+        """
+        if self.count == 0:
+            return [math.nan for q in qs]
+        order = sorted(range(len(qs)), key=lambda i: qs[i])
+        out = [math.nan] * len(qs)
+        bins = sorted(self.bins.items())
+        seen = 0
+        position = 0
+        for i in order:
+            # the value with this (1-based) rank, as in a sorted list
+            rank = max(1, math.ceil(qs[i] * self.count))
+            while seen + bins[position][1] < rank:
+                seen += bins[position][1]
+                position += 1
+            out[i] = (bins[position][0] + 0.5) * self.width
+        return out
+
+    def to_dict(self) -> dict:
+        return {'width': self.width, 'bins': {str(index): count
+                                              for index, count in self.bins.items()}}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'HistogramSketch':
+        sketch = HistogramSketch(data['width'])
+        sketch.bins = {int(index): count for index, count in data['bins'].items()}
+        sketch.count = sum(sketch.bins.values())
+        return sketch
+
+class CohortStats():
+    """
+    Aggregates out_score dictionaries per class: the best score and
+    every by_category entry, all in percent, each with RunningMoments
+    and a HistogramSketch.
+
+    Feed it with add(class_code, out_score), add_result(result) for
+    BatchCalculator results, or install it as a ScoreCalculator hook
+    (it picks up the out_score of every 'score' and 'cache_hit' event).
+
+    Out_scores with nothing possible yet (no graded category counts)
+    have no percentage; they are left out of the statistics and only
+    counted, per class, in `skipped`.
+    """
+
+    quantile_points = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+    def __init__(self, width: float = 0.01) -> None:
+        """
+        Width is the bin width of the sketches, in percentage points.
+        """
+        self.width = width
+        # class code -> statistic name -> (moments, sketch)
+        self.classes = {}
+        # class code -> number of out_scores left out, see above
+        self.skipped = {}
+        self.lock = threading.Lock()
+
+    def get_stat(self, class_code: str, name: str) -> tuple[RunningMoments, HistogramSketch]:
+        stats = self.classes.setdefault(class_code, {})
+        stat = stats.get(name)
+        if stat is None:
+            stat = (RunningMoments(), HistogramSketch(self.width))
+            stats[name] = stat
+        return stat
+
+    def add_value(self, class_code: str, name: str, value: float) -> None:
+        moments, sketch = self.get_stat(class_code, name)
+        moments.add(value)
+        sketch.add(value)
+
+    def add(self, class_code: str, out_score: dict) -> None:
+        earned, possible = out_score['best_score']
+        with self.lock:
+            if not possible:
+                self.skipped[class_code] = self.skipped.get(class_code, 0) + 1
+                return
+            self.add_value(class_code, 'best_score', 100 * earned / possible)
+            for category, frac in out_score['by_category'].items():
+                self.add_value(class_code, category, 100 * frac)
+
+    def add_result(self, result: dict) -> None:
+        """
+        Adds a result from BatchCalculator.grade; failed ones are skipped.
+        """
+        if result['out_score'] is not None:
+            self.add(result['class_code'], result['out_score'])
+
+    def __call__(self, event: dict) -> None:
+        if event['stage'] in ('score', 'cache_hit'):
+            self.add(event['class_code'], event['output'])
+
+    def merge(self, other: 'CohortStats') -> None:
+        """
+        Adds the results aggregated by another CohortStats.
+        """
+        with other.lock:
+            other_classes = {class_code: dict(stats)
+                             for class_code, stats in other.classes.items()}
+            other_skipped = dict(other.skipped)
+        with self.lock:
+            for class_code, count in other_skipped.items():
+                self.skipped[class_code] = self.skipped.get(class_code, 0) + count
+            for class_code, stats in other_classes.items():
+                for name, (moments, sketch) in stats.items():
+                    own_moments, own_sketch = self.get_stat(class_code, name)
+                    own_moments.merge(moments)
+                    own_sketch.merge(sketch)
+
+    def summary(self, quantile_points: Optional[tuple[float]] = None) -> dict[str, dict]:
+        """
+        Returns, for each class and statistic, a dictionary with the
+        count, mean, standard deviation, min, max and the percentiles
+        (keyed like 'p50').
+        """
+        if quantile_points is None: quantile_points = self.quantile_points
+        out = {}
+        with self.lock:
+            for class_code, stats in self.classes.items():
+                out[class_code] = {}
+                for name, (moments, sketch) in stats.items():
+                    summary = {'count': moments.count,
+                               'mean': moments.mean,
+                               'std': math.sqrt(moments.variance()),
+                               'min': moments.min,
+                               'max': moments.max}
+                    for q, value in zip(quantile_points, sketch.quantiles(quantile_points)):
+                        summary[f"p{round(100 * q)}"] = value
+                    out[class_code][name] = summary
+        return out
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {'width': self.width,
+                    'skipped': dict(self.skipped),
+                    'classes': {class_code: {name: {'moments': moments.to_dict(),
+                                                    'sketch': sketch.to_dict()}
+                                             for name, (moments, sketch) in stats.items()}
+                                for class_code, stats in self.classes.items()}}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'CohortStats':
+        cohort = CohortStats(data['width'])
+        cohort.skipped = dict(data.get('skipped', {}))
+        for class_code, stats in data['classes'].items():
+            cohort.classes[class_code] = {
+                    name: (RunningMoments.from_dict(stat['moments']),
+                           HistogramSketch.from_dict(stat['sketch']))
+                    for name, stat in stats.items()}
+        return cohort
@@ -0,0 +1,270 @@
+"""
+Watch mode: polls progress pages on an adaptive schedule and reports
+whenever the assignments on one of them change.
+
+Each (student, class) page has its own polling interval. It starts
+at min_interval, grows by `backoff` every time the page is found
+unchanged (up to max_interval), and drops back to min_interval as
+soon as it changes. Around the deadlines of a class (known times when
+grades tend to come out), its pages are polled at least every
+deadline_interval.
+
+Listeners (any callable, like ScoreCalculator hooks) get a change
+event dictionary only when the parsed assignment records differ from
+the previous poll:
+    student_id, class_code, time
+    added: assignments that are new, as dictionaries
+    removed: assignments that are gone
+    changed: {'assignment': ..., 'old_score': ..., 'new_score': ...}
+        for assignments whose score changed
+    out_score: the new grade
+    previous_out_score: the grade before the change
+"""
+
+from .batch import BatchCalculator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import heapq
+import itertools
+import random
+import threading
+import time
+
+class WatchedPage():
+    """
+    Polling state of one (student, class) page.
+    """
+
+    __slots__ = ('student_id', 'class_code', 'token', 'interval', 'next_poll',
+                 'score_data', 'out_score', 'changed_at')
+
+    def __init__(self, student_id: Optional[str], class_code: str, token: str,
+                 interval: float, next_poll: float) -> None:
+        self.student_id = student_id
+        self.class_code = class_code
+        self.token = token
+        self.interval = interval
+        self.next_poll = next_poll
+        self.score_data = None
+        self.out_score = None
+        self.changed_at = None
+
+def record_key(record) -> tuple:
+    return (record['assignment_type'], record['assignment_name'],
+            record.get('sub_assignment'))
+
+def diff_records(old: dict[str, list], new: dict[str, list]) -> dict[str, list]:
+    """
+    Compares two score_data dictionaries. Assignments are matched by
+    category, name and sub-assignment (and, for names that repeat,
+    by their order on the page). Returns a dictionary with lists
+    'added', 'removed' and 'changed', all empty if nothing changed.
+    """
+    def index(score_data: dict[str, list]) -> dict[tuple, dict]:
+        seen = {}
+        out = {}
+        for records in score_data.values():
+            for record in records:
+                key = record_key(record)
+                nth = seen.get(key, 0)
+                seen[key] = nth + 1
+                out[key + (nth,)] = dict(record)
+        return out
+
+    old_records, new_records = index(old), index(new)
+    diff = {'added': [], 'removed': [], 'changed': []}
+    for key, record in new_records.items():
+        previous = old_records.get(key)
+        if previous is None:
+            diff['added'].append(record)
+        elif tuple(previous['score']) != tuple(record['score']):
+            diff['changed'].append({'assignment': record,
+                                    'old_score': tuple(previous['score']),
+                                    'new_score': tuple(record['score'])})
+    diff['removed'] = [record for key, record in old_records.items()
+                       if key not in new_records]
+    return diff
+
+class GradeWatcher():
+    """
+    Polls the watched pages whenever they are due (see the module
+    docstring for the schedule), a few at a time, and sends a change
+    event to every listener when a page's assignments change.
+
+    Pages are graded by a BatchCalculator, so requests to each host
+    are limited and a failing page doesn't stop the others; a page
+    that fails is retried on the schedule of an unchanged one.
+    """
+
+    def __init__(self, min_interval: float = 60, max_interval: float = 3600,
+                 backoff: float = 2.0, deadlines: Optional[dict[str, list[float]]] = None,
+                 deadline_window: float = 3600, deadline_interval: Optional[float] = None,
+                 max_workers: int = 8, max_per_host: int = 4,
+                 timeout: Optional[float] = 30, cache=None) -> None:
+        """
+        deadlines maps class codes to unix times; from deadline_window
+        seconds before each until deadline_window seconds after, that
+        class's pages are polled at least every deadline_interval
+        seconds (min_interval by default).
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.deadlines = {class_code: sorted(times)
+                          for class_code, times in (deadlines or {}).items()}
+        self.deadline_window = deadline_window
+        self.deadline_interval = min_interval if deadline_interval is None \
+                else deadline_interval
+        # incremental, since most polls see a page that barely changed
+        self.calculator = BatchCalculator(max_workers, max_per_host, timeout, cache,
+                                          incremental=True)
+        self.max_workers = max_workers
+        self.pages = {}
+        # (next poll, tie breaker, (student id, class code)) of every page
+        self.schedule = []
+        self.sequence = itertools.count()
+        self.listeners = []
+        self.counters = {'polls': 0, 'changes': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def add_listener(self, listener: Callable[[dict], None]) -> None:
+        self.listeners.append(listener)
+
+    def watch(self, student_id: Optional[str], class_code: str, token: str,
+              now: Optional[float] = None) -> None:
+        """
+        Starts watching a page; its first poll is due right away.
+        """
+        if now is None: now = time.time()
+        key = (student_id, class_code)
+        with self.lock:
+            if key in self.pages:
+                self.pages[key].token = token
+                return
+            page = WatchedPage(student_id, class_code, token, self.min_interval, now)
+            self.pages[key] = page
+            heapq.heappush(self.schedule, (now, next(self.sequence), key))
+
+    def unwatch(self, student_id: Optional[str], class_code: str) -> None:
+        # its schedule entry is skipped when it comes up
+        with self.lock:
+            self.pages.pop((student_id, class_code), None)
+
+    def near_deadline(self, class_code: str, start: float, end: float) -> Optional[float]:
+        """
+        Returns the start of the first deadline window of the class
+        that overlaps [start, end], or None.
+        """
+        for deadline in self.deadlines.get(class_code, ()):
+            if deadline + self.deadline_window >= start \
+                    and deadline - self.deadline_window <= end:
+                return max(start, deadline - self.deadline_window)
+        return None
+
+    def next_poll(self, page: WatchedPage, changed: bool, now: float) -> float:
+        """
+        Updates the page's interval after a poll, and returns when it
+        should be polled next.
+        """
+        if changed:
+            page.interval = self.min_interval
+        else:
+            page.interval = min(self.max_interval, page.interval * self.backoff)
+        # a little jitter, so pages watched together drift apart
+        interval = page.interval * random.uniform(0.9, 1.1)
+        window_start = self.near_deadline(page.class_code, now, now + interval)
+        if window_start is not None:
+            interval = min(interval, max(window_start - now, self.deadline_interval))
+        return now + interval
+
+    def poll(self, page: WatchedPage, now: Optional[float] = None) -> Optional[dict]:
+        """
+        Grades the page and reschedules it. Returns the change event
+        (already sent to the listeners), or None if nothing changed.
+        """
+        parsed = []
+        def capture(event: dict) -> None:
+            if event['stage'] == 'parse':
+                parsed.append(event['output'])
+        with self.calculator.hooked(capture, this_thread=True):
+            result = self.calculator.grade_one(page.student_id, page.class_code, page.token)
+        if now is None: now = time.time()
+
+        event = None
+        # a cache hit (no parse) means the page is the same as before
+        if result['error'] is None and parsed:
+            score_data = parsed[-1]
+            if page.score_data is not None:
+                diff = diff_records(page.score_data, score_data)
+                if diff['added'] or diff['removed'] or diff['changed']:
+                    event = {'student_id': page.student_id,
+                             'class_code': page.class_code,
+                             'time': now,
+                             **diff,
+                             'out_score': result['out_score'],
+                             'previous_out_score': page.out_score}
+            page.score_data = score_data
+            page.out_score = result['out_score']
+
+        with self.lock:
+            self.counters['polls'] += 1
+            if result['error'] is not None: self.counters['errors'] += 1
+            if event is not None:
+                self.counters['changes'] += 1
+                page.changed_at = now
+            page.next_poll = self.next_poll(page, event is not None, now)
+            if self.pages.get((page.student_id, page.class_code)) is page:
+                heapq.heappush(self.schedule, (page.next_poll, next(self.sequence),
+                                               (page.student_id, page.class_code)))
+        if event is not None:
+            for listener in self.listeners:
+                listener(event)
+        return event
+
+    def due(self, now: Optional[float] = None) -> list[WatchedPage]:
+        """
+        Takes every page that is due off the schedule.
+        """
+        if now is None: now = time.time()
+        pages = []
+        with self.lock:
+            while self.schedule and self.schedule[0][0] <= now:
+                when, _, key = heapq.heappop(self.schedule)
+                page = self.pages.get(key)
+                # entries left over from an unwatched page are skipped
+                if page is not None and page.next_poll == when:
+                    pages.append(page)
+        return pages
+
+    def poll_due(self, now: Optional[float] = None) -> list[dict]:
+        """
+        Polls every page that is due, max_workers at a time. Returns
+        the change events.
+        """
+        pages = self.due(now)
+        if not pages:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pages))) as executor:
+            events = list(executor.map(self.poll, pages, [now] * len(pages)))
+        return [event for event in events if event is not None]
+
+    def run(self) -> None:
+        """
+        Polls pages as they come due until stop() is called.
+        """
+        while not self.stopped.is_set():
+            self.poll_due()
+            with self.lock:
+                wait = self.schedule[0][0] - time.time() if self.schedule \
+                        else self.min_interval
+            self.stopped.wait(max(0.0, min(wait, self.min_interval)))
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats['pages'] = len(self.pages)
+        return stats
@@ -3,12 +3,9 @@ Sample code to output grade reports.
 """
 
 from catsoop_grade_calculator import ScoreCalculator
+from catsoop_grade_calculator.roster import read_tokens
 
-tokens = {}
-with open('token.txt', 'r') as file:
-    for line in file:
-        class_num, token = line.strip().split(' ')
-        tokens[class_num] = token
+tokens = read_tokens('token.txt')
 
 sooper = ScoreCalculator(tokens)
 report = sooper.report_all()
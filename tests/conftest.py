@@ -0,0 +1,140 @@
+"""
+Shared fixtures: a local stand-in for the CAT-SOOP hosts, so that the
+tests that fetch pages run without tokens or network access.
+"""
+
+from benchmarks.fixtures import circuits_page, py_page
+from catsoop_grade_calculator.parsers import CatsoopRequests
+from catsoop_grade_calculator.parsers.scheduler import RequestScheduler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import hashlib
+import threading
+import time
+import pytest
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.stand_in.answer(self, True)
+
+    def do_HEAD(self):
+        self.server.stand_in.answer(self, False)
+
+    def log_message(self, format, *args):
+        pass
+
+class StandIn():
+    """
+    Serves /<class code>/progress?api_token=<token> with
+    pages[class code][token], with an ETag (and 304 for a matching
+    If-None-Match) unless etags is turned off. Statuses queued in
+    `statuses` (as (status, headers)) are answered first, one per
+    request. Every request is logged in `requests` as (method, path,
+    headers), and the client port it came from in `ports`. Each answer
+    waits `delay` seconds first; `peak` is the most requests answered
+    at once.
+    """
+
+    def __init__(self) -> None:
+        self.pages = {'6.200': {str(i): circuits_page(rows=5, seed=i) for i in range(3)},
+                      '6.101': {str(i): py_page(rows=5, seed=i) for i in range(3)}}
+        self.statuses = []
+        self.etags = True
+        self.requests = []
+        self.ports = []
+        self.delay = 0.0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.stand_in = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True,
+                                       kwargs={'poll_interval': 0.05})
+
+    @property
+    def base(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def url(self, class_code: str) -> str:
+        return f"{self.base}/{class_code}/progress"
+
+    def count(self, method: str = 'GET') -> int:
+        with self.lock:
+            return sum(request[0] == method for request in self.requests)
+
+    def answer(self, handler: BaseHTTPRequestHandler, send_body: bool) -> None:
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            self.respond(handler, send_body)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def respond(self, handler: BaseHTTPRequestHandler, send_body: bool) -> None:
+        parts = urlsplit(handler.path)
+        with self.lock:
+            self.requests.append((handler.command, parts.path, dict(handler.headers)))
+            self.ports.append(handler.client_address[1])
+            queued = self.statuses.pop(0) if self.statuses else None
+        if queued is not None:
+            status, headers = queued
+            handler.send_response(status)
+            for name, value in headers.items():
+                handler.send_header(name, value)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        class_code = parts.path.strip('/').split('/')[0]
+        token = parse_qs(parts.query).get('api_token', ['0'])[0]
+        body = self.pages.get(class_code, {}).get(token)
+        if body is None:
+            handler.send_error(404)
+            return
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.etags and handler.headers.get('If-None-Match') == etag:
+            handler.send_response(304)
+            handler.send_header('ETag', etag)
+            handler.end_headers()
+            return
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        if self.etags:
+            handler.send_header('ETag', etag)
+        handler.end_headers()
+        if send_body:
+            handler.wfile.write(body)
+
+@pytest.fixture
+def stand_in():
+    """
+    Starts a StandIn and points CatsoopRequests at it (without rate
+    limits, and with short retry delays) for the duration of a test.
+    """
+    stand_in = StandIn()
+    stand_in.thread.start()
+    old_urls = dict(CatsoopRequests.base_urls)
+    old_scheduler = CatsoopRequests.scheduler
+    old_resolver = CatsoopRequests.resolver
+    CatsoopRequests.scheduler = RequestScheduler(base_delay=0.001, rate=1e9, burst=1e9)
+    CatsoopRequests.resolver = None
+    for class_code in stand_in.pages:
+        CatsoopRequests.base_urls[class_code] = stand_in.url(class_code)
+    try:
+        yield stand_in
+    finally:
+        CatsoopRequests.base_urls.clear()
+        CatsoopRequests.base_urls.update(old_urls)
+        CatsoopRequests.scheduler = old_scheduler
+        CatsoopRequests.resolver = old_resolver
+        stand_in.server.shutdown()
+        stand_in.server.server_close()
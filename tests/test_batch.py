@@ -0,0 +1,44 @@
+"""
+Checks BatchCalculator: results come back one per record and in
+record order, a failing record only fails its own result, records
+are read lazily, and requests to a host stay under max_per_host.
+"""
+
+from catsoop_grade_calculator import BatchCalculator
+from catsoop_grade_calculator.general import ScoreCalculator
+
+def test_results_in_record_order(stand_in):
+    records = [(f"s{i}", ('6.200', '6.101')[i % 2], str(i % 3)) for i in range(12)]
+    results = list(BatchCalculator(4).grade(records))
+    assert [(result['student_id'], result['class_code']) for result in results] == \
+            [record[:2] for record in records]
+    assert all(result['error'] is None for result in results)
+    for (_, class_code, token), result in zip(records, results):
+        assert result['out_score'] == ScoreCalculator({class_code: token}).calculate_one(class_code)
+
+def test_failures_stay_in_their_result(stand_in):
+    records = [('a', '6.200', '0'), ('b', '6.999', '0'), ('c', '6.101', 'missing'),
+               ('d', '6.101', '1')]
+    results = list(BatchCalculator(2).grade(records))
+    assert results[0]['error'] is None and results[3]['error'] is None
+    assert results[1]['out_score'] is None
+    assert results[1]['error'].startswith('NotImplementedError')
+    assert results[2]['out_score'] is None and '404' in results[2]['error']
+
+def test_records_are_read_lazily(stand_in):
+    read = []
+    def records():
+        for i in range(100):
+            read.append(i)
+            yield (f"s{i}", '6.200', str(i % 3))
+    results = BatchCalculator(2).grade(records())
+    next(results)
+    # at most 2 * max_workers records are in flight at once
+    assert len(read) <= 2 * 2 + 1
+    assert sum(1 for _ in results) == 99
+
+def test_max_per_host(stand_in):
+    stand_in.delay = 0.02
+    records = [(f"s{i}", '6.200', str(i % 3)) for i in range(12)]
+    list(BatchCalculator(8, max_per_host=2).grade(records))
+    assert stand_in.peak <= 2
@@ -0,0 +1,63 @@
+"""
+Checks the benchmark suite: the synthetic pages are deterministic and
+parse into the rows they were generated with, corpora survive being
+written and loaded, and the runner saves, compares and flags
+regressions.
+"""
+
+from benchmarks import fixtures, run
+from catsoop_grade_calculator.parsers import CatsoopRequests, CircuitsParser, PyParser
+import json
+import pytest
+
+def counts(parser, body: bytes) -> dict[str, int]:
+    lines = CatsoopRequests.preprocess_data(body.decode('latin-1'))
+    return {category: len(records) for category, records in parser.parse_html(lines).items()}
+
+@pytest.mark.parametrize('rows', [1, 7])
+def test_pages_parse_into_their_rows(rows):
+    assert counts(CircuitsParser(), fixtures.circuits_page(rows, final=True)) == \
+            {'midterm': 1, 'final': 1, 'pset': rows, 'lab': rows, 'nanoquiz': rows,
+             'participation': rows}
+    assert counts(PyParser(), fixtures.py_page(rows)) == \
+            {'weights': 4, 'midterm': 1, 'lab': rows, 'reading': rows, 'recitation': rows}
+    assert 'midterm' not in counts(PyParser(), fixtures.py_page(rows, exams=False))
+
+def test_pages_are_deterministic():
+    for generate in fixtures.generators.values():
+        assert generate(5, 3) == generate(5, 3)
+        assert generate(5, 3) != generate(5, 4)
+
+def test_corpus_round_trip(tmp_path):
+    fixtures.main(['--out', str(tmp_path), '--rows', '2', '3', '--pages', '2'])
+    (tmp_path / 'notes.txt').write_text('not a page')
+    (tmp_path / 'nounderscore.html').write_text('not a page either')
+    corpus = fixtures.load_corpus(str(tmp_path))
+    expected = {class_code: [] for class_code in fixtures.generators}
+    for rows in (2, 3):
+        for class_code, pages in fixtures.synthetic_corpus(rows, 2).items():
+            expected[class_code].extend(pages)
+    assert {code: sorted(pages) for code, pages in corpus.items()} == \
+            {code: sorted(pages) for code, pages in expected.items()}
+
+def test_compare_flags_regressions():
+    baseline = {'a': {'median': 1.0}, 'b': {'median': 1.0}}
+    results = {'a': {'median': 1.05}, 'b': {'median': 1.5}, 'c': {'median': 9.0}}
+    assert run.compare(results, baseline, 0.1) == ['b: 1.50x slower']
+    assert run.compare(results, baseline, 0.6) == []
+
+def test_runner_saves_and_compares(tmp_path, capsys):
+    saved = str(tmp_path / 'baseline.json')
+    assert run.main(['--rows', '2', '--pages', '1', '--repeat', '1', '--save', saved]) == 0
+    with open(saved) as f:
+        results = json.load(f)
+    for class_code in fixtures.generators:
+        for stage in ('preprocess_data', 'parse_html', 'calculate_score',
+                      'generate_full_report'):
+            assert results[f"rows2/{class_code}/{stage}"]['min'] > 0
+    assert 'rows2/report_all_concurrent' in results
+
+    with open(saved, 'w') as f:
+        json.dump({name: {'median': 1e-9} for name in results}, f)
+    assert run.main(['--rows', '2', '--pages', '1', '--repeat', '1', '--compare', saved]) == 1
+    assert 'REGRESSION' in capsys.readouterr().err
@@ -0,0 +1,76 @@
+"""
+Checks ResponseCache through ScoreCalculator against the stand-in
+host: pages are asked for conditionally, a 304 (or an unchanged body)
+returns the cached grade, a changed page is graded again, and
+eviction keeps up with stores from many threads.
+"""
+
+from benchmarks.fixtures import circuits_page
+from catsoop_grade_calculator.cache import ResponseCache
+from catsoop_grade_calculator.general import ScoreCalculator
+import threading
+
+def events(calc: ScoreCalculator) -> list[str]:
+    stages = []
+    calc.add_hook(lambda event: stages.append(event['stage']))
+    return stages
+
+def test_etag_round_trip(stand_in, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    calc = ScoreCalculator({'6.200': '0'}, cache=cache)
+    stages = events(calc)
+    first = calc.calculate_one('6.200')
+    assert 'If-None-Match' not in stand_in.requests[-1][2]
+    assert 'cache_hit' not in stages
+
+    stages.clear()
+    assert calc.calculate_one('6.200') == first
+    assert stand_in.requests[-1][2].get('If-None-Match')
+    assert 'cache_hit' in stages and 'parse' not in stages
+
+    # a new page under the same token is graded again
+    stand_in.pages['6.200']['0'] = circuits_page(rows=5, seed=99)
+    stages.clear()
+    changed = calc.calculate_one('6.200')
+    assert 'parse' in stages and changed != first
+    assert calc.calculate_one('6.200') == changed
+
+def test_unchanged_body_without_etag(stand_in, tmp_path):
+    stand_in.etags = False
+    calc = ScoreCalculator({'6.101': '1'}, cache=ResponseCache(str(tmp_path)))
+    stages = events(calc)
+    first = calc.calculate_one('6.101')
+    stages.clear()
+    assert calc.calculate_one('6.101') == first
+    assert 'cache_hit' in stages and 'parse' not in stages
+
+def test_other_tokens_and_versions_miss(stand_in, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    ScoreCalculator({'6.200': '0'}, cache=cache).calculate_one('6.200')
+    url = stand_in.url('6.200')
+    assert cache.load(url, '0', ScoreCalculator.cache_version('6.200')) is not None
+    assert cache.load(url, '1', ScoreCalculator.cache_version('6.200')) is None
+    assert cache.load(url, '0', 'another parser') is None
+    cache.invalidate(token='0')
+    assert cache.load(url, '0', ScoreCalculator.cache_version('6.200')) is None
+
+def test_evictions_counted_across_threads(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), max_entries=50)
+    evictions = []
+    evict = cache.evict
+    def counting():
+        evictions.append(1)
+        evict()
+    monkeypatch.setattr(cache, 'evict', counting)
+    score = {'best_score': (1, 2), 'alt_scores': (), 'by_category': {}}
+    def store(thread: int) -> None:
+        for i in range(100):
+            cache.store('http://host/progress', f"{thread}-{i}", 'hash', score)
+    threads = [threading.Thread(target=store, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # one eviction per max_entries // 10 stores, no more and no fewer
+    assert len(evictions) == 800 // 5
+    assert len(cache.get_entry_paths()) <= 50 + 8 * 5
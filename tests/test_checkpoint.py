@@ -0,0 +1,74 @@
+"""
+Checks CheckpointLog: an interrupted batch run resumes without grading
+finished records again, records without a student id don't stand in
+for each other, and damaged lines are skipped.
+"""
+
+from catsoop_grade_calculator import BatchCalculator
+from catsoop_grade_calculator.checkpoint import CheckpointLog
+import json
+
+records = [('a', '6.200', '0'), (None, '6.200', '1'), (None, '6.200', '2'),
+           ('b', '6.101', '1')]
+
+def grade(path, records) -> list[dict]:
+    with CheckpointLog(str(path)) as checkpoint:
+        return list(BatchCalculator(2, checkpoint=checkpoint).grade(records))
+
+def test_resume_skips_finished_records(stand_in, tmp_path):
+    path = tmp_path / 'run.log'
+    first = grade(path, records[:3])
+    assert all(result['error'] is None for result in first)
+    fetched = stand_in.count()
+    assert fetched == 3
+
+    results = grade(path, records)
+    assert stand_in.count() == fetched + 1
+    assert results[:3] == first
+    assert results[3]['error'] is None
+    # the same token under another class, or another token, is graded anew
+    grade(path, [(None, '6.101', '1'), (None, '6.200', '0')])
+    assert stand_in.count() == fetched + 3
+
+def test_records_without_student_id_are_kept_apart(stand_in, tmp_path):
+    path = tmp_path / 'run.log'
+    first = grade(path, records[1:3])
+    assert first[0]['out_score'] != first[1]['out_score']
+    assert grade(path, records[1:3]) == first
+    with open(path) as f:
+        logged = [json.loads(line) for line in f]
+    # the log keeps a hash of the token, not the token
+    assert sorted(entry['token_hash'] for entry in logged) == \
+            sorted([CheckpointLog.hash_token('1'), CheckpointLog.hash_token('2')])
+    assert all(set(entry) == {'student_id', 'class_code', 'out_score', 'token_hash'}
+               for entry in logged)
+
+def test_failed_records_are_retried(stand_in, tmp_path):
+    path = tmp_path / 'run.log'
+    stand_in.pages['6.200'].pop('1')
+    assert grade(path, records[:2])[1]['error'] is not None
+    fetched = stand_in.count()
+    stand_in.pages['6.200']['1'] = stand_in.pages['6.200']['0']
+    assert grade(path, records[:2])[1]['error'] is None
+    assert stand_in.count() == fetched + 1
+
+def test_bad_lines_are_skipped(tmp_path):
+    path = tmp_path / 'run.log'
+    good = {'student_id': 'a', 'class_code': '6.200',
+            'out_score': {'best_score': [9, 10], 'alt_scores': [[8, 10]],
+                          'by_category': {'lab': 0.9}}}
+    lines = [json.dumps(good), '[1, 2]', '"text"', '{"student_id": "b"}',
+             json.dumps(dict(good, student_id='c', out_score={'best_score': 1})),
+             json.dumps(dict(good, student_id='d', out_score=None)),
+             json.dumps(dict(good, student_id='e'))[:-5]]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+    with CheckpointLog(str(path)) as checkpoint:
+        assert set(checkpoint.done) == {('a', '6.200')}
+        assert checkpoint.get('a', '6.200', 'x')['out_score'] == \
+                {'best_score': (9, 10), 'alt_scores': ((8, 10),),
+                 'by_category': {'lab': 0.9}}
+        checkpoint.record({'student_id': 'f', 'class_code': '6.200',
+                           'out_score': good['out_score'], 'error': None}, 'x')
+    with CheckpointLog(str(path)) as checkpoint:
+        assert set(checkpoint.done) == {('a', '6.200'), ('f', '6.200')}
@@ -0,0 +1,50 @@
+"""
+Checks fetching progress pages concurrently: the reports come out the
+same and in the same order as fetching one at a time, requests to a
+host stay under max_per_host, and connections to a host are reused.
+"""
+
+from catsoop_grade_calculator.general import ScoreCalculator
+from catsoop_grade_calculator.parsers import CatsoopRequests
+import io
+import pytest
+
+tokens = {'6.200': '1', '6.101': '2'}
+
+@pytest.mark.parametrize('format', ['text', 'jsonl', 'csv'])
+def test_concurrent_report_matches_sequential(stand_in, format):
+    calc = ScoreCalculator(tokens)
+    sequential = calc.report_all(format=format)
+    concurrent = calc.report_all(concurrent=True, format=format)
+    assert concurrent == sequential
+    sink = io.StringIO()
+    assert calc.report_all(concurrent=True, sink=sink, format=format) is None
+    assert sink.getvalue()[:-1] == sequential
+
+def test_calculate_each_keeps_token_order(stand_in):
+    for order in (tokens, dict(reversed(tokens.items()))):
+        calc = ScoreCalculator(order)
+        out_scores = list(calc.calculate_each())
+        assert [course for course, _ in out_scores] == list(order)
+        assert dict(out_scores) == {course: calc.calculate_one(course) for course in order}
+
+@pytest.mark.parametrize('max_per_host', [1, 2])
+def test_max_per_host(stand_in, max_per_host):
+    # both classes are on the stand-in's one host
+    stand_in.delay = 0.05
+    ScoreCalculator(tokens).calculate_all(max_per_host=max_per_host)
+    assert stand_in.peak <= max_per_host
+
+def test_connections_are_reused(stand_in):
+    calc = ScoreCalculator(tokens)
+    for _ in range(5):
+        calc.calculate_all()
+    assert len(stand_in.ports) == 10
+    assert len(set(stand_in.ports)) <= 2
+    assert CatsoopRequests.get_session(stand_in.url('6.200')) is \
+            CatsoopRequests.get_session(stand_in.url('6.101'))
+
+def test_errors_reach_the_caller(stand_in):
+    del stand_in.pages['6.101']['2']
+    with pytest.raises(Exception, match='404'):
+        ScoreCalculator(tokens).calculate_all()
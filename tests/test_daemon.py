@@ -0,0 +1,122 @@
+"""
+Checks the grade service: simultaneous requests for a page share one
+fetch, remembered grades are reused, refreshed and forgotten as
+documented, and the JSON API needs its auth token over a port.
+"""
+
+from catsoop_grade_calculator.daemon import GradeService, make_server, write_auth_token
+import contextlib
+import http.client
+import json
+import os
+import stat
+import threading
+import pytest
+
+@contextlib.contextmanager
+def running(service: GradeService, **kwargs):
+    server = make_server(service, port=0, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              kwargs={'poll_interval': 0.05})
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
+
+def call(server, method: str, path: str, token=None, body=None) -> tuple[int, object]:
+    connection = http.client.HTTPConnection(*server.server_address)
+    headers = {} if token is None else {'Authorization': f"Bearer {token}"}
+    data = None if body is None else json.dumps(body)
+    connection.request(method, path, data, headers)
+    response = connection.getresponse()
+    out = response.status, json.loads(response.read())
+    connection.close()
+    return out
+
+def test_simultaneous_requests_share_one_fetch(stand_in):
+    stand_in.delay = 0.2
+    service = GradeService(refresh_interval=None)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get('6.200', '0')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stand_in.count() == 1
+    assert len(results) == 8 and all(result == results[0] for result in results)
+    service.stop()
+
+def test_remembered_grades(stand_in):
+    service = GradeService(refresh_interval=None)
+    first = service.get('6.101', '1', 'a')
+    assert first['error'] is None and first['updated_at'] == first['checked_at']
+    assert service.get('6.101', '1', 'b')['student_id'] == 'b'
+    assert stand_in.count() == 1
+    service.get('6.101', '1', refresh=True)
+    service.get('6.101', '1', max_age=0)
+    assert stand_in.count() == 3
+    # a failed refetch keeps the last good grade, with the error
+    del stand_in.pages['6.101']['1']
+    failed = service.get('6.101', '1', refresh=True)
+    assert failed['error'] and failed['out_score'] == first['out_score']
+    # a page that never worked isn't remembered
+    assert service.get('6.101', 'nope')['error']
+    assert ('6.101', 'nope') not in service.latest
+    service.stop()
+
+def test_forgets_pages_outside_the_token_file(stand_in):
+    service = GradeService({'6.200': '0'}, refresh_interval=None, max_pages=2)
+    service.get_own()
+    for token in ('1', '2', '0'):
+        service.get('6.101', token)
+    assert list(service.latest) == [('6.200', '0'), ('6.101', '0')]
+    service.page_ttl = -1
+    service.refresh_interval = 0
+    assert service.refresh_stale() == 1
+    assert list(service.latest) == [('6.200', '0')]
+    service.stop()
+
+def test_api_needs_auth_token(stand_in):
+    service = GradeService({'6.200': '0'}, refresh_interval=None)
+    with running(service) as server:
+        token = server.auth_token
+        assert token
+        assert call(server, 'GET', '/health')[0] == 401
+        assert call(server, 'GET', '/health', 'wrong')[0] == 401
+        status, health = call(server, 'GET', '/health', token)
+        assert status == 200 and health['ok']
+        status, grades = call(server, 'GET', '/grades', token)
+        assert status == 200 and grades['6.200']['error'] is None
+        assert call(server, 'GET', '/grades/6.200?max_age=x', token)[0] == 400
+        assert call(server, 'GET', '/grades/6.101', token)[0] == 404
+        status, results = call(server, 'POST', '/grades', token,
+                               [{'class_code': '6.101', 'token': '2', 'student_id': 's'}])
+        assert status == 200 and results[0]['student_id'] == 's'
+        assert call(server, 'POST', '/grades', token, [{'class_code': '6.999', 'token': '2'}])[0] \
+                == 400
+        assert call(server, 'POST', '/grades', token, [{'class_code': '6.101', 'token': 2}])[0] \
+                == 400
+
+def test_auth_token_file_is_private(tmp_path):
+    path = str(tmp_path / 'service_token')
+    with open(path, 'w') as f:
+        f.write('old')
+    os.chmod(path, 0o644)
+    token = write_auth_token(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    with open(path) as f:
+        assert f.read().strip() == token
+
+def test_unix_socket_is_private(tmp_path):
+    path = str(tmp_path / 'grades.sock')
+    server = make_server(GradeService(refresh_interval=None), socket_path=path)
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert server.auth_token is None
+    finally:
+        server.server_close()
+        server.service.stop()
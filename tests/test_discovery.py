@@ -0,0 +1,86 @@
+"""
+Checks TermResolver against the stand-in host: which candidate pages
+count as existing, that probes go through the request scheduler, and
+that a damaged results file doesn't break resolving.
+"""
+
+from benchmarks.fixtures import circuits_page
+from catsoop_grade_calculator.parsers import CatsoopRequests
+from catsoop_grade_calculator.parsers.discovery import TermResolver
+import datetime
+import json
+
+today = datetime.date(2024, 9, 10)
+
+def resolver_for(stand_in, tmp_path, terms_back: int = 3) -> TermResolver:
+    return TermResolver(str(tmp_path / 'urls.json'), terms_back=terms_back,
+                        url_templates={'6.200': stand_in.base + '/{season}{yy}/progress'})
+
+def test_candidate_terms():
+    assert TermResolver.candidate_terms(today) == \
+            [(2024, 'fall'), (2024, 'spring'), (2023, 'fall'), (2023, 'spring')]
+    assert TermResolver.current_term(datetime.date(2025, 1, 20)) == (2024, 'fall')
+    assert TermResolver.current_term(datetime.date(2025, 7, 1)) == (2025, 'spring')
+
+def test_discover_picks_newest_existing(stand_in, tmp_path):
+    for term in ('spring24', 'fall23'):
+        stand_in.pages[term] = {'0': circuits_page()}
+    resolver = resolver_for(stand_in, tmp_path)
+    assert resolver.discover('6.200', today) == stand_in.base + '/spring24/progress'
+    assert stand_in.count('HEAD') == 4 and stand_in.count('GET') == 0
+    assert resolver.discover('6.101', today) is None
+
+def test_redirects_and_errors_are_not_pages(stand_in, tmp_path):
+    stand_in.pages['fall24'] = {'0': circuits_page()}
+    resolver = resolver_for(stand_in, tmp_path, terms_back=0)
+    url = stand_in.base + '/fall24/progress'
+    stand_in.statuses.append((302, {'Location': url}))
+    assert not resolver.probe(url)
+    stand_in.statuses.append((404, {}))
+    assert not resolver.probe(url)
+    stand_in.statuses.append((304, {}))
+    assert not resolver.probe(url)
+    assert resolver.probe(url)
+
+def test_range_fallback(stand_in, tmp_path):
+    stand_in.pages['fall24'] = {'0': circuits_page()}
+    resolver = resolver_for(stand_in, tmp_path, terms_back=0)
+    url = stand_in.base + '/fall24/progress'
+    stand_in.statuses.append((405, {}))
+    assert resolver.probe(url)
+    method, _, headers = stand_in.requests[-1]
+    assert method == 'GET' and headers.get('Range') == 'bytes=0-0'
+    stand_in.statuses.extend([(405, {}), (302, {'Location': url})])
+    assert not resolver.probe(url)
+
+def test_probes_go_through_scheduler(stand_in, tmp_path):
+    stand_in.pages['fall24'] = {'0': circuits_page()}
+    resolver = resolver_for(stand_in, tmp_path, terms_back=0)
+    url = stand_in.base + '/fall24/progress'
+    stand_in.statuses.append((503, {}))
+    assert resolver.probe(url)
+    stats = CatsoopRequests.scheduler.stats()[CatsoopRequests.get_host(url)]
+    assert stats['requests'] == 2 and stats['retries'] == 1
+    # probe_retries caps the retries of a probe
+    stand_in.statuses.extend([(503, {})] * 3)
+    assert not resolver.probe(url)
+    assert len(stand_in.statuses) == 1
+
+def test_load_discards_bad_entries(stand_in, tmp_path):
+    stand_in.pages['fall24'] = {'0': circuits_page()}
+    good = {'url': 'https://example.com/progress', 'term': 'fall2024', 'resolved_at': 1.0}
+    with open(tmp_path / 'urls.json', 'w') as f:
+        json.dump({'6.101': good, '6.200': {'url': 'https://example.com/old'},
+                   '6.300': [], '6.400': {'url': 1, 'term': 'fall2024', 'resolved_at': 1.0}}, f)
+    resolver = resolver_for(stand_in, tmp_path, terms_back=0)
+    assert resolver.resolved == {'6.101': good}
+
+    with open(tmp_path / 'urls.json', 'w') as f:
+        json.dump(['not', 'a', 'dict'], f)
+    resolver = resolver_for(stand_in, tmp_path, terms_back=0)
+    assert resolver.resolved == {}
+    # resolve probes for the term going on now
+    term = TermResolver.term_name(TermResolver.current_term())
+    season, year = term[:-4], term[-2:]
+    stand_in.pages[season + year] = {'0': circuits_page()}
+    assert resolver.resolve('6.200') == f"{stand_in.base}/{season}{year}/progress"
@@ -0,0 +1,68 @@
+"""
+Checks GradeHistory: grades written in batches come back from the
+queries, and nothing buffered is lost when a record can't be written.
+"""
+
+from catsoop_grade_calculator import BatchCalculator
+from catsoop_grade_calculator.history import GradeHistory
+import pytest
+
+def out_score(earned: float, possible: float = 100.0) -> dict:
+    return {'best_score': (earned, possible),
+            'alt_scores': ((earned - 1, possible),),
+            'by_category': {'lab': earned / possible, 'pset': 0.5}}
+
+score_data = {'lab': [{'assignment_name': 'Lab 1', 'score': (9.0, 10.0)},
+                      {'assignment_name': 'Lab 2', 'sub_assignment': 'checkoff',
+                       'score': (1.0, 1.0)}]}
+
+def test_round_trip(tmp_path):
+    with GradeHistory(str(tmp_path / 'h.db'), batch_size=2) as history:
+        history.record('a', '6.200', out_score(80), recorded_at=1.0)
+        history.record('a', '6.200', out_score(90), score_data, recorded_at=2.0)
+        history.record('b', '6.200', out_score(70), recorded_at=3.0)
+        scores = history.scores('a', '6.200')
+        assert [score['best_score'] for score in scores] == [(80, 100), (90, 100)]
+        assert scores[0]['alt_scores'] == ((79, 100),)
+        assert history.scores('a', '6.200', start=1.5) == scores[1:]
+        assert history.category_trend('a', '6.200', 'lab') == [(1.0, 0.8), (2.0, 0.9)]
+        assert [row['student'] for row in history.course_category('6.200', 'lab')] \
+                == ['a', 'a', 'b']
+        assert history.assignments('a', '6.200') == [
+                {'category': 'lab', 'name': 'Lab 1', 'sub_assignment': None,
+                 'earned': 9.0, 'possible': 10.0},
+                {'category': 'lab', 'name': 'Lab 2', 'sub_assignment': 'checkoff',
+                 'earned': 1.0, 'possible': 1.0}]
+        assert history.assignments('a', '6.200', at=1.5) == []
+
+def test_missing_student_is_rejected(tmp_path):
+    with GradeHistory(str(tmp_path / 'h.db')) as history:
+        with pytest.raises(ValueError):
+            history.record(None, '6.200', out_score(80))
+        assert history.pending == []
+
+def test_failed_flush_keeps_buffered_grades(tmp_path):
+    history = GradeHistory(str(tmp_path / 'h.db'))
+    history.record('a', '6.200', out_score(80))
+    bad = out_score(50)
+    bad['alt_scores'] = {object()}
+    history.record('b', '6.200', bad)
+    with pytest.raises(TypeError):
+        history.flush()
+    assert len(history.pending) == 2
+    history.pending.pop()
+    history.close()
+    with GradeHistory(str(tmp_path / 'h.db')) as history:
+        assert [score['best_score'] for score in history.scores('a', '6.200')] == [(80, 100)]
+        assert history.scores('b', '6.200') == []
+
+def test_batch_records_without_student_id(stand_in, tmp_path):
+    with GradeHistory(str(tmp_path / 'h.db')) as history:
+        batch = BatchCalculator(2, history=history)
+        results = list(batch.grade([('a', '6.200', '0'), (None, '6.200', '1'),
+                                    ('b', '6.101', '2')]))
+        assert [result['error'] is None for result in results] == [True, False, True]
+        assert 'student id' in results[1]['error']
+        assert len(history.scores('a', '6.200')) == 1
+        assert len(history.scores('b', '6.101')) == 1
+        assert history.assignments('a', '6.200')
@@ -0,0 +1,90 @@
+"""
+Checks that incremental re-grading (Parser.parse_incremental and
+score_incremental) always gives exactly what parsing and scoring the
+page from scratch gives, over random sequences of edits to a page.
+"""
+
+from benchmarks.fixtures import circuits_page, py_page
+from catsoop_grade_calculator.parsers import CatsoopRequests, CircuitsParser, PyParser
+from catsoop_grade_calculator.parsers.records import CategoryColumns
+import random
+import pytest
+
+def page_lines(body: bytes) -> list[str]:
+    # requests decodes text/html without a charset as latin-1
+    return CatsoopRequests.preprocess_data(body.decode('latin-1'))
+
+def as_dicts(score_data: dict) -> dict:
+    return {category: [dict(record) for record in records]
+            for category, records in score_data.items()}
+
+def score_or_error(score):
+    try:
+        return score()
+    except ZeroDivisionError as e:
+        return type(e)
+
+def edit(lines: list[str], pool: list[str], r: random.Random) -> None:
+    """
+    Deletes, inserts, changes a digit of, or replaces a few lines.
+    """
+    for _ in range(r.randint(1, 4)):
+        op = r.random()
+        i = r.randrange(len(lines) + 1)
+        if op < 0.3 and lines:
+            del lines[min(i, len(lines) - 1)]
+        elif op < 0.6:
+            lines.insert(i, r.choice(pool))
+        elif op < 0.8 and lines:
+            j = min(i, len(lines) - 1)
+            lines[j] = lines[j].replace(str(r.randint(0, 9)), str(r.randint(0, 9)))
+        else:
+            lines[i:i + 3] = r.sample(pool, min(3, len(pool)))
+
+@pytest.mark.parametrize('parser_class, make_page', [(CircuitsParser, circuits_page),
+                                                     (PyParser, py_page)])
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_matches_full(parser_class, make_page, seed):
+    r = random.Random(seed)
+    parser = parser_class()
+    lines = page_lines(make_page(rows=r.randint(1, 15), seed=seed))
+    pool = list(lines)
+    state = None
+    for step in range(12):
+        state = parser.parse_incremental(lines, state)
+        full = parser.parse_html(lines)
+        assert as_dicts(state.score_data) == as_dicts(full)
+        assert list(state.score_data) == list(full)
+        expected = score_or_error(lambda: parser.calculate_score(full))
+        assert score_or_error(lambda: parser.score_incremental(state)) == expected
+        # edited in place, which must not change what the state kept
+        edit(lines, pool, r)
+
+def test_state_keeps_its_own_lines():
+    parser = CircuitsParser()
+    lines = page_lines(circuits_page(rows=5))
+    state = parser.parse_incremental(lines)
+    changed = ['PSet 1: 12.5/10.0' if line.startswith('PSet 1:') else line
+               for line in lines]
+    assert changed != lines
+    lines[:] = changed
+    state = parser.parse_incremental(lines, state)
+    assert as_dicts(state.score_data) == as_dicts(parser.parse_html(changed))
+    assert parser.score_incremental(state) == parser.calculate_score(parser.parse_html(changed))
+
+@pytest.mark.parametrize('normalize_each', [True, False])
+def test_average_is_summed_in_order(normalize_each):
+    # the float the original code gave, adding one assignment at a time
+    r = random.Random(0)
+    for _ in range(200):
+        scores = [(r.randint(0, 200) / r.choice([1, 2, 3, 10]), r.randint(1, 100) / 10)
+                  for _ in range(r.randint(1, 30))]
+        total_earned, total_possible = 0, 0
+        for earned, possible in scores:
+            if normalize_each:
+                earned, possible = earned / possible, 1
+            total_earned += earned
+            total_possible += possible
+        columns = CategoryColumns([score[0] for score in scores],
+                                  [score[1] for score in scores])
+        assert columns.average(normalize_each) == total_earned / total_possible
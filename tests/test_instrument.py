@@ -0,0 +1,81 @@
+"""
+Checks the per-stage events ScoreCalculator sends to hooks, hooks
+installed for one thread, and the HistogramSummary and
+JsonLinesExporter hooks.
+"""
+
+from catsoop_grade_calculator.cache import ResponseCache
+from catsoop_grade_calculator.general import ScoreCalculator
+from catsoop_grade_calculator.instrument import HistogramSummary, JsonLinesExporter
+import io
+import json
+import threading
+
+def test_stage_events(stand_in):
+    calc = ScoreCalculator({'6.200': '1'})
+    events = []
+    calc.add_hook(events.append)
+    out_score = calc.calculate_one('6.200')
+    assert [event['stage'] for event in events] == \
+            ['request', 'download', 'preprocess', 'parse', 'score']
+    request, download, preprocess, parse, score = events
+    assert request['status'] == 200
+    assert download['bytes'] == len(stand_in.pages['6.200']['1'])
+    assert preprocess['lines'] == len(preprocess['output'])
+    assert parse['assignments'] == sum(map(len, parse['output'].values()))
+    assert score['output'] == out_score
+    assert all(event['class_code'] == '6.200' and event['seconds'] >= 0 for event in events)
+    # hooks don't change the result
+    calc.remove_hook(events.append)
+    assert calc.calculate_one('6.200') == out_score
+    assert len(events) == 5
+
+def test_cache_hit_event(stand_in, tmp_path):
+    calc = ScoreCalculator({'6.101': '0'}, cache=ResponseCache(str(tmp_path)))
+    calc.calculate_one('6.101')
+    events = []
+    calc.add_hook(events.append)
+    out_score = calc.calculate_one('6.101')
+    assert [event['stage'] for event in events] == ['request', 'cache_hit']
+    assert events[0]['status'] == 304 and events[1]['output'] == out_score
+
+def test_thread_hooks_only_see_their_thread(stand_in):
+    calc = ScoreCalculator({'6.200': '0', '6.101': '0'})
+    seen = {}
+    def grade(class_code: str) -> None:
+        events = []
+        with calc.hooked(events.append, this_thread=True):
+            calc.calculate_one(class_code)
+        calc.calculate_one(class_code)
+        seen[class_code] = {event['class_code'] for event in events}, len(events)
+    threads = [threading.Thread(target=grade, args=(code,)) for code in calc.tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == {'6.200': ({'6.200'}, 5), '6.101': ({'6.101'}, 5)}
+
+def test_debug_prints_preprocessed(stand_in, capsys):
+    ScoreCalculator({'6.200': '0'}).calculate_one('6.200', debug=True)
+    assert 'Problem Sets' in capsys.readouterr().out
+
+def test_summary_and_exporter(stand_in):
+    calc = ScoreCalculator({'6.200': '0', '6.101': '1'})
+    summary = HistogramSummary()
+    sink = io.StringIO()
+    calc.add_hook(summary)
+    calc.add_hook(JsonLinesExporter(sink))
+    for _ in range(3):
+        calc.calculate_all()
+    assert {stage: stats['count'] for stage, stats in summary.stages.items()} == \
+            {stage: 6 for stage in ('request', 'download', 'preprocess', 'parse', 'score')}
+    assert summary.stages['download']['sizes']['bytes'] == \
+            3 * (len(stand_in.pages['6.200']['0']) + len(stand_in.pages['6.101']['1']))
+    for stage in summary.stages:
+        stats = summary.stages[stage]
+        assert stats['min'] <= summary.quantile(stage, 0.5) <= stats['max']
+    table = summary.summary().splitlines()
+    assert len(table) == 6 and table[1].startswith('request')
+    records = [json.loads(line) for line in sink.getvalue().splitlines()]
+    assert len(records) == 30
+    assert all('output' not in record and 'time' in record for record in records)
@@ -0,0 +1,111 @@
+"""
+Checks that pages parsed from a remembered layout (see LayoutTemplate)
+give exactly what parsing them in full gives, including pages that
+nearly match a remembered layout.
+"""
+
+from benchmarks.fixtures import circuits_page, py_page
+from catsoop_grade_calculator.parsers import CatsoopRequests, CircuitsParser, PyParser
+import random
+import pytest
+
+parsers = [(CircuitsParser, circuits_page), (PyParser, py_page)]
+
+def page_lines(body: bytes) -> list[str]:
+    # requests decodes text/html without a charset as latin-1
+    return CatsoopRequests.preprocess_data(body.decode('latin-1'))
+
+def full_parse(parser_class, lines: list[str]):
+    # a new parser has no layouts yet, so it parses the page in full
+    try:
+        return [(category, [dict(record) for record in records])
+                for category, records in parser_class().parse_html(lines).items()]
+    except Exception as e:
+        return type(e)
+
+def parse(parser, lines: list[str]):
+    try:
+        return [(category, [dict(record) for record in records])
+                for category, records in parser.parse_html(lines).items()]
+    except Exception as e:
+        return type(e)
+
+def count_hits(parser) -> list[int]:
+    hits = [0]
+    read_records = parser.read_records
+    def counting(*args):
+        hits[0] += 1
+        read_records(*args)
+    parser.read_records = counting
+    return hits
+
+@pytest.mark.parametrize('parser_class, make_page', parsers)
+def test_alternating_layouts_hit(parser_class, make_page):
+    parser = parser_class()
+    hits = count_hits(parser)
+    pages = [page_lines(make_page(rows=3 + i % 4, seed=i)) for i in range(24)]
+    for lines in pages:
+        assert parse(parser, lines) == full_parse(parser_class, lines)
+    # one full parse per layout, then every page is read from its template
+    assert len(parser.layout_templates) == 4
+    assert hits[0] == len(pages) - 4
+
+def test_templates_are_bounded_and_per_parser():
+    parser = CircuitsParser()
+    parser.max_layout_templates = 2
+    for rows in (1, 2, 3):
+        parser.parse_html(page_lines(circuits_page(rows=rows)))
+    assert len(parser.layout_templates) == 2
+    assert len(CircuitsParser().layout_templates) == 0
+
+# what near misses are made of: numbers, dots, the marks of binary
+# lines, and the letters of headers and keywords
+pool = list('0123456789..') + ['\x93', '\x98', 'â', '%', ':', '/', ' ', 'x', 'L', 'l',
+                               'a', 'b', 'e', 't', 'P', 'S']
+
+def near_miss(lines: list[str], r: random.Random) -> list[str]:
+    """
+    Changes, inserts or deletes a character or two of a page.
+    """
+    lines = list(lines)
+    for _ in range(r.randint(1, 2)):
+        i = r.randrange(len(lines))
+        line = lines[i]
+        j = r.randrange(len(line) + 1)
+        op = r.random()
+        if op < 0.2 and line:
+            # the end of the line, where binary marks and numbers are
+            j = len(line) - 1
+        if op < 0.5 and j < len(line):
+            line = line[:j] + r.choice(pool) + line[j + 1:]
+        elif op < 0.8:
+            line = line[:j] + r.choice(pool) + line[j:]
+        else:
+            line = line[:j] + line[j + 1:]
+        lines[i] = line
+    return lines
+
+@pytest.mark.parametrize('parser_class, make_page', parsers)
+@pytest.mark.parametrize('seed', range(10))
+def test_near_misses_match_full_parse(parser_class, make_page, seed):
+    r = random.Random(seed)
+    parser = parser_class()
+    original = page_lines(make_page(rows=r.randint(1, 6), seed=seed))
+    parser.parse_html(original)
+    for _ in range(60):
+        lines = near_miss(original, r)
+        assert parse(parser, lines) == full_parse(parser_class, lines)
+        # the near miss may have become a template; the original must
+        # still come out right either way
+        assert parse(parser, original) == full_parse(parser_class, original)
+
+def test_binary_mark_change_hits():
+    parser = CircuitsParser()
+    lines = page_lines(circuits_page(rows=4, seed=1))
+    parser.parse_html(lines)
+    hits = count_hits(parser)
+    flipped = [line[:-1] + ('\x98' if line[-1] == '\x93' else '\x93')
+               if line.startswith('Lecture') else line for line in lines]
+    assert flipped != lines
+    assert parse(parser, flipped) == full_parse(CircuitsParser, flipped)
+    assert hits[0] == 1
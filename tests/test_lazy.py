@@ -0,0 +1,58 @@
+"""
+Checks that importing the package, and starting the command line,
+doesn't load what they don't need (requests, BeautifulSoup, NumPy,
+the parsers), and that every lazily loaded name still resolves.
+"""
+
+from catsoop_grade_calculator.general import ParserIndex, ScoreCalculator, _parser_paths
+import catsoop_grade_calculator
+import catsoop_grade_calculator.parsers
+import os
+import subprocess
+import sys
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+heavy = ['requests', 'bs4', 'numpy', 'sqlite3', 'catsoop_grade_calculator.parsers.circuits',
+         'catsoop_grade_calculator.parsers.py']
+
+def loaded_after(code: str) -> list[str]:
+    # stdout is left to --help
+    check = (f"{code}\nimport sys\n"
+             f"print(' '.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr)")
+    output = subprocess.run([sys.executable, '-c', check], cwd=root, check=True,
+                            capture_output=True, text=True).stderr
+    return output.split()
+
+@pytest.mark.parametrize('code', [
+        'import catsoop_grade_calculator',
+        'from catsoop_grade_calculator import ScoreCalculator, BatchCalculator',
+        'from catsoop_grade_calculator.parsers import Parser',
+        'from catsoop_grade_calculator.cli import main\n'
+        'try:\n    main(["--help"])\nexcept SystemExit:\n    pass'])
+def test_imports_stay_light(code):
+    assert loaded_after(code) == []
+
+@pytest.mark.parametrize('module', [catsoop_grade_calculator, catsoop_grade_calculator.parsers])
+def test_lazy_names_resolve(module):
+    for name in module.lazy_names:
+        assert getattr(module, name).__name__ == name
+        assert name in dir(module)
+    with pytest.raises(AttributeError):
+        module.NoSuchName
+
+def test_parser_index():
+    index = ParserIndex(_parser_paths)
+    assert list(index) == ['6.200', '6.101'] and len(index) == 2
+    assert '6.200' in index and '6.999' not in index and index.classes == {}
+    assert index['6.200'].__name__ == 'CircuitsParser'
+    assert list(index.classes) == ['6.200']
+    index['6.999'] = index['6.101']
+    index['6.200'] = index['6.101']
+    assert list(index) == ['6.101', '6.200', '6.999'] and len(index) == 3
+    del index['6.999']
+    with pytest.raises(KeyError):
+        del index['6.999']
+    with pytest.raises(KeyError):
+        index['6.999']
+    assert ScoreCalculator.parser_index['6.101'] is ScoreCalculator.get_parser_class('6.101')
@@ -0,0 +1,89 @@
+"""
+Checks HeaderMatcher against checking every header of the table in
+turn, as parse_html did before it: on random lines and header tables
+(with headers inside other headers), and on whole pages.
+"""
+
+from benchmarks.fixtures import circuits_page, py_page
+from catsoop_grade_calculator.parsers import CatsoopRequests, CircuitsParser, PyParser
+from catsoop_grade_calculator.parsers.base_parser import HeaderMatcher
+import os
+import random
+import pytest
+
+corpus_dir = os.path.join(os.path.dirname(__file__), 'corpus')
+
+def naive_find(headers: dict, lowered_line: str):
+    found = None
+    for i, name in enumerate(headers):
+        if name in lowered_line:
+            found = i
+    return found
+
+def naive_parse(parser, inp_lines: list[str]) -> dict:
+    # parse_html before HeaderMatcher
+    out = {}
+    headers = parser.headers
+    cur_type = None
+    for line in inp_lines:
+        for key_header in headers:
+            if key_header in line.lower():
+                cur_type = key_header
+        if cur_type is None:
+            continue
+        add_func = headers[cur_type].get('func', parser.add_score_to_dict)
+        args = headers[cur_type].get('args', [])
+        kwargs = headers[cur_type].get('kwargs', {})
+        add_func(out, line, *args, **kwargs)
+    return out
+
+def as_dicts(score_data: dict) -> dict:
+    return {category: [dict(record) for record in records]
+            for category, records in score_data.items()}
+
+@pytest.mark.parametrize('seed', range(20))
+def test_find_matches_naive(seed):
+    r = random.Random(seed)
+    words = ['lab', 'labs', 'pset', 'problem set', 'set', 'quiz', 'nanoquiz', 'exam',
+             'midterm', 'term', 'final', 'a', 'ab']
+    headers = {name: {} for name in r.sample(words, r.randint(1, len(words)))}
+    matcher = HeaderMatcher(headers)
+    for _ in range(200):
+        line = ''.join(r.choice(words + [' ', ':', '1', 'x', 'b'])
+                       for _ in range(r.randint(0, 8)))
+        assert matcher.find(line) == naive_find(headers, line)
+
+@pytest.mark.parametrize('parser_class', [CircuitsParser, PyParser])
+def test_parser_headers_match_naive(parser_class):
+    parser = parser_class()
+    matcher = parser.get_header_matcher()
+    names = list(parser.headers)
+    r = random.Random(0)
+    for _ in range(500):
+        line = ' '.join(r.choice(names + ['total', '10.0/10.0', 'x'])
+                        for _ in range(r.randint(0, 4)))
+        assert matcher.find(line) == naive_find(parser.headers, line)
+
+def pages() -> list:
+    out = []
+    for seed in range(5):
+        out.append((CircuitsParser, circuits_page(rows=seed + 1, seed=seed, final=seed % 2 == 1)))
+        out.append((PyParser, py_page(rows=seed + 1, seed=seed, exams=seed % 2 == 0)))
+    for name, parser_class in (('circuits', CircuitsParser), ('py', PyParser)):
+        with open(os.path.join(corpus_dir, name + '.html'), 'rb') as f:
+            out.append((parser_class, f.read()))
+    return out
+
+@pytest.mark.parametrize('parser_class, body', pages())
+def test_parse_html_matches_naive(parser_class, body):
+    lines = CatsoopRequests.preprocess_data(body.decode('latin-1'))
+    assert as_dicts(parser_class().parse_html(lines)) == \
+            as_dicts(naive_parse(parser_class(), lines))
+
+def test_matcher_follows_header_changes():
+    parser = CircuitsParser()
+    matcher = parser.get_header_matcher()
+    assert CircuitsParser().get_header_matcher() is matcher
+    parser.headers = dict(parser.headers, extra={'args': ['extra', 'binary']})
+    rebuilt = parser.get_header_matcher()
+    assert rebuilt is not matcher and rebuilt.find('extra') == len(parser.headers) - 1
@@ -0,0 +1,35 @@
+"""
+Checks PipelineCalculator: its results are BatchCalculator's, in record
+order, and the features it can't offer are refused up front.
+"""
+
+from catsoop_grade_calculator import BatchCalculator
+from catsoop_grade_calculator.pipeline import PipelineCalculator
+import pytest
+
+def test_results_match_batch(stand_in):
+    records = [(f"s{i}", ('6.200', '6.101')[i % 2], str(i % 3)) for i in range(10)]
+    records += [('x', '6.999', '0'), ('y', '6.101', 'missing')]
+    pipeline = PipelineCalculator(cpu_workers=2, io_workers=4, queue_size=2)
+    results = list(pipeline.grade(records))
+    assert results == list(BatchCalculator(4).grade(records))
+    assert all(result['error'] is None for result in results[:10])
+    assert results[10]['error'].startswith('NotImplementedError')
+    assert '404' in results[11]['error']
+
+def test_fork_workers(stand_in):
+    records = [(f"s{i}", '6.200', str(i % 3)) for i in range(6)]
+    pipeline = PipelineCalculator(cpu_workers=1, io_workers=2, mp_context='fork')
+    assert list(pipeline.grade(records)) == list(BatchCalculator(2).grade(records))
+
+@pytest.mark.parametrize('option', [{'cache': object()}, {'incremental': True},
+                                    {'history': object()}, {'checkpoint': object()}])
+def test_unsupported_options(option):
+    with pytest.raises(ValueError, match=next(iter(option))):
+        PipelineCalculator(**option)
+
+def test_hooks_are_refused(stand_in):
+    pipeline = PipelineCalculator(cpu_workers=1)
+    pipeline.add_hook(lambda event: None)
+    with pytest.raises(ValueError):
+        list(pipeline.grade([('a', '6.200', '0')]))
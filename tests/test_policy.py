@@ -0,0 +1,74 @@
+"""
+Checks the grading policies of parsers/policy.py: dropping the lowest
+assignments (Dinkelbach's method against trying every subset),
+scoring each scheme as the parsers always have, and picking the best.
+"""
+
+from catsoop_grade_calculator.parsers import CircuitsParser, PyParser
+from catsoop_grade_calculator.parsers.policy import best_of, category_average, scheme_scores
+from catsoop_grade_calculator.parsers.records import CategoryColumns
+import itertools
+import random
+import pytest
+
+def brute_force_average(earned: list[float], possible: list[float], drop: int,
+                        normalize_each: bool) -> float:
+    keep = len(earned) - min(drop, len(earned) - 1)
+    return max(CategoryColumns([earned[i] for i in kept], [possible[i] for i in kept])
+               .average(normalize_each)
+               for kept in itertools.combinations(range(len(earned)), keep))
+
+@pytest.mark.parametrize('normalize_each', [True, False])
+@pytest.mark.parametrize('seed', range(10))
+def test_drop_lowest_matches_brute_force(normalize_each, seed):
+    r = random.Random(seed)
+    for _ in range(100):
+        n = r.randint(1, 8)
+        possible = [r.randint(1, 20) for _ in range(n)]
+        # mostly at most full marks, sometimes zero or extra credit
+        earned = [r.choice([0, r.randint(0, 20)]) for _ in range(n)]
+        earned = [min(e, p) if r.random() < 0.8 else e for e, p in zip(earned, possible)]
+        drop = r.randint(0, n)
+        expected = brute_force_average(earned, possible, drop, normalize_each)
+        got = category_average(CategoryColumns(earned, possible), drop, normalize_each)
+        assert got == pytest.approx(expected, rel=1e-12, abs=1e-12)
+
+def test_scheme_scores_sum_in_scheme_order():
+    # the loop the parsers used before scheme_scores
+    r = random.Random(0)
+    categories = ['midterm', 'final', 'pset', 'lab', 'nanoquiz']
+    for _ in range(200):
+        schemes = tuple(dict((category, r.randint(1, 40) / r.choice([1, 3, 7]))
+                             for category in r.sample(categories, r.randint(1, 5)))
+                        for _ in range(r.randint(1, 4)))
+        by_category = {category: r.random()
+                       for category in categories if r.random() < 0.8}
+        expected = []
+        for scheme in schemes:
+            earned, possible = 0, 0
+            for category, weight in scheme.items():
+                if category not in by_category: continue
+                earned += weight * by_category[category]
+                possible += weight
+            expected.append((earned, possible))
+        assert scheme_scores(schemes, by_category) == expected
+
+def test_drop_rules_are_per_parser():
+    parser = CircuitsParser()
+    parser.drop_lowest['nanoquiz'] = 2
+    parser.normalize_each['pset'] = False
+    assert CircuitsParser().drop_lowest == {}
+    assert PyParser().normalize_each == {}
+
+def test_best_of_skips_empty_schemes():
+    assert best_of([(8, 10), (9, 10)]) == ((9, 10), ((8, 10),))
+    # ties go to the earlier scheme
+    assert best_of([(8, 10), (4, 5)]) == ((8, 10), ((4, 5),))
+    assert best_of([(0, 0), (1, 10)]) == ((1, 10), ((0, 0),))
+    assert best_of([(0, 10), (0, 0)]) == ((0, 10), ((0, 0),))
+    with pytest.raises(ValueError):
+        best_of([(0, 0), (0, 0)])
+
+def test_empty_page_raises():
+    with pytest.raises(ValueError):
+        CircuitsParser().calculate_score({})
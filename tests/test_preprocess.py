@@ -0,0 +1,61 @@
+"""
+Checks the streaming preprocessor against the saved output of the old
+BeautifulSoup preprocessing on the pages in tests/corpus.
+
+Each corpus/<name>.html has a corpus/<name>.json with the lines the
+old CatsoopRequests.preprocess_data returned for it (the page decoded
+as utf-8). The pages must come out the same whether they are given
+whole or in chunks of any size, as text or as bytes.
+"""
+
+from catsoop_grade_calculator.parsers import CatsoopRequests
+from catsoop_grade_calculator.parsers.preprocess import StreamingPreprocessor
+import json
+import os
+import pytest
+
+corpus_dir = os.path.join(os.path.dirname(__file__), 'corpus')
+pages = sorted(name[:-len('.html')] for name in os.listdir(corpus_dir)
+               if name.endswith('.html'))
+
+def load(name: str) -> tuple[bytes, list[str]]:
+    with open(os.path.join(corpus_dir, name + '.html'), 'rb') as f:
+        body = f.read()
+    with open(os.path.join(corpus_dir, name + '.json'), 'r', encoding='utf-8') as f:
+        expected = json.load(f)
+    return body, expected
+
+def feed_all(preprocessor: StreamingPreprocessor, chunks) -> list[str]:
+    lines = []
+    for chunk in chunks:
+        lines.extend(preprocessor.feed(chunk))
+    lines.extend(preprocessor.close())
+    return lines
+
+def split(data, size: int) -> list:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+@pytest.mark.parametrize('name', pages)
+def test_preprocess_data(name):
+    body, expected = load(name)
+    assert CatsoopRequests.preprocess_data(body.decode('utf-8')) == expected
+
+@pytest.mark.parametrize('name', pages)
+@pytest.mark.parametrize('size', [1, 2, 7, 64, 1 << 20])
+def test_text_chunks(name, size):
+    body, expected = load(name)
+    preprocessor = StreamingPreprocessor(CatsoopRequests.default_kept_strs)
+    assert feed_all(preprocessor, split(body.decode('utf-8'), size)) == expected
+
+@pytest.mark.parametrize('name', pages)
+@pytest.mark.parametrize('size', [1, 3, 64, 1 << 20])
+def test_byte_chunks(name, size):
+    # small sizes cut multi-byte characters (and \r\n) in half
+    body, expected = load(name)
+    preprocessor = StreamingPreprocessor(CatsoopRequests.default_kept_strs, 'utf-8')
+    assert feed_all(preprocessor, split(body, size)) == expected
+
+def test_preprocess_stream():
+    body, expected = load(pages[0])
+    assert list(CatsoopRequests.preprocess_stream(split(body, 100), encoding='utf-8')) \
+            == expected
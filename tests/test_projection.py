@@ -0,0 +1,75 @@
+"""
+Checks GradeProjector against calculate_score: projecting the current
+scores, or the current scores plus hypothetical ones, gives the grade
+calculate_score gives for the same assignments.
+"""
+
+import pytest
+np = pytest.importorskip('numpy')
+
+from benchmarks.fixtures import circuits_page, py_page
+from catsoop_grade_calculator.parsers import CatsoopRequests, CircuitsParser, PyParser
+from catsoop_grade_calculator.parsers.records import Assignment
+from catsoop_grade_calculator.projection import GradeProjector
+
+def cohort(parser, make_page, students: int = 5) -> list[dict]:
+    return [parser.parse_html(CatsoopRequests.preprocess_data(
+                make_page(rows=1 + seed % 4, seed=seed).decode('latin-1')))
+            for seed in range(students)]
+
+def percent(parser, score_data: dict) -> float:
+    earned, possible = parser.calculate_score(score_data)['best_score']
+    return 100 * earned / possible
+
+def with_added(score_data: dict, category: str, score: tuple, count: int) -> dict:
+    out = {key: list(records) for key, records in score_data.items()}
+    out.setdefault(category, []).extend(
+            Assignment(score, category, f"{category} {i}") for i in range(count))
+    return out
+
+settings = [{}, {'pset': False}, {'pset': False, 'lab': False, 'final': False}]
+
+@pytest.mark.parametrize('normalize_each', settings)
+@pytest.mark.parametrize('parser_class, make_page, category',
+                         [(CircuitsParser, circuits_page, 'final'),
+                          (CircuitsParser, circuits_page, 'pset'),
+                          (PyParser, py_page, 'lab')])
+def test_projection_matches_calculate_score(parser_class, make_page, category,
+                                            normalize_each):
+    parser = parser_class()
+    parser.normalize_each.update(normalize_each)
+    students = cohort(parser, make_page)
+    projector = GradeProjector(parser, students)
+
+    current = projector.project({})['percent']
+    assert current == pytest.approx([percent(parser, score_data)
+                                     for score_data in students], rel=1e-12)
+
+    values = [0.0, 3.5, 7.0]
+    grid = projector.project({category: values}, {category: 7.0}, {category: 2})['percent']
+    for student, score_data in enumerate(students):
+        expected = [percent(parser, with_added(score_data, category, (value, 7.0), 2))
+                    for value in values]
+        assert grid[student] == pytest.approx(expected, rel=1e-12)
+
+def test_minimum_needed_reaches_target():
+    parser = CircuitsParser()
+    parser.normalize_each['final'] = False
+    students = cohort(parser, circuits_page)
+    projector = GradeProjector(parser, students)
+    needed = projector.minimum_needed('final', [60.0], possible=50.0)[:, 0]
+    for score_data, score in zip(students, needed):
+        if np.isnan(score) or score == 0:
+            continue
+        reached = percent(parser, with_added(score_data, 'final', (score, 50.0), 1))
+        assert reached == pytest.approx(60.0, rel=1e-9)
+
+def test_drop_lowest_is_rejected():
+    parser = CircuitsParser()
+    parser.drop_lowest['nanoquiz'] = 2
+    with pytest.raises(ValueError, match='nanoquiz'):
+        GradeProjector(parser, cohort(parser, circuits_page))
+    # categories the parser doesn't grade don't matter
+    parser = CircuitsParser()
+    parser.drop_lowest['homework'] = 1
+    GradeProjector(parser, cohort(parser, circuits_page))
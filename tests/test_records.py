@@ -0,0 +1,83 @@
+"""
+Checks the assignment records of parsers/records.py: they read like the
+old assignment dictionaries, and category averages taken from them are
+the same floats as before, for less time per call.
+"""
+
+from benchmarks.fixtures import circuits_page, py_page
+from catsoop_grade_calculator.parsers import CatsoopRequests, CircuitsParser, PyParser
+from catsoop_grade_calculator.parsers.records import Assignment, CategoryColumns
+import random
+import timeit
+import pytest
+
+def old_average(category_data: list, normalize_each: bool = True) -> float:
+    # Parser.calculate_average_in_category before the records
+    total_earned, total_possible = 0, 0
+
+    def add_to_scores(score_pair: tuple[float]) -> None:
+        earned, possible = score_pair
+        if normalize_each:
+            earned = earned / possible
+            possible = 1
+        nonlocal total_earned, total_possible
+        total_earned += earned
+        total_possible += possible
+        return
+
+    for assignment in category_data:
+        add_to_scores(assignment['score'])
+
+    return total_earned / total_possible
+
+def parsed(parser, make_page, rows: int) -> dict:
+    return parser.parse_html(CatsoopRequests.preprocess_data(
+            make_page(rows=rows).decode('latin-1')))
+
+def test_assignment_reads_like_a_dict():
+    record = Assignment((1.0, 2.0), 'lab', 'Lab 1')
+    assert dict(record) == {'score': (1.0, 2.0), 'assignment_type': 'lab',
+                            'assignment_name': 'Lab 1'}
+    assert record.get('sub_assignment') is None
+    with pytest.raises(KeyError):
+        record['sub_assignment']
+    record = Assignment((1.0, 2.0), 'lab', 'Lab 1', 'checkoff')
+    assert record['sub_assignment'] == 'checkoff' and len(record) == 4
+
+@pytest.mark.parametrize('normalize_each', [True, False])
+def test_averages_match_old_code(normalize_each):
+    parser = PyParser()
+    r = random.Random(0)
+    for _ in range(200):
+        records = [Assignment((r.randint(0, 30) / r.choice([1, 3, 7]), r.randint(1, 30)),
+                              'lab', 'Lab')
+                   for _ in range(r.randint(1, 20))]
+        expected = old_average(records, normalize_each)
+        assert parser.calculate_average_in_category(records, normalize_each) == expected
+        assert parser.calculate_average_in_category([dict(record) for record in records],
+                                                    normalize_each) == expected
+        assert CategoryColumns.from_assignments(records).average(normalize_each) == expected
+
+def test_calculate_score_builds_no_columns(monkeypatch):
+    built = []
+    old_init = CategoryColumns.__init__
+    def counting(self, *args):
+        built.append(args)
+        old_init(self, *args)
+    monkeypatch.setattr(CategoryColumns, '__init__', counting)
+    for parser, make_page in ((CircuitsParser(), circuits_page), (PyParser(), py_page)):
+        parser.calculate_score(parsed(parser, make_page, 20))
+    assert built == []
+
+def test_average_is_faster_than_old_code():
+    parser = PyParser()
+    score_data = parsed(parser, py_page, 1000)
+    def old():
+        for category_data in score_data.values():
+            old_average(category_data)
+    def new():
+        for category_data in score_data.values():
+            parser.calculate_average_in_category(category_data)
+    old_time = min(timeit.repeat(old, number=5, repeat=5))
+    new_time = min(timeit.repeat(new, number=5, repeat=5))
+    assert new_time < old_time
@@ -0,0 +1,104 @@
+"""
+Checks ReportWriter: each format writes what the summary of a grade
+says, errors are reported in place of a grade, and reports are written
+as they are given.
+"""
+
+from catsoop_grade_calculator import BatchCalculator, ScoreCalculator
+from catsoop_grade_calculator.report import ReportWriter, out_score_from_json, summarize
+import csv
+import io
+import json
+import pytest
+
+out_score = {'best_score': (45.678, 60.0),
+             'alt_scores': ((40.0, 60.0), (50.0, 60.0)),
+             'by_category': {'pset': 0.9, 'lab': 0.81234}}
+
+def test_summarize(stand_in):
+    summary = summarize('6.200', out_score)
+    assert summary == {'class_code': '6.200', 'percent': 76.13, 'earned': 45.68,
+                       'possible': 60.0, 'alt_percents': [83.33, 66.67],
+                       'categories': [('lab', 81.23), ('pset', 90.0)],
+                       'url': stand_in.url('6.200')}
+
+def test_text(stand_in):
+    sink = io.StringIO()
+    ReportWriter(sink).write('6.200', out_score, student_id='a')
+    assert sink.getvalue() == '\n'.join([
+            "STUDENT: a",
+            "==================================",
+            "GRADE REPORT FOR 6.200: ",
+            "==================================",
+            "OVERALL GRADE: ..........76.13%",
+            "....Points collected: ...45.68",
+            "....Points possible: ....60.0",
+            "ALTERNATIVE SCORE(S):",
+            "....83.33%",
+            "....66.67%",
+            "CATEGORY BREAKDOWN:",
+            "....lab...81.23%",
+            "....pset..90.0%",
+            stand_in.url('6.200'), ""])
+    assert sink.getvalue().split('\n', 1)[1] == \
+            ScoreCalculator({}).generate_full_report('6.200', out_score) + '\n'
+
+def test_text_error():
+    sink = io.StringIO()
+    ReportWriter(sink).write('6.200', None, error='HTTPError: 404')
+    assert sink.getvalue().splitlines()[1:] == ["GRADE REPORT FOR 6.200: ",
+                                                "==================================",
+                                                "ERROR: HTTPError: 404"]
+
+def test_jsonl(stand_in):
+    sink = io.StringIO()
+    writer = ReportWriter(sink, 'jsonl')
+    writer.write('6.200', out_score, student_id='a', row=3)
+    writer.write('6.101', None, student_id='b', error='boom')
+    first, second = [json.loads(line) for line in sink.getvalue().splitlines()]
+    assert first['row'] == 3 and first['error'] is None
+    assert first['percent'] == 76.13 and first['alt_percents'] == [83.33, 66.67]
+    assert first['categories'] == {'lab': 81.23, 'pset': 90.0}
+    assert second == {'student_id': 'b', 'class_code': '6.101', 'error': 'boom'}
+    assert writer.count == 2
+
+def test_csv():
+    sink = io.StringIO()
+    writer = ReportWriter(sink, 'csv')
+    writer.write('6.200', out_score, student_id='a')
+    writer.write('6.101', None, student_id='b', error='boom')
+    rows = list(csv.reader(io.StringIO(sink.getvalue())))
+    assert rows == [list(ReportWriter.csv_columns),
+                    ['a', '6.200', 'overall', '', '76.13', ''],
+                    ['a', '6.200', 'alternative', '1', '83.33', ''],
+                    ['a', '6.200', 'alternative', '2', '66.67', ''],
+                    ['a', '6.200', 'category', 'lab', '81.23', ''],
+                    ['a', '6.200', 'category', 'pset', '90.0', ''],
+                    ['b', '6.101', 'error', '', '', 'boom']]
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        ReportWriter(io.StringIO(), 'xml')
+
+def test_out_score_from_json():
+    assert out_score_from_json(json.loads(json.dumps(out_score))) == out_score
+
+class Sink():
+    # remembers how many results had been taken when each write came
+    def __init__(self, taken: list) -> None:
+        self.taken = taken
+        self.writes = []
+
+    def write(self, text: str) -> None:
+        self.writes.append(len(self.taken))
+
+def test_results_are_written_as_they_come(stand_in):
+    taken = []
+    def results():
+        for result in BatchCalculator(2).grade([(f"s{i}", '6.200', str(i % 3))
+                                                 for i in range(5)]):
+            taken.append(result)
+            yield result
+    sink = Sink(taken)
+    assert ReportWriter(sink, 'jsonl').write_results(results()) == 5
+    assert sink.writes == [1, 2, 3, 4, 5]
@@ -0,0 +1,79 @@
+"""
+Checks rosters and sharding: the three roster formats, shards that
+split a roster without overlap (also for records without a student
+id), merging the shards' reports back into roster order, and the
+command line options that only make sense with or without --roster.
+"""
+
+from catsoop_grade_calculator import cli
+from catsoop_grade_calculator.roster import (merge_shards, parse_shard, read_roster,
+                                             shard_of, take_shard)
+import io
+import json
+import pytest
+
+def test_formats(tmp_path):
+    expected = [('a', '6.200', 't1'), (None, '6.101', 't2')]
+    (tmp_path / 'r.txt').write_text('a 6.200 t1\n\n6.101 t2\n')
+    (tmp_path / 'r.csv').write_text('student_id,class_code,token\na,6.200,t1\n,6.101,t2\n')
+    (tmp_path / 'r.jsonl').write_text(
+            '{"student_id": "a", "class_code": "6.200", "token": "t1"}\n'
+            '{"class_code": "6.101", "token": "t2"}\n')
+    for name in ('r.txt', 'r.csv', 'r.jsonl'):
+        assert list(read_roster(str(tmp_path / name))) == expected
+    (tmp_path / 'bad.txt').write_text('a b c d\n')
+    with pytest.raises(ValueError):
+        list(read_roster(str(tmp_path / 'bad.txt')))
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (1, 4)
+    for text in ('0/4', '5/4', 'x', '1/2/3'):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+def test_shards_partition_the_roster():
+    records = [(f"s{i}" if i % 3 else None, ('6.200', '6.101')[i % 2], f"t{i}")
+               for i in range(300)]
+    shards = [list(take_shard(records, index, 4)) for index in range(4)]
+    rows = sorted(row for shard in shards for row, _ in shard)
+    assert rows == list(range(len(records)))
+    for shard in shards:
+        assert all(records[row] == record for row, record in shard)
+    # records without a student id spread out too
+    id_less = [shard_of(None, '6.200', 4, f"t{i}") for i in range(100)]
+    assert len(set(id_less)) == 4
+    assert shard_of('s1', '6.200', 4, 'x') == shard_of('s1', '6.200', 4, 'y')
+
+def test_merge_restores_roster_order():
+    shards = [[{'row': 0}, {'row': 3}, {'row': 4}], [{'row': 1}, {'row': 2}, {'row': 5}]]
+    files = [io.StringIO(''.join(json.dumps(record) + '\n\n' for record in shard))
+             for shard in shards]
+    assert [record['row'] for record in merge_shards(files)] == list(range(6))
+
+def test_sharded_run_merges_back(stand_in, tmp_path):
+    roster = tmp_path / 'roster.txt'
+    roster.write_text('a 6.200 0\n6.200 1\n6.200 2\nb 6.101 0\n6.101 1\nc 6.101 2\n')
+    outputs = []
+    for index in (1, 2, 3):
+        outputs.append(str(tmp_path / f"{index}.jsonl"))
+        assert cli.main(['--roster', str(roster), '--shard', f"{index}/3",
+                         '--format', 'jsonl', '--output', outputs[-1]]) == 0
+    merged = str(tmp_path / 'all.jsonl')
+    assert cli.main(['--merge', *outputs, '--output', merged]) == 0
+    with open(merged) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['row'] for record in records] == list(range(6))
+    assert stand_in.count() == 6
+
+@pytest.mark.parametrize('argv', [
+        ['--shard', '1/2'], ['--workers', '4'], ['--checkpoint', 'run.log'],
+        ['--roster-format', 'csv'],
+        ['--roster', 'r.txt', '--class', '6.200'], ['--roster', 'r.txt', '--concurrent'],
+        ['--roster', 'r.txt', '--student', 'me'], ['--roster', 'r.txt', '--watch'],
+        ['--roster', 'r.txt', '--serve'], ['--watch', '--serve'],
+        ['--merge', '1.jsonl', '--roster', 'r.txt']])
+def test_options_that_would_be_ignored_are_rejected(argv, capsys):
+    with pytest.raises(SystemExit) as exit:
+        cli.main(argv)
+    assert exit.value.code == 2
+    assert 'error' in capsys.readouterr().err
@@ -0,0 +1,113 @@
+"""
+Checks the request scheduler: the token bucket, the AIMD concurrency
+cap, and retries of failed requests (with Retry-After) against the
+stand-in host.
+"""
+
+from catsoop_grade_calculator.parsers import CatsoopRequests
+from catsoop_grade_calculator.parsers.scheduler import HostLimiter, RequestScheduler
+from email.utils import formatdate
+import socket
+import threading
+import time
+import requests
+import pytest
+
+def test_token_bucket():
+    limiter = HostLimiter(rate=10.0, burst=2.0)
+    with limiter.condition:
+        waits = [limiter.take_token() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+    # tokens come back at `rate` per second, up to `burst`
+    limiter = HostLimiter(rate=1000.0, burst=2.0)
+    with limiter.condition:
+        limiter.take_token(), limiter.take_token()
+    time.sleep(0.05)
+    with limiter.condition:
+        assert limiter.take_token() == 0.0
+        assert limiter.tokens <= 1.0
+
+def test_aimd():
+    limiter = HostLimiter(initial_concurrency=4.0, max_concurrency=6.0, slow_latency=1.0)
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(0.01, True)
+    assert 4.9 < limiter.concurrency < 5.0
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(0.01, True)
+    assert limiter.concurrency == 6.0
+    # failures within one round trip halve the cap only once
+    limiter.latency = 10.0
+    limiter.last_decrease = 0.0
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.01, False)
+    assert limiter.concurrency == 3.0
+    # so does a slow success, once the round trip is over
+    limiter.last_decrease = 0.0
+    limiter.acquire()
+    limiter.release(2.0, True)
+    assert limiter.concurrency == 1.5
+    assert limiter.stats()['errors'] == 3 and limiter.stats()['requests'] == 28
+
+def test_concurrency_cap():
+    limiter = HostLimiter(rate=1e9, burst=1e9, initial_concurrency=2.0, max_concurrency=2.0)
+    peak = []
+    def work():
+        limiter.acquire()
+        with limiter.condition:
+            peak.append(limiter.active)
+        time.sleep(0.01)
+        limiter.release(0.01, True)
+    threads = [threading.Thread(target=work) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2 and limiter.active == 0
+
+def test_parse_retry_after():
+    assert RequestScheduler.parse_retry_after('3') == 3.0
+    assert RequestScheduler.parse_retry_after('-1') == 0.0
+    assert RequestScheduler.parse_retry_after(None) is None
+    assert RequestScheduler.parse_retry_after('soon') is None
+    later = RequestScheduler.parse_retry_after(formatdate(time.time() + 30, usegmt=True))
+    assert 25 < later <= 30
+
+def test_retries_until_success(stand_in):
+    stand_in.statuses.extend([(503, {}), (500, {}), (429, {'Retry-After': '0.05'})])
+    start = time.monotonic()
+    response = CatsoopRequests.request_data('0', class_code='6.200')
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.05
+    stats = CatsoopRequests.scheduler.stats()
+    assert stats['total']['requests'] == 4 and stats['total']['retries'] == 3
+    assert stats['total']['backoff_seconds'] >= 0.05
+
+def test_gives_up_after_max_retries(stand_in):
+    CatsoopRequests.scheduler.max_retries = 2
+    stand_in.statuses.extend([(503, {})] * 4)
+    with pytest.raises(requests.HTTPError):
+        CatsoopRequests.request_data('0', class_code='6.200')
+    assert stand_in.count() == 3
+    # errors that aren't worth retrying come back at once
+    stand_in.statuses[:] = [(404, {})]
+    with pytest.raises(requests.HTTPError):
+        CatsoopRequests.request_data('0', class_code='6.200')
+    assert stand_in.count() == 4
+
+def test_connection_errors_are_retried():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        host, port = s.getsockname()
+    # nothing listens on the port any more
+    url = f"http://{host}:{port}/6.200/progress"
+    scheduler = RequestScheduler(max_retries=2, base_delay=0.001)
+    session = requests.Session()
+    with pytest.raises(requests.ConnectionError):
+        scheduler.get(session, f"{host}:{port}", url, timeout=1)
+    stats = scheduler.stats()[f"{host}:{port}"]
+    assert stats['requests'] == 3 and stats['errors'] == 3 and stats['retries'] == 2
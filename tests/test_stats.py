@@ -0,0 +1,65 @@
+"""
+Checks the streaming statistics of stats.py against computing them
+from every value, including after merging partial aggregates, and that
+grades with nothing possible yet are counted apart.
+"""
+
+from catsoop_grade_calculator.stats import CohortStats, HistogramSketch, RunningMoments
+import json
+import random
+import statistics
+import pytest
+
+def out_score(earned: float, possible: float, **by_category) -> dict:
+    return {'best_score': (earned, possible), 'alt_scores': (), 'by_category': by_category}
+
+def test_moments_match_statistics():
+    r = random.Random(0)
+    values = [r.uniform(0, 100) for _ in range(1000)]
+    parts = [RunningMoments() for _ in range(3)]
+    for i, value in enumerate(values):
+        parts[i % 3].add(value)
+    moments = RunningMoments()
+    for part in parts:
+        moments.merge(part)
+    assert moments.count == len(values)
+    assert moments.mean == pytest.approx(statistics.fmean(values), rel=1e-12)
+    assert moments.variance() == pytest.approx(statistics.pvariance(values), rel=1e-9)
+    assert moments.variance(1) == pytest.approx(statistics.variance(values), rel=1e-9)
+    assert (moments.min, moments.max) == (min(values), max(values))
+
+def test_sketch_quantiles_within_a_bin():
+    r = random.Random(1)
+    values = sorted(r.uniform(0, 100) for _ in range(999))
+    sketch = HistogramSketch(0.5)
+    for value in values:
+        sketch.add(value)
+    for q, got in zip((0.1, 0.5, 0.9), sketch.quantiles([0.1, 0.5, 0.9])):
+        assert abs(got - values[round(q * len(values)) - 1]) <= 0.5
+
+def test_empty_scores_are_skipped():
+    cohort = CohortStats()
+    cohort.add('6.200', out_score(0, 0))
+    cohort.add('6.200', out_score(8, 10, lab=0.9))
+    cohort.add_result({'class_code': '6.101', 'out_score': out_score(0.0, 0.0), 'error': None})
+    assert cohort.skipped == {'6.200': 1, '6.101': 1}
+    summary = cohort.summary()
+    assert summary['6.200']['best_score']['count'] == 1
+    assert summary['6.200']['lab']['mean'] == pytest.approx(90)
+    assert '6.101' not in summary
+
+def test_merge_and_round_trip():
+    r = random.Random(2)
+    whole, parts = CohortStats(), [CohortStats(), CohortStats()]
+    for i in range(200):
+        possible = 0 if i % 17 == 0 else 10
+        score = out_score(r.uniform(0, possible), possible, lab=r.random())
+        whole.add('6.200', score)
+        parts[i % 2].add('6.200', score)
+    merged = CohortStats.from_dict(json.loads(json.dumps(parts[0].to_dict())))
+    merged.merge(parts[1])
+    assert merged.skipped == whole.skipped == {'6.200': 12}
+    got, expected = merged.summary()['6.200'], whole.summary()['6.200']
+    for name in expected:
+        for key, value in expected[name].items():
+            assert got[name][key] == pytest.approx(value, rel=1e-9)
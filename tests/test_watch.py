@@ -0,0 +1,97 @@
+"""
+Checks GradeWatcher: change events say what changed between polls,
+polling intervals back off and reset as they should, and deadlines
+pull polls in.
+"""
+
+from benchmarks.fixtures import circuits_page
+from catsoop_grade_calculator.watch import GradeWatcher, diff_records
+from typing import Optional
+import threading
+import pytest
+
+def lab(name: str, earned: float, sub: Optional[str] = None) -> dict:
+    record = {'score': (earned, 10.0), 'assignment_type': 'lab', 'assignment_name': name}
+    if sub is not None:
+        record['sub_assignment'] = sub
+    return record
+
+def test_diff_records():
+    old = {'lab': [lab('Lab 1', 5), lab('Lab 1', 6), lab('Lab 2', 7), lab('Lab 3', 1, 'checkoff')]}
+    assert diff_records(old, old) == {'added': [], 'removed': [], 'changed': []}
+    new = {'lab': [lab('Lab 1', 5), lab('Lab 1', 9), lab('Lab 3', 1), lab('Lab 4', 2)]}
+    diff = diff_records(old, new)
+    # repeated names are matched in page order; sub-assignments are part of the key
+    assert diff['changed'] == [{'assignment': lab('Lab 1', 9), 'old_score': (6, 10.0),
+                                'new_score': (9, 10.0)}]
+    assert diff['added'] == [lab('Lab 3', 1), lab('Lab 4', 2)]
+    assert diff['removed'] == [lab('Lab 2', 7), lab('Lab 3', 1, 'checkoff')]
+
+def test_events_only_on_change(stand_in):
+    watcher = GradeWatcher(min_interval=10, max_interval=100)
+    events = []
+    watcher.add_listener(events.append)
+    watcher.watch('a', '6.200', '0', now=0)
+    assert watcher.poll_due(now=0) == [] and events == []
+    page = watcher.pages[('a', '6.200')]
+    assert watcher.poll(page, now=20) is None
+    stand_in.pages['6.200']['0'] = circuits_page(rows=6, seed=0)
+    event = watcher.poll(page, now=40)
+    assert events == [event]
+    assert event['student_id'] == 'a' and event['time'] == 40
+    assert event['added'] and not event['removed']
+    assert event['out_score'] != event['previous_out_score']
+    assert watcher.stats() == {'polls': 3, 'changes': 1, 'errors': 0, 'pages': 1}
+
+def test_errors_keep_polling(stand_in):
+    watcher = GradeWatcher(min_interval=10)
+    watcher.watch('a', '6.200', 'missing', now=0)
+    assert watcher.poll_due(now=0) == []
+    assert watcher.stats()['errors'] == 1
+    assert 18 <= watcher.pages[('a', '6.200')].next_poll <= 22
+
+def test_intervals_back_off_and_reset(stand_in):
+    watcher = GradeWatcher(min_interval=10, max_interval=50, backoff=2.0)
+    watcher.watch('a', '6.200', '0', now=0)
+    page = watcher.pages[('a', '6.200')]
+    intervals = []
+    for _ in range(4):
+        watcher.next_poll(page, False, 0)
+        intervals.append(page.interval)
+    assert intervals == [20, 40, 50, 50]
+    when = watcher.next_poll(page, True, 100)
+    assert page.interval == 10 and 109 <= when <= 111
+
+def test_deadlines_pull_polls_in():
+    watcher = GradeWatcher(min_interval=10, max_interval=1000, deadlines={'6.200': [500]},
+                           deadline_window=100, deadline_interval=5)
+    watcher.watch('a', '6.200', '0', now=0)
+    watcher.watch('a', '6.101', '0', now=0)
+    page, other = watcher.pages[('a', '6.200')], watcher.pages[('a', '6.101')]
+    page.interval = other.interval = 1000
+    # the next poll comes when the window opens, not after the interval
+    assert watcher.next_poll(page, False, 0) == 400
+    assert watcher.next_poll(other, False, 0) >= 900
+    # within the window, at least every deadline_interval
+    assert watcher.next_poll(page, False, 450) == 455
+    assert watcher.next_poll(page, False, 601) > 1000
+
+def test_unwatched_pages_are_skipped():
+    watcher = GradeWatcher()
+    watcher.watch('a', '6.200', '0', now=0)
+    watcher.watch('b', '6.200', '1', now=5)
+    watcher.unwatch('a', '6.200')
+    assert [page.student_id for page in watcher.due(now=10)] == ['b']
+    assert watcher.due(now=10) == []
+
+def test_run_until_stopped(stand_in):
+    watcher = GradeWatcher(min_interval=0.05, max_interval=0.05)
+    polled = threading.Event()
+    watcher.calculator.add_hook(lambda event: polled.set())
+    watcher.watch('a', '6.101', '0')
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    assert polled.wait(5)
+    watcher.stop()
+    thread.join(5)
+    assert not thread.is_alive() and watcher.stats()['polls'] >= 1